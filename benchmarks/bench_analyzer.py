@@ -0,0 +1,116 @@
+"""
+analyze_df の集計エンジンと、従来実装（groupby 2回 + outer merge）の処理時間を比較するベンチマーク。
+分位点（p50/p95/p99）は全行を保持して groupby.quantile で求めた正確な値と比較し、最大の相対誤差を表示する。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_analyzer --rows 1000000 10000000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from loganalyzer.analyzer import analyze_df
+
+
+def analyze_df_reference(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    比較用の従来実装（groupby 2回 + outer merge、object型のdate列）
+
+    :param df: パース済みのログデータ
+    :return: 分析・集計後のデータ
+    """
+
+    df = df.assign(date=df['timestamp'].dt.date)
+    leveled_df = df.groupby(['server_name', 'date', 'level']).size().unstack(fill_value=0)
+    usage_age_daily = df.groupby(['server_name', 'date']).agg(
+        cpu_avg=('cpu_usage', 'mean'),
+        memory_avg=('memory_usage', 'mean')
+    )
+    return pd.merge(
+        leveled_df.reset_index(),
+        usage_age_daily.reset_index(),
+        on=['server_name', 'date'],
+        how='outer')
+
+
+def percentiles_reference(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    比較用の正確な分位点（全行を保持してgroupby.quantileで算出、欠損値は除外）
+
+    :param df: パース済みのログデータ
+    :return: server_name, dateをインデックスとし、cpu_p50などの列を持つデータ
+    """
+
+    grouped = df.groupby(['server_name', df['timestamp'].dt.date])
+    columns = {}
+    for name in ['cpu', 'memory']:
+        quantiles = grouped[f'{name}_usage'].quantile([0.5, 0.95, 0.99], interpolation='lower').unstack()
+        for q in quantiles.columns:
+            columns[f'{name}_p{round(q * 100)}'] = quantiles[q]
+    return pd.DataFrame(columns).rename_axis(['server_name', 'date'])
+
+
+def make_parsed_df(rows: int, servers: int = 300, days: int = 30, seed: int = 0) -> pd.DataFrame:
+    """
+    parse_all後と同じ列・型の合成データを作成する
+
+    :param rows: 行数
+    :param servers: サーバー数
+    :param days: 日数
+    :param seed: 乱数シード
+    :return: パース済みログデータ相当のDataFrame
+    """
+
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2026-02-01T00:00:00', 's')
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(start + rng.integers(0, days * 86400, rows).astype('timedelta64[s]')),
+        'server_name': pd.Series([f'srv{i}' for i in range(servers)]).take(rng.integers(0, servers, rows)).to_numpy(),
+        'level': np.array(['INFO', 'WARNING', 'ERROR'], dtype=object)[rng.integers(0, 3, rows)],
+        'cpu_usage': rng.integers(0, 101, rows),
+        'memory_usage': rng.integers(0, 101, rows),
+        'message': 'Routine check OK',
+    }).astype({'server_name': 'str', 'level': 'str', 'message': 'str'})
+
+
+def best_of(func, df: pd.DataFrame, repeat: int) -> (float, pd.DataFrame):
+    """
+    :param func: 計測対象の関数
+    :param df: 入力データ
+    :param repeat: 計測回数
+    :return: 最短処理時間（秒）と処理結果
+    """
+
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument('--servers', type=int, default=300)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"rows":>12} {"reference(s)":>13} {"analyze_df(s)":>14} {"speedup":>8} {"quantile(s)":>12} {"max error":>10}')
+    for rows in args.rows:
+        df = make_parsed_df(rows, args.servers, args.days)
+        reference_time, expected = best_of(analyze_df_reference, df, args.repeat)
+        engine_time, result = best_of(analyze_df, df, args.repeat)
+        # 従来実装に無い分位点・最大値の列は正確な分位点と比較する
+        pd.testing.assert_frame_equal(result[expected.columns], expected)
+        quantile_time, exact = best_of(percentiles_reference, df, 1)
+        estimated = result.set_index(['server_name', 'date'])[exact.columns].loc[exact.index]
+        error = ((estimated - exact).abs() / exact.where(exact > 0)).max().max()
+        print(f'{rows:>12,} {reference_time:>13.3f} {engine_time:>14.3f} {reference_time / engine_time:>7.1f}x '
+              f'{quantile_time:>12.3f} {error:>9.2%}')
+
+
+if __name__ == '__main__':
+    main()
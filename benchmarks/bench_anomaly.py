@@ -0,0 +1,84 @@
+"""
+異常傾向分析（loganalyzer.anomaly.detect_anomalies）の処理時間を、サーバー数×日数を変えて計測するベンチマーク。
+比較として、サーバーごとに rolling を計算する（サーバー単位のループ）場合の時間も計測する。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_anomaly --servers 100 1000 5000 --days 365
+"""
+import argparse
+import logging
+import time
+import numpy as np
+import pandas as pd
+from loganalyzer.anomaly import detect_anomalies
+
+# サーバー単位のループの比較はこのサーバー数までとする（時間がかかるため）
+LOOP_SERVER_LIMIT = 1000
+
+def make_daily(servers: int, days: int, seed: int = 0) -> pd.DataFrame:
+    """
+    analyze_df の結果と同じ形式の日別集計を生成する（使用率・エラー件数は乱数、一部に異常値を含む）
+
+    :param servers: サーバー数
+    :param days: 日数
+    :param seed: 乱数のシード
+    :return: サーバー別・日別の集計結果
+    """
+
+    rng = np.random.default_rng(seed)
+    n = servers * days
+    df = pd.DataFrame({
+        'server_name': np.repeat([f'srv{i:05d}' for i in range(servers)], days),
+        'date': np.tile(pd.date_range('2026-01-01', periods=days).date, servers),
+        'ERROR': rng.poisson(3, n),
+        'cpu_avg': rng.normal(40, 5, n),
+        'memory_avg': rng.normal(60, 4, n),
+    })
+    spikes = rng.choice(n, size=max(n // 1000, 1), replace=False)
+    df.loc[spikes, 'cpu_avg'] += 40
+    return df
+
+
+def rolling_per_server(df: pd.DataFrame, window: int = 7, min_periods: int = 3) -> pd.DataFrame:
+    """
+    比較用：サーバーごとにループして前日までの rolling z-score を計算する
+
+    :param df: 日別集計
+    :return: cpu / memory / ERROR の z-score
+    """
+
+    parts = []
+    for _, df_by_server in df.groupby('server_name', sort=False):
+        values = df_by_server[['cpu_avg', 'memory_avg', 'ERROR']].astype('float64')
+        rolling = values.rolling(window, min_periods=min_periods)
+        parts.append((values - rolling.mean().shift(1)) / rolling.std().shift(1).clip(lower=1.0))
+    return pd.concat(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    print(f'{"servers":>8} {"rows":>10} {"zscore(s)":>10} {"ewma(s)":>8} {"loop(s)":>8} {"anomalies":>10}')
+    for servers in args.servers:
+        df = make_daily(servers, args.days)
+        start = time.perf_counter()
+        detected = detect_anomalies(df, method='zscore')
+        zscore_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        detect_anomalies(df, method='ewma')
+        ewma_seconds = time.perf_counter() - start
+        loop = '-'
+        if servers <= LOOP_SERVER_LIMIT:
+            start = time.perf_counter()
+            rolling_per_server(df)
+            loop = f'{time.perf_counter() - start:.2f}'
+        print(f'{servers:>8} {len(df):>10,} {zscore_seconds:>10.2f} {ewma_seconds:>8.2f} {loop:>8} '
+              f'{int(detected["anomaly"].sum()):>10,}')
+
+
+if __name__ == '__main__':
+    main()
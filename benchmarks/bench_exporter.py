@@ -0,0 +1,69 @@
+"""
+export_result の出力モードと、従来実装（サーバーごとに to_excel、行ごとの strftime）の処理時間を比較するベンチマーク。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_exporter --servers 300 --days 30 --workers 4
+"""
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+from benchmarks.bench_analyzer import make_parsed_df
+from loganalyzer.analyzer import analyze_df
+from loganalyzer.exporter import export_result
+
+
+def export_reference(df: pd.DataFrame, output_dir: Path):
+    """
+    比較用の従来実装（サーバーごとにto_excel、行ごとのstrftime）
+
+    :param df: 解析済みデータ
+    :param output_dir: 出力先のディレクトリのパス
+    :return: なし
+    """
+
+    df_copy = df.copy()
+    df_copy['date'] = df_copy['date'].apply(lambda x: x.strftime('%Y-%m-%d'))
+    for server_name, df_by_server in df_copy.groupby('server_name'):
+        df_by_server.to_excel(output_dir / f'{server_name}.xlsx', index=False, sheet_name=str(server_name), header=True)
+
+
+def timed(func, *args, **kwargs) -> float:
+    """
+    :param func: 計測対象の関数
+    :return: 処理時間（秒）
+    """
+
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', type=int, default=300)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    analyzed_df = analyze_df(make_parsed_df(args.servers * args.days * 50, args.servers, args.days))
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        cases = [
+            ('reference (to_excel per server)', lambda d: export_reference(analyzed_df, d)),
+            ('files', lambda d: export_result(analyzed_df, d)),
+            (f'files, workers={args.workers}', lambda d: export_result(analyzed_df, d, workers=args.workers)),
+            ('workbook', lambda d: export_result(analyzed_df, d, mode='workbook')),
+        ]
+        print(f'{len(analyzed_df):,} rows, {args.servers} servers')
+        for i, (name, func) in enumerate(cases):
+            output_dir = tmp / str(i)
+            output_dir.mkdir()
+            print(f'{name:>32}: {timed(func, output_dir):.3f}s')
+
+
+if __name__ == '__main__':
+    main()
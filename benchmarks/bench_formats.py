@@ -0,0 +1,112 @@
+"""
+ログファイルの形式・圧縮形式ごとの読込時間（loganalyzer.loader.read_log_file）とファイルサイズを比較するベンチマーク。
+JSON Linesについては、pd.read_json(lines=True)との比較と、デコーダー（pyarrow / orjson / json）ごとの比較も行う。
+いずれもクレンジング・集計結果が非圧縮のCSVと一致することを確認する。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_formats --servers 100 --days 30 --rows-per-day 100
+"""
+import argparse
+import bz2
+import gzip
+import logging
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+from benchmarks.generate_logs import make_logs
+from loganalyzer import loader
+from loganalyzer.analyzer import analyze_df
+from loganalyzer.loader import read_log_file
+from loganalyzer.parser import parse_one
+
+
+def write_compressed(file: Path, data: bytes):
+    """
+    拡張子に応じて圧縮して書き込む
+
+    :param file: 出力先のパス（.gz、.bz2、.zstの場合は圧縮する）
+    :param data: 書き込むデータ
+    :return: なし
+    """
+
+    if file.suffix == '.gz':
+        file.write_bytes(gzip.compress(data, compresslevel=6))
+    elif file.suffix == '.bz2':
+        file.write_bytes(bz2.compress(data))
+    elif file.suffix == '.zst':
+        with pa.output_stream(str(file), compression='zstd') as stream:
+            stream.write(data)
+    else:
+        file.write_bytes(data)
+
+
+def best_of(func, repeat: int) -> (float, pd.DataFrame):
+    """
+    :param func: 計測対象の関数
+    :param repeat: 計測回数
+    :return: 最短処理時間（秒）と処理結果
+    """
+
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', type=int, default=100)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--rows-per-day', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    raw_df = make_logs(servers=args.servers, days=args.days, rows_per_day=args.rows_per_day)
+    csv_bytes = raw_df.to_csv(index=False).encode()
+    jsonl_bytes = raw_df.to_json(orient='records', lines=True).encode()
+    json_bytes = raw_df.to_json(orient='records').encode()
+    rows = len(raw_df)
+    print(f'{rows:,} rows')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(tmp_dir)
+        files = {}
+        for name, data in (('log.csv', csv_bytes), ('log.json', json_bytes), ('log.jsonl', jsonl_bytes)):
+            for suffix in ('', '.gz', '.bz2', '.zst'):
+                if name == 'log.json' and suffix:
+                    continue
+                files[name + suffix] = data_dir / (name + suffix)
+                write_compressed(files[name + suffix], data)
+
+        expected = analyze_df(parse_one(read_log_file(files['log.csv']), files['log.csv']))
+        print(f'{"file":>14} {"MB":>7} {"seconds":>8} {"rows/s":>11}')
+        for name, file in files.items():
+            seconds, df = best_of(lambda: read_log_file(file), args.repeat)
+            pd.testing.assert_frame_equal(analyze_df(parse_one(df, file)), expected, check_dtype=False)
+            print(f'{name:>14} {file.stat().st_size / 1e6:>7.2f} {seconds:>8.3f} {rows / seconds:>11,.0f}')
+
+        print('JSON Lines decoders (log.jsonl.gz):')
+        file = files['log.jsonl.gz']
+        seconds, _ = best_of(lambda: pd.read_json(file, lines=True), args.repeat)
+        print(f'{"pd.read_json(lines=True)":>26} {seconds:>8.3f}s')
+        # pyarrow → orjson → 標準ライブラリのjsonの順に、使用するデコーダーを切り替えて計測する
+        for decoder, pyarrow_available, orjson_available in (
+                ('pyarrow', loader.PYARROW_AVAILABLE, loader.ORJSON_AVAILABLE),
+                ('orjson', False, loader.ORJSON_AVAILABLE),
+                ('json', False, False)):
+            if decoder == 'pyarrow' and not pyarrow_available or decoder == 'orjson' and not orjson_available:
+                continue
+            loader.PYARROW_AVAILABLE, loader.ORJSON_AVAILABLE = pyarrow_available, orjson_available
+            seconds, df = best_of(lambda: read_log_file(file), args.repeat)
+            pd.testing.assert_frame_equal(analyze_df(parse_one(df, file)), expected, check_dtype=False)
+            print(f'{f"read_log_file ({decoder})":>26} {seconds:>8.3f}s')
+
+
+if __name__ == '__main__':
+    main()
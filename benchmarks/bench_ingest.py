@@ -0,0 +1,48 @@
+"""
+取込サーバー（loganalyzer.ingest）のスループット（件/秒）をプロトコル・送信形式ごとに計測するベンチマーク。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_ingest --records 100000 --batch-size 5000
+"""
+import argparse
+import asyncio
+import logging
+from benchmarks.generate_logs import make_logs
+from loganalyzer.ingest import IngestServer, send_records
+
+
+async def measure(records, protocol: str, fmt: str, batch_size: int) -> (dict, dict):
+    """
+    取込サーバーを起動し、ローカルのクライアントから全レコードを送信して集計完了まで待つ
+
+    :return: クライアント側の送信結果と、サーバー側の取込件数・スループット
+    """
+
+    server = IngestServer(protocol=protocol)
+    await server.start()
+    sent = await asyncio.to_thread(send_records, server.host, server.port, records, protocol, fmt, batch_size)
+    await server.stop()
+    return sent, server.stats.to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=100_000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    servers = 100
+    rows_per_day = max(args.records // (servers * 10), 1)
+    records = make_logs(servers=servers, days=10, rows_per_day=rows_per_day, garbage_ratio=0.01)
+    print(f'{len(records):,} records, {args.batch_size:,} records per request')
+    print(f'{"protocol":>9} {"format":>7} {"send(rec/s)":>12} {"ingest(rec/s)":>14} {"parse(rec/s)":>13} {"accepted":>9}')
+    for protocol in ('http', 'tcp'):
+        for fmt in ('json', 'csv'):
+            sent, stats = asyncio.run(measure(records, protocol, fmt, args.batch_size))
+            print(f'{protocol:>9} {fmt:>7} {sent["records_per_second"]:>12,.0f} {stats["records_per_second"]:>14,.0f} '
+                  f'{stats["parse_records_per_second"]:>13,.0f} {stats["accepted"]:>9,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+クレンジング済みログのメモリ量を、従来の結合（parse_all）と省メモリ形式（parse_all(compact=True)）で比較するベンチマーク。
+列ごとのメモリ量、ディスク上の CSV の合計サイズ、parse_all・analyze_df の処理時間を表示し、集計結果が一致することを確認する。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_memory --servers 300 --days 30 --rows-per-day 100
+"""
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+from benchmarks.generate_logs import make_logs
+from loganalyzer.analyzer import analyze_df
+from loganalyzer.loader import load_logs_from_dir
+from loganalyzer.parser import parse_all
+
+
+def timed(func):
+    """
+    :return: 関数の戻り値と処理時間（秒）
+    """
+
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', type=int, default=300)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--rows-per-day', type=int, default=100)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    raw_df = make_logs(servers=args.servers, days=args.days, rows_per_day=args.rows_per_day)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(tmp_dir)
+        # サーバーごとに1ファイル（ファイルごとにserver_nameのカテゴリが異なる）
+        for server_name, df_by_server in raw_df.groupby('server_name'):
+            df_by_server.to_csv(data_dir / f'{server_name}.csv', index=False)
+        disk_bytes = sum(file.stat().st_size for file in data_dir.iterdir())
+        df_list, file_list = load_logs_from_dir(data_dir)
+
+    parsed_df, parse_seconds = timed(lambda: parse_all(df_list, file_list))
+    compact_df, compact_seconds = timed(lambda: parse_all(df_list, file_list, compact=True))
+    analyzed, analyze_seconds = timed(lambda: analyze_df(parsed_df))
+    compact_analyzed, compact_analyze_seconds = timed(lambda: analyze_df(compact_df))
+    pd.testing.assert_frame_equal(analyzed, compact_analyzed, check_dtype=False)
+
+    parsed_bytes = parsed_df.memory_usage(deep=True, index=False)
+    compact_bytes = compact_df.memory_usage(deep=True, index=False)
+    print(f'{len(parsed_df):,} rows, CSV on disk {disk_bytes / 1e6:.1f} MB')
+    print(f'{"column":>13} {"dtype":>15} {"MB":>7} {"compact dtype":>15} {"MB":>7}')
+    for col in parsed_df.columns:
+        print(f'{col:>13} {str(parsed_df[col].dtype):>15} {parsed_bytes[col] / 1e6:>7.2f} '
+              f'{str(compact_df[col].dtype):>15} {compact_bytes[col] / 1e6:>7.2f}')
+    print(f'{"total":>13} {"":>15} {parsed_bytes.sum() / 1e6:>7.2f} {"":>15} {compact_bytes.sum() / 1e6:>7.2f} '
+          f'({parsed_bytes.sum() / compact_bytes.sum():.1f}x smaller)')
+    print(f'parse_all: {parse_seconds:.3f}s -> {compact_seconds:.3f}s, '
+          f'analyze_df: {analyze_seconds:.3f}s -> {compact_analyze_seconds:.3f}s (results identical)')
+
+
+if __name__ == '__main__':
+    main()
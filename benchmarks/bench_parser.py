@@ -0,0 +1,106 @@
+"""
+CSV の読込・クレンジング（read_log_file + parse_one）と、従来実装（型指定なし読込 + pd.to_datetime + drop_duplicates）の処理時間を比較するベンチマーク。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_parser --rows 1000000
+"""
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from loganalyzer.loader import read_log_file
+from loganalyzer.parser import REQUIRED_COLUMNS, parse_one
+
+
+def parse_reference(file: Path) -> pd.DataFrame:
+    """
+    比較用の従来実装（型指定なしのread_csv、pd.to_datetime、全列比較のdrop_duplicates）
+
+    :param file: CSVファイルのパス
+    :return: クレンジング済みのログデータ
+    """
+
+    df = pd.read_csv(file)
+    df = df.dropna(subset=['server_name', 'timestamp', 'message'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    df = df.dropna(subset=['timestamp'])
+    return df.drop_duplicates()
+
+
+def parse_typed(file: Path) -> pd.DataFrame:
+    """
+    :param file: CSVファイルのパス
+    :return: クレンジング済みのログデータ
+    """
+
+    return parse_one(read_log_file(file), file)
+
+
+def write_csv(file: Path, rows: int, servers: int = 300, duplicate_ratio: float = 0.05, seed: int = 0):
+    """
+    ベンチマーク用のCSVファイルを作成する
+
+    :param file: 出力先のパス
+    :param rows: 行数
+    :param servers: サーバー数
+    :param duplicate_ratio: 重複行の割合
+    :param seed: 乱数シード
+    :return: なし
+    """
+
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2026-02-01T00:00:00', 's')
+    timestamps = (start + rng.integers(0, 30 * 86400, rows).astype('timedelta64[s]')).astype(str)
+    messages = np.array(['CPU spike detected', 'Routine check OK', 'Service started', 'Backup completed'])
+    df = pd.DataFrame({
+        'timestamp': np.char.replace(timestamps, 'T', ' '),
+        'server_name': np.char.add('srv', rng.integers(0, servers, rows).astype(str)),
+        'level': np.array(['INFO', 'WARNING', 'ERROR'])[rng.integers(0, 3, rows)],
+        'cpu_usage': rng.integers(0, 101, rows),
+        'memory_usage': rng.integers(0, 101, rows),
+        'message': messages[rng.integers(0, len(messages), rows)],
+    })[REQUIRED_COLUMNS]
+    duplicates = df.sample(frac=duplicate_ratio, random_state=seed)
+    pd.concat([df, duplicates]).to_csv(file, index=False)
+
+
+def best_of(func, file: Path, repeat: int) -> (float, pd.DataFrame):
+    """
+    :param func: 計測対象の関数
+    :param file: 入力ファイル
+    :param repeat: 計測回数
+    :return: 最短処理時間（秒）と処理結果
+    """
+
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(file)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(f'{"rows":>12} {"reference(s)":>13} {"typed(s)":>9} {"speedup":>8}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in args.rows:
+            file = Path(tmp_dir) / f'bench_{rows}.csv'
+            write_csv(file, rows)
+            reference_time, expected = best_of(parse_reference, file, args.repeat)
+            typed_time, result = best_of(parse_typed, file, args.repeat)
+            assert len(result) == len(expected)
+            print(f'{rows:>12,} {reference_time:>13.3f} {typed_time:>9.3f} {reference_time / typed_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+合成ログを使って処理段階（読込・クレンジング・集計・Excel出力・グラフ生成）ごとの処理時間とメモリ使用量を計測するベンチマーク。
+
+結果は JSON で保存し、--baseline を指定した場合は基準の結果と比較する（しきい値を超えて遅くなった段階があれば終了コード1）。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_pipeline --scales small medium --output bench_results.json
+    python -m benchmarks.bench_pipeline --scales small medium --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+from benchmarks.generate_logs import generate_logs
+from loganalyzer.analyzer import analyze_df
+from loganalyzer.exporter import export_result
+from loganalyzer.instrumentation import PeakRSS
+from loganalyzer.loader import load_logs_from_dir
+from loganalyzer.parser import parse_all
+from loganalyzer.visualizer import visualize_result
+
+# 計測規模ごとの合成ログの設定
+SCALES = {
+    'small': dict(servers=10, days=7, rows_per_day=100, files=7, json_ratio=0.3),
+    'medium': dict(servers=100, days=30, rows_per_day=100, files=30, json_ratio=0.2),
+    'large': dict(servers=300, days=30, rows_per_day=500, files=60, json_ratio=0.1),
+}
+STAGES = ['load', 'parse', 'analyze', 'export', 'visualize']
+# 比較時に遅くなったと判定する比率（基準比）
+DEFAULT_THRESHOLD = 1.25
+
+
+def run_pipeline(data_dir: Path, output_dir: Path) -> list[dict]:
+    """
+    main関数と同じ順に各処理段階を実行し、段階ごとの処理時間とメモリ使用量を計測する
+
+    :param data_dir: 合成ログのディレクトリのパス
+    :param output_dir: Excel・グラフの出力先のディレクトリのパス
+    :return: 段階ごとの計測結果（stage, seconds, peak_rss_delta, rows）のリスト
+    """
+
+    results = []
+    state = {}
+    stages = {
+        'load': lambda: load_logs_from_dir(data_dir),
+        'parse': lambda: parse_all(*state['load']),
+        'analyze': lambda: analyze_df(state['parse']),
+        'export': lambda: export_result(state['analyze'], output_dir, mode='workbook'),
+        'visualize': lambda: visualize_result(state['analyze'], output_dir, use_cache=False),
+    }
+    for stage in STAGES:
+        with PeakRSS() as rss:
+            start = time.perf_counter()
+            state[stage] = stages[stage]()
+            seconds = time.perf_counter() - start
+        result = state[stage]
+        rows = sum(len(df) for df in result[0]) if stage == 'load' else \
+            len(result) if isinstance(result, pd.DataFrame) else None
+        results.append({'stage': stage, 'seconds': seconds, 'peak_rss_delta': rss.peak_delta, 'rows': rows})
+    return results
+
+
+def run_scale(scale: str, repeat: int, duplicate_ratio: float, garbage_ratio: float) -> list[dict]:
+    """
+    1つの規模の合成ログを生成し、repeat回計測して段階ごとの結果を返す
+
+    :param scale: 規模の名前（SCALESのキー）
+    :param repeat: 計測回数
+    :param duplicate_ratio: 重複行の割合
+    :param garbage_ratio: 不正データ行の割合
+    :return: 段階ごとの計測結果のリスト
+    """
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / 'logs'
+        generate_logs(data_dir, duplicate_ratio=duplicate_ratio, garbage_ratio=garbage_ratio, **SCALES[scale])
+        best: dict[str, dict] = {}
+        for i in range(repeat):
+            for result in run_pipeline(data_dir, Path(tmp) / f'output_{i}'):
+                previous = best.get(result['stage'])
+                if previous is None:
+                    best[result['stage']] = result
+                    continue
+                # 処理時間は最短、メモリ使用量は最大（2回目以降は確保済みのメモリが再利用されるため）を採用する
+                if result['seconds'] < previous['seconds']:
+                    previous['seconds'] = result['seconds']
+                if result['peak_rss_delta'] is not None:
+                    previous['peak_rss_delta'] = max(previous['peak_rss_delta'], result['peak_rss_delta'])
+    return [{'scale': scale, **best[stage]} for stage in STAGES]
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    """
+    基準の結果と比較して表示し、遅くなった段階を返す
+
+    :param results: 今回の計測結果
+    :param baseline: 基準の計測結果
+    :param threshold: 遅くなったと判定する比率
+    :return: しきい値を超えて遅くなった「規模/段階」のリスト
+    """
+
+    baseline_seconds = {(r['scale'], r['stage']): r['seconds'] for r in baseline}
+    regressions = []
+    print(f'\n{"scale":>8} {"stage":>10} {"baseline(s)":>12} {"current(s)":>11} {"ratio":>7}')
+    for r in results:
+        base = baseline_seconds.get((r['scale'], r['stage']))
+        if base is None:
+            continue
+        ratio = r['seconds'] / base if base > 0 else float('inf')
+        mark = ' <- slower' if ratio > threshold else ''
+        print(f'{r["scale"]:>8} {r["stage"]:>10} {base:>12.3f} {r["seconds"]:>11.3f} {ratio:>6.2f}x{mark}')
+        if ratio > threshold:
+            regressions.append(f'{r["scale"]}/{r["stage"]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.02)
+    parser.add_argument('--garbage-ratio', type=float, default=0.01)
+    parser.add_argument('--output', type=Path, default=Path('bench_results.json'))
+    parser.add_argument('--baseline', type=Path)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    results = []
+    print(f'{"scale":>8} {"stage":>10} {"rows":>10} {"seconds":>9} {"peak RSS(MB)":>13}')
+    for scale in args.scales:
+        for r in run_scale(scale, args.repeat, args.duplicate_ratio, args.garbage_ratio):
+            results.append(r)
+            rows = '' if r['rows'] is None else f'{r["rows"]:,}'
+            rss = 'n/a' if r['peak_rss_delta'] is None else f'{r["peak_rss_delta"] / 2 ** 20:.1f}'
+            print(f'{scale:>8} {r["stage"]:>10} {rows:>10} {r["seconds"]:>9.3f} {rss:>13}')
+
+    report = {
+        'environment': {
+            'python': sys.version.split()[0],
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'settings': {
+            'repeat': args.repeat,
+            'duplicate_ratio': args.duplicate_ratio,
+            'garbage_ratio': args.garbage_ratio,
+            'scales': {scale: SCALES[scale] for scale in args.scales},
+        },
+        'results': results,
+    }
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f'\nResults written to {args.output}')
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'Slower than baseline (>{args.threshold:.2f}x): {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+集計結果の保存先（loganalyzer.results.ResultStore）の保存時間と、問い合わせ時間（キャッシュなし・キャッシュあり・HTTP経由）を計測するベンチマーク。
+比較として、同じ集計結果をログの読込済み（パース前）の状態から求め直す時間も計測する。
+保存した集計結果を読み出した結果が元の集計結果と一致することも確認する。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_results --servers 500 --days 90 --rows-per-day 20
+"""
+import argparse
+import logging
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+import pandas as pd
+from benchmarks.generate_logs import make_logs
+from loganalyzer.analyzer import analyze_df
+from loganalyzer.anomaly import detect_anomalies
+from loganalyzer.parser import parse_all
+from loganalyzer.results import ResultStore, make_result_server
+
+
+def best_ms(func, repeat: int, before=None) -> float:
+    """
+    :param func: 計測対象の関数
+    :param repeat: 計測回数
+    :param before: 毎回の計測前に呼び出す関数（計測時間に含めない）
+    :return: 最短処理時間（ミリ秒）
+    """
+
+    best = float('inf')
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', type=int, default=500)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--rows-per-day', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    raw_df = make_logs(servers=args.servers, days=args.days, rows_per_day=args.rows_per_day)
+    start = time.perf_counter()
+    analyzed_df = detect_anomalies(analyze_df(parse_all([raw_df], [Path('bench.csv')], compact=True)))
+    pipeline_ms = (time.perf_counter() - start) * 1000
+    print(f'{len(raw_df):,} rows -> {len(analyzed_df):,} server-days')
+    print(f'parse + analyze + anomaly (rerunning the pipeline): {pipeline_ms:.0f}ms')
+
+    dates = sorted(analyzed_df['date'].unique())
+    since = str(dates[max(len(dates) - 30, 0)])
+    server = analyzed_df['server_name'].iloc[0]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = ResultStore(Path(tmp_dir) / 'results.sqlite')
+        start = time.perf_counter()
+        store.rebuild(analyzed_df)
+        print(f'rebuild: {(time.perf_counter() - start) * 1000:.0f}ms '
+              f'({(Path(tmp_dir) / "results.sqlite").stat().st_size / 1e6:.1f} MB)')
+        pd.testing.assert_frame_equal(store.query(), analyzed_df)
+
+        queries = {
+            f'query(["{server}"], since=last 30 days)': lambda: store.query([server], since=since),
+            'fleet(since=last 30 days)': lambda: store.fleet(since=since),
+            'fleet()': lambda: store.fleet(),
+            'summary(since=last 30 days)': lambda: store.summary(since=since),
+        }
+        print(f'{"query":>44} {"rows":>6} {"cold ms":>8} {"cached ms":>10}')
+        for name, func in queries.items():
+            cold = best_ms(func, args.repeat, before=store.clear_cache)
+            cached = best_ms(func, args.repeat)
+            print(f'{name:>44} {len(func()):>6} {cold:>8.2f} {cached:>10.3f}')
+
+        # 1行を更新すると版数が上がり、次の問い合わせでキャッシュが破棄される
+        store.update(analyzed_df.iloc[[0]])
+        start = time.perf_counter()
+        store.fleet(since=since)
+        print(f'fleet(since=last 30 days) after update: {(time.perf_counter() - start) * 1000:.2f}ms '
+              f'(cache_info: {store.cache_info()})')
+
+        server_ = make_result_server(store)
+        threading.Thread(target=server_.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server_.server_address[1]}/fleet?since={since}'
+        fetch = lambda: urllib.request.urlopen(url).read()
+        cold = best_ms(fetch, args.repeat, before=store.clear_cache)
+        cached = best_ms(fetch, args.repeat)
+        print(f'{"GET /fleet?since=last 30 days":>44} {"":>6} {cold:>8.2f} {cached:>10.3f}')
+        server_.shutdown()
+        server_.server_close()
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+時間階層集計（loganalyzer.rollup）の作成時間と、粒度ごとの問い合わせ時間を計測するベンチマーク。
+比較として、生データから時間別の平均・最小・最大・分位点を groupby で集計し直す時間も計測する。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_rollup --servers 100 --days 30 --rows-per-day 500
+"""
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+from benchmarks.generate_logs import make_logs
+from loganalyzer.parser import parse_all
+from loganalyzer.rollup import RollupStore
+
+
+def hourly_from_raw(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    比較用：生データから時間別のCPU使用率の平均・最小・最大・分位点を集計する
+
+    :param df: パース済みのログデータ
+    :return: サーバー別・時間別の集計結果
+    """
+
+    grouped = df.groupby(['server_name', df['timestamp'].dt.floor('h')], observed=True)['cpu_usage']
+    stats = grouped.agg(['mean', 'min', 'max'])
+    quantiles = grouped.quantile([0.5, 0.95, 0.99]).unstack()
+    return stats.join(quantiles)
+
+
+def best_of(func, repeat: int) -> float:
+    """
+    :return: repeat回実行した最短時間（秒）
+    """
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', type=int, default=100)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--rows-per-day', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    raw_df = make_logs(servers=args.servers, days=args.days, rows_per_day=args.rows_per_day)
+    parsed_df = parse_all([raw_df], [Path('bench.csv')])
+    server = str(parsed_df['server_name'].iloc[0])
+    first_day = parsed_df['timestamp'].min().normalize()
+    since = str((first_day + pd.Timedelta(days=args.days // 2)).date())
+    until = str((first_day + pd.Timedelta(days=args.days // 2 + 1)).date())
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = RollupStore(Path(store_dir))
+        start = time.perf_counter()
+        tier_rows = store.rebuild(parsed_df)
+        build_seconds = time.perf_counter() - start
+        print(f'{len(parsed_df):,} rows -> ' + ', '.join(f'{tier} {rows:,}' for tier, rows in tier_rows.items())
+              + f' in {build_seconds:.3f}s')
+        print(f'raw groupby (hourly cpu mean/min/max/p50/p95/p99): '
+              f'{best_of(lambda: hourly_from_raw(parsed_df), 1) * 1000:.1f}ms')
+
+        print(f'{"granularity":>11} {"cold(ms)":>9} {"all(ms)":>8} {"1 server, 2 days(ms)":>21}')
+        for granularity in ('minute', 'hour', 'day', 'week', '15min', '6h'):
+            cold_store = RollupStore(Path(store_dir))
+            start = time.perf_counter()
+            cold_store.query(granularity)
+            cold = time.perf_counter() - start
+            full = best_of(lambda: store.query(granularity), args.repeat)
+            narrow = best_of(lambda: store.query(granularity, since=since, until=until, servers=[server]), args.repeat)
+            print(f'{granularity:>11} {cold * 1000:>9.1f} {full * 1000:>8.1f} {narrow * 1000:>21.2f}')
+
+
+if __name__ == '__main__':
+    main()
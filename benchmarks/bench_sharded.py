@@ -0,0 +1,103 @@
+"""
+シャード分割による並列解析（loganalyzer.sharded.analyze_sharded）の処理時間を、プロセス数を変えて計測するベンチマーク。
+比較として、逐次処理（load_logs_from_dir → parse_all → analyze_df）の処理時間も計測し、結果が一致することを確認する。
+
+CPU数がプロセス数より少ない環境では実測では並列化の効果を確認できないため、ファイルごと・シャードごとの処理時間を
+1プロセスで計測し、各段階のタスクを空いているプロセスに順に割り当てた場合の処理時間（推定値）も表示する。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_sharded --servers 300 --days 30 --rows-per-day 200 --files 60 --workers 1 2 4 8
+"""
+import argparse
+import heapq
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from benchmarks.generate_logs import make_logs
+from loganalyzer.analyzer import analyze_df, finalize_partial, merge_partials
+from loganalyzer.loader import collect_log_files, load_logs_from_dir
+from loganalyzer.parser import parse_all
+from loganalyzer.sharded import aggregate_shard, analyze_sharded, partition_file
+
+
+def task_seconds(data_dir: Path, n_shards: int) -> (list[float], list[float], float):
+    """
+    analyze_shardedの各タスクを1プロセスで順に実行して処理時間を計測する
+
+    :param data_dir: ログデータのディレクトリ
+    :param n_shards: シャード数
+    :return: ファイルごとの処理時間、シャードごとの処理時間、部分集計の結合・確定の処理時間
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        shard_root = Path(tmp_dir)
+        map_seconds = []
+        for index, file in enumerate(collect_log_files(data_dir)):
+            start = time.perf_counter()
+            partition_file(file, index, shard_root, n_shards)
+            map_seconds.append(time.perf_counter() - start)
+        reduce_seconds, partials = [], []
+        for shard_dir in sorted(shard_root.iterdir()):
+            start = time.perf_counter()
+            partials.append(aggregate_shard(shard_dir))
+            reduce_seconds.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        finalize_partial(merge_partials(partials))
+        return map_seconds, reduce_seconds, time.perf_counter() - start
+
+
+def schedule(seconds: list[float], workers: int) -> float:
+    """
+    タスクを投入順に空いているプロセスに割り当てた場合の完了時間（ProcessPoolExecutorと同じ割り当て方）
+
+    :param seconds: タスクごとの処理時間
+    :param workers: プロセス数
+    :return: 全タスクの完了時間
+    """
+
+    finish = [0.0] * workers
+    for task in seconds:
+        heapq.heapreplace(finish, finish[0] + task)
+    return max(finish)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', type=int, default=300)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--rows-per-day', type=int, default=200)
+    parser.add_argument('--files', type=int, default=60)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    raw_df = make_logs(servers=args.servers, days=args.days, rows_per_day=args.rows_per_day, duplicate_ratio=0.02)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(tmp_dir)
+        # 日時順の行を順にファイルに分ける（各ファイルに全サーバーの行が含まれる）
+        for index, rows in enumerate(np.array_split(np.arange(len(raw_df)), args.files)):
+            raw_df.iloc[rows].to_csv(data_dir / f'log_{index:04d}.csv', index=False)
+
+        start = time.perf_counter()
+        expected = analyze_df(parse_all(*load_logs_from_dir(data_dir)))
+        sequential = time.perf_counter() - start
+        print(f'{len(raw_df):,} rows in {args.files} files, {os.cpu_count()} CPUs')
+        print(f'{"mode":>12} {"seconds":>8} {"speedup":>8} {"estimated":>10} {"speedup":>8}')
+        print(f'{"sequential":>12} {sequential:>8.2f} {1.0:>8.2f}')
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            result = analyze_sharded(data_dir, workers=workers)
+            seconds = time.perf_counter() - start
+            assert result.equals(expected), f'sharded result differs with {workers} workers'
+            map_seconds, reduce_seconds, merge_seconds = task_seconds(data_dir, workers)
+            estimated = schedule(map_seconds, workers) + schedule(reduce_seconds, workers) + merge_seconds
+            print(f'{f"{workers} workers":>12} {seconds:>8.2f} {sequential / seconds:>8.2f} '
+                  f'{estimated:>10.2f} {sequential / estimated:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
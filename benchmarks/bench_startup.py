@@ -0,0 +1,85 @@
+"""
+起動時間のベンチマーク。モジュールの読込時間と、CLI（python -m loganalyzer）のサブコマンドの実行時間を、
+それぞれ新しいPythonプロセスで計測する（読込済みのモジュールの影響を受けないよう毎回プロセスを起動する）。
+
+--rootに別のチェックアウト（変更前のコミットなど）を指定すると、そのツリーで同じ計測を行う
+（CLIの無いツリーではCLIの計測を省略する）。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_startup --repeat 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 読込時間を計測するモジュール
+IMPORTS = [
+    'pandas',
+    'openpyxl',
+    'matplotlib.figure',
+    'loganalyzer.cli',
+    'loganalyzer.exporter',
+    'loganalyzer.visualizer',
+    'main',
+]
+
+
+def best_seconds(command: list[str], cwd: Path, repeat: int) -> float:
+    """
+    コマンドを新しいプロセスでrepeat回実行し、最短の実行時間を返す
+
+    :param command: 実行するコマンド
+    :param cwd: 実行ディレクトリ
+    :param repeat: 実行回数
+    :return: 最短の実行時間（秒）
+    """
+
+    env = dict(os.environ, PYTHONPATH=str(cwd))
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', type=Path, default=Path(__file__).parent.parent)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    root = args.root.resolve()
+
+    baseline = best_seconds([sys.executable, '-c', 'pass'], root, args.repeat)
+    print(f'python -c pass: {baseline:.3f}s (subtracted from import times below)')
+    print(f'{"import":>24} {"seconds":>8}')
+    for module in IMPORTS:
+        if not (root / (module.replace('.', '/') + '.py')).exists() and module.startswith(('loganalyzer', 'main')):
+            continue
+        seconds = best_seconds([sys.executable, '-c', f'import {module}'], root, args.repeat)
+        print(f'{module:>24} {seconds - baseline:>8.3f}')
+
+    if not (root / 'loganalyzer' / '__main__.py').exists():
+        return
+    data_dir = root / 'data' / 'sample_logs'
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        options = ['--output-dir', tmp_dir, '--log-dir', tmp_dir]
+        commands = [
+            ('--help', ['--help']),
+            ('analyze', ['analyze', str(data_dir)] + options),
+            ('export', ['export', str(data_dir)] + options),
+            # 2回目以降は描画済みグラフを使用するため、matplotlibを読み込まない
+            ('plot (cached)', ['plot', str(data_dir)] + options),
+        ]
+        print(f'{"python -m loganalyzer":>24} {"seconds":>8}')
+        for name, command in commands:
+            seconds = best_seconds([sys.executable, '-m', 'loganalyzer'] + command, root, args.repeat)
+            print(f'{name:>24} {seconds:>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
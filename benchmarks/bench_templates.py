@@ -0,0 +1,112 @@
+"""
+メッセージのテンプレート抽出（loganalyzer.templates）のスループットと、索引の作成・検索時間を計測するベンチマーク。
+比較として、1行ずつ変数部分を置換して抽出器に渡す場合（重複を除かない場合）の時間も計測する。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.bench_templates --servers 100 --days 7 --rows-per-day 1000
+"""
+import argparse
+import logging
+import re
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from benchmarks.generate_logs import make_logs
+from loganalyzer.parser import parse_all
+from loganalyzer.templates import TemplateIndex, TemplateMiner, WILDCARD, extract_templates
+
+# 変数部分を含むメッセージの書式（{}に乱数の値を入れる）
+MESSAGE_FORMATS = [
+    'CPU spike detected on core {} ({}%)',
+    'Connection timeout to 10.0.{}.{}:5432 after {} ms',
+    'User u{} logged in from host-{}',
+    'Disk space low on /dev/sd{} ({} GB free)',
+    'Request {} completed in {} ms with status 200',
+    'Failed to write log chunk {} of {}',
+    'Backup job {} completed',
+    'Routine check OK',
+    'Service started',
+]
+
+
+def varied_messages(rows: int, seed: int = 0) -> np.ndarray:
+    """
+    変数部分を含むメッセージを生成する
+
+    :param rows: 行数
+    :param seed: 乱数シード
+    :return: メッセージの配列（大半の行が互いに異なる）
+    """
+
+    rng = np.random.default_rng(seed)
+    kinds = rng.integers(0, len(MESSAGE_FORMATS), rows)
+    values = rng.integers(0, 100_000, (rows, 3))
+    return np.array([MESSAGE_FORMATS[kind].format(*value) for kind, value in zip(kinds.tolist(), values.tolist())],
+                    dtype=object)
+
+
+def per_line(messages: pd.Series) -> list[int]:
+    """
+    比較用：1行ずつ変数部分を置換して抽出器に渡す
+
+    :param messages: message列
+    :return: 行ごとのテンプレート番号
+    """
+
+    miner = TemplateMiner()
+    pattern = re.compile(r'\S*\d\S*')
+    return [miner.add(pattern.sub(WILDCARD, message).strip()) for message in messages]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', type=int, default=100)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--rows-per-day', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    raw_df = make_logs(servers=args.servers, days=args.days, rows_per_day=args.rows_per_day)
+    raw_df['message'] = varied_messages(len(raw_df))
+    parsed_df = parse_all([raw_df], [Path('bench.csv')])
+    rows = len(parsed_df)
+    print(f'{rows:,} rows, {parsed_df["message"].nunique():,} distinct messages')
+
+    start = time.perf_counter()
+    template_ids = extract_templates(parsed_df['message'], TemplateMiner())
+    seconds = time.perf_counter() - start
+    print(f'extract_templates: {seconds:.3f}s ({rows / seconds:,.0f} lines/s), '
+          f'{template_ids.max() + 1} templates')
+    start = time.perf_counter()
+    per_line(parsed_df['message'])
+    seconds = time.perf_counter() - start
+    print(f'per-line mining:   {seconds:.3f}s ({rows / seconds:,.0f} lines/s)')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = TemplateIndex(Path(tmp_dir) / 'templates.sqlite')
+        start = time.perf_counter()
+        counts = index.rebuild(parsed_df)
+        print(f'index rebuild: {time.perf_counter() - start:.3f}s ({len(counts):,} server-day-template counts)')
+
+        template_id, template = index.templates()[['template_id', 'template']].iloc[0]
+        first_day = parsed_df['timestamp'].min().normalize()
+        since = str((first_day + pd.Timedelta(days=max(args.days - 7, 0))).date())
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            found = index.servers(template, since=since)
+            best = min(best, time.perf_counter() - start)
+        print(f'servers("{template}", last 7 days): {best * 1000:.2f}ms ({len(found)} servers)')
+
+        start = time.perf_counter()
+        mask = parsed_df['timestamp'] >= pd.Timestamp(since)
+        ids = extract_templates(parsed_df.loc[mask, 'message'], index.miner())
+        parsed_df.loc[mask, 'server_name'][ids == template_id].unique()
+        print(f'same question from the parsed rows: {(time.perf_counter() - start) * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+ベンチマーク用の合成ログ（data/sample_logs と同じ列構成の CSV / JSON）を生成する。
+
+実行方法（リポジトリ直下で）:
+    python -m benchmarks.generate_logs /tmp/bench_logs --servers 300 --days 30 --rows-per-day 500 --files 60
+"""
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from loganalyzer.parser import REQUIRED_COLUMNS
+
+LEVELS = np.array(['INFO', 'WARNING', 'ERROR'])
+# レベルごとの出現確率（INFO / WARNING / ERROR）
+LEVEL_WEIGHTS = [0.8, 0.15, 0.05]
+MESSAGES = {
+    'INFO': np.array(['Routine check OK', 'Service started', 'Backup completed']),
+    'WARNING': np.array(['CPU spike detected', 'Disk space low']),
+    'ERROR': np.array(['Failed to write log', 'Connection timeout']),
+}
+# 不正データの種類（列名, 値）。parse_oneで除外または欠損値に変換される値
+GARBAGE_VALUES = [
+    ('timestamp', 'not a timestamp'),
+    ('timestamp', '2026-13-45 25:61:61'),
+    ('timestamp', None),
+    ('server_name', None),
+    ('message', None),
+    ('cpu_usage', 'abc'),
+    ('memory_usage', ''),
+]
+
+
+def make_logs(servers: int = 10, days: int = 7, rows_per_day: int = 100, duplicate_ratio: float = 0.0,
+              garbage_ratio: float = 0.0, start: str = '2026-02-01', seed: int = 0) -> pd.DataFrame:
+    """
+    合成ログを作成する関数
+
+    サーバーごと・日ごとにrows_per_day行を作成し、日時順に並べる。
+    CPU・メモリ使用率はサーバーごとの基準値に日内変動とノイズを加えた値とする。
+    duplicate_ratioの割合で既存行の複製を、garbage_ratioの割合で不正な値を含む行を加える。
+
+    :param servers: サーバー数
+    :param days: 日数
+    :param rows_per_day: 1サーバー・1日あたりの行数
+    :param duplicate_ratio: 重複行の割合（正常行数に対する割合）
+    :param garbage_ratio: 不正データ行の割合（正常行数に対する割合）
+    :param start: 開始日（'YYYY-MM-DD'）
+    :param seed: 乱数シード
+    :return: ログデータ（列はREQUIRED_COLUMNSの順、値はすべて文字列または数値）
+    """
+
+    rng = np.random.default_rng(seed)
+    rows = servers * days * rows_per_day
+    server_ids = np.repeat(np.arange(servers), days * rows_per_day)
+    day_offsets = np.tile(np.repeat(np.arange(days), rows_per_day), servers)
+    seconds = day_offsets * 86400 + rng.integers(0, 86400, rows)
+    timestamps = np.datetime64(start, 's') + seconds.astype('timedelta64[s]')
+
+    levels = LEVELS[rng.choice(len(LEVELS), rows, p=LEVEL_WEIGHTS)]
+    messages = np.empty(rows, dtype=object)
+    for level, candidates in MESSAGES.items():
+        mask = levels == level
+        messages[mask] = candidates[rng.integers(0, len(candidates), mask.sum())]
+
+    daily_wave = np.sin((seconds % 86400) / 86400 * 2 * np.pi)
+    cpu_base = rng.uniform(20, 60, servers)[server_ids]
+    memory_base = rng.uniform(30, 70, servers)[server_ids]
+    df = pd.DataFrame({
+        'timestamp': np.char.replace(timestamps.astype(str), 'T', ' '),
+        'server_name': np.char.add('srv', (server_ids + 1).astype(str)),
+        'level': levels,
+        'cpu_usage': np.clip(cpu_base + 20 * daily_wave + rng.normal(0, 10, rows), 0, 100).round().astype(int),
+        'memory_usage': np.clip(memory_base + 10 * daily_wave + rng.normal(0, 5, rows), 0, 100).round().astype(int),
+        'message': messages,
+    })[REQUIRED_COLUMNS]
+
+    parts = [df]
+    sort_keys = [seconds]
+    n_duplicates = int(rows * duplicate_ratio)
+    if n_duplicates:
+        source = rng.integers(0, rows, n_duplicates)
+        parts.append(df.iloc[source])
+        sort_keys.append(seconds[source])
+    n_garbage = int(rows * garbage_ratio)
+    if n_garbage:
+        source = rng.integers(0, rows, n_garbage)
+        garbage = df.iloc[source].astype(object)
+        kinds = rng.integers(0, len(GARBAGE_VALUES), n_garbage)
+        for i, (column, value) in enumerate(GARBAGE_VALUES):
+            garbage.loc[garbage.index[kinds == i], column] = value
+        parts.append(garbage)
+        sort_keys.append(seconds[source])
+
+    df = pd.concat(parts, ignore_index=True)
+    # 重複行・不正データ行は元の行の位置（同じ日時）に並べる
+    order = np.argsort(np.concatenate(sort_keys), kind='stable')
+    return df.iloc[order].reset_index(drop=True)
+
+
+def generate_logs(output_dir: Path, servers: int = 10, days: int = 7, rows_per_day: int = 100,
+                  duplicate_ratio: float = 0.0, garbage_ratio: float = 0.0, files: int = 1,
+                  json_ratio: float = 0.0, start: str = '2026-02-01', seed: int = 0) -> list[Path]:
+    """
+    合成ログを作成し、ファイルに分割して保存する関数
+
+    日時順に並べたログを連続する範囲ごとにfiles個のファイルへ分割する。
+    先頭からjson_ratioの割合のファイルをJSON（data/sample_logsと同じレコードの配列）、残りをCSVで保存する。
+    ファイル名には日付を含めない（日付による絞り込みの判定で対象外とされないようにするため）。
+
+    :param output_dir: 出力先のディレクトリのパス
+    :param servers: サーバー数
+    :param days: 日数
+    :param rows_per_day: 1サーバー・1日あたりの行数
+    :param duplicate_ratio: 重複行の割合
+    :param garbage_ratio: 不正データ行の割合
+    :param files: ファイル数
+    :param json_ratio: JSON形式で保存するファイルの割合
+    :param start: 開始日（'YYYY-MM-DD'）
+    :param seed: 乱数シード
+    :return: 保存したファイルパスのリスト
+    """
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    df = make_logs(servers, days, rows_per_day, duplicate_ratio, garbage_ratio, start, seed)
+
+    n_json = round(files * json_ratio)
+    paths: list[Path] = []
+    for i, bounds in enumerate(np.array_split(np.arange(len(df)), files)):
+        part = df.iloc[bounds]
+        if i < n_json:
+            path = output_dir / f'log_{i:04d}.json'
+            part.to_json(path, orient='records', indent=2, force_ascii=False)
+        else:
+            path = output_dir / f'log_{i:04d}.csv'
+            part.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output_dir', type=Path)
+    parser.add_argument('--servers', type=int, default=10)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--rows-per-day', type=int, default=100)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.0)
+    parser.add_argument('--garbage-ratio', type=float, default=0.0)
+    parser.add_argument('--files', type=int, default=1)
+    parser.add_argument('--json-ratio', type=float, default=0.0)
+    parser.add_argument('--start', default='2026-02-01')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_logs(args.output_dir, args.servers, args.days, args.rows_per_day, args.duplicate_ratio,
+                          args.garbage_ratio, args.files, args.json_ratio, args.start, args.seed)
+    print(f'{len(paths)} files written to {args.output_dir}')
+
+
+if __name__ == '__main__':
+    main()
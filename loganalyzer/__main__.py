@@ -0,0 +1,7 @@
+"""
+python -m loganalyzer で loganalyzer.cli を実行する。
+"""
+import sys
+from loganalyzer.cli import main
+
+sys.exit(main())
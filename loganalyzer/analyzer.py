@@ -1,19 +1,40 @@
 """
-サーバー・日付で集計。レベル別件数・CPU/メモリ日平均を算出し、1本の分析用 DataFrame にまとめる。
+サーバー・日付で集計。レベル別件数・CPU/メモリ日平均・分位点（p50/p95/p99）・最大値を算出し、1本の分析用 DataFrame にまとめる。
+ファイル・チャンク単位の部分集計（合算可能な件数・合計値・最大値・分位点スケッチ）とその結合・確定処理もここで扱う。
 """
+import numpy as np
 import pandas as pd
 import logging
+from loganalyzer import sketch
 from loganalyzer.logging_config import setup_logging
 
 logger = logging.getLogger(__name__)
 
+# 部分集計のキー列と、レベル別件数以外の合算用列
+KEY_COLUMNS = ['server_name', 'date']
+USAGE_SUM_COLUMNS = ['level_count', 'cpu_sum', 'cpu_count', 'memory_sum', 'memory_count']
+# 最大値で合算する列と、分位点スケッチ（sketch.pack関数で作成した配列）の列
+USAGE_MAX_COLUMNS = ['cpu_max', 'memory_max']
+SKETCH_COLUMNS = ['cpu_sketch', 'memory_sketch']
+# 分析結果に出力する分位点
+QUANTILES = (0.5, 0.95, 0.99)
+# 分析結果のレベル別件数以外の列（使用率の平均・分位点・最大値）
+METRIC_COLUMNS = ['cpu_avg', 'memory_avg'] + [
+    f'{name}_{stat}' for name in ['cpu', 'memory'] for stat in [f'p{round(q * 100)}' for q in QUANTILES] + ['max']
+]
+# datetime64[D]のNaTをint64として見た値
+NAT_DAY = np.datetime64('NaT', 'D').view('int64')
+# サーバー数×日数がこの値以下の場合は密な配列で集計する
+DENSE_GROUP_LIMIT = 4_000_000
+
 def analyze_df(df: pd.DataFrame) -> pd.DataFrame:
     """
     ログデータを分析し、サーバー別・日別の集計結果を作成する関数
 
-    timestamp列から日付（date）列を生成し、ログレベル別件数を集計する
-    CPU / メモリ使用率の平均値を算出する
-    集計結果を結合して1つのDataFrameにまとめる
+    サーバー名・ログレベルを整数コード化し、timestampを日単位に切り捨てた値と組み合わせて
+    1回の走査でログレベル別件数とCPU / メモリ使用率の合計・件数・最大値・分位点スケッチを集計する（aggregate_partial関数）
+    合計・件数から平均値を、スケッチから分位点を算出し、1つのDataFrameにまとめる（finalize_partial関数）
+    入力のDataFrameは変更しない
 
     :param df:　パース済みのログデータ
     :return:　分析・集計後のデータ
@@ -21,22 +42,11 @@ def analyze_df(df: pd.DataFrame) -> pd.DataFrame:
 
     logger.info(f'Analysis started')
     try:
-        logger.debug('Processing data column')
-        df['date'] = df['timestamp'].dt.date
-
-        logger.debug('Grouping by name, date, level')
-        leveled_df = df.groupby(['server_name', 'date', 'level']).size().unstack(fill_value=0)
-        usage_age_daily = df.groupby(['server_name','date']).agg(
-            cpu_avg = ('cpu_usage', 'mean'),
-            memory_avg = ('memory_usage', 'mean')
-        )
+        logger.debug('Aggregating by name, date, level')
+        partial = aggregate_partial(df)
 
-        logger.debug('Merging data')
-        df_analyzed = pd.merge(
-            leveled_df.reset_index(),
-            usage_age_daily.reset_index(),
-            on=['server_name', 'date'],
-            how='outer')
+        logger.debug('Finalizing data')
+        df_analyzed = finalize_partial(partial)
 
     except (ValueError, TypeError, KeyError) as e:
         logger.exception(f'Analysis failed: {e}')
@@ -47,6 +57,329 @@ def analyze_df(df: pd.DataFrame) -> pd.DataFrame:
     return df_analyzed
 
 
+def aggregate_partial(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    ログデータからサーバー別・日別の部分集計を作成する関数
+
+    平均値ではなく合計値と件数を保持するため、ファイルやチャンクごとの部分集計を
+    merge_partials関数で結合し、finalize_partial関数でanalyze_dfと同じ結果に確定できる。
+    groupby・mergeは使わず、整数コード化したキーに対するnumpy.bincountで1回の走査で集計する。
+    入力のDataFrameは変更しない。
+
+    :param df: パース済みのログデータ（全体またはその一部）
+    :return: server_name, date, レベル別件数, USAGE_SUM_COLUMNS, USAGE_MAX_COLUMNS, SKETCH_COLUMNSを持つ部分集計
+    """
+
+    server_codes, server_names = encode_column(df['server_name'])
+    level_codes, level_names = encode_column(df['level'])
+    days = day_numbers(df['timestamp'])
+    cpu = df['cpu_usage'].to_numpy(dtype='float64', na_value=np.nan)
+    memory = df['memory_usage'].to_numpy(dtype='float64', na_value=np.nan)
+
+    group_servers, group_days, level_counts, sums = aggregate_arrays(
+        server_codes, days, level_codes, len(level_names), cpu, memory
+    )
+    return build_partial(server_names, level_names, group_servers, group_days, level_counts, sums)
+
+
+def encode_column(series: pd.Series) -> (np.ndarray, pd.Index):
+    """
+    文字列列を整数コードに変換する関数
+
+    カテゴリ型の場合は既存のコードをそのまま使用し、それ以外は名前順にコードを割り当てる。
+    欠損値のコードは-1とする。
+
+    :param series: server_name列またはlevel列
+    :return: int64のコード配列と、コードに対応する値のIndex
+    """
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(dtype='int64'), series.cat.categories
+    codes, uniques = series.factorize(sort=True)
+    return codes.astype('int64', copy=False), uniques
+
+
+def day_numbers(timestamp: pd.Series) -> np.ndarray:
+    """
+    timestampを1970-01-01からの日数（日単位の切り捨て）に変換する関数
+
+    タイムゾーン付きの場合は現地時刻の日付とする（Series.dt.dateと同じ）。
+    欠損値（NaT）はNAT_DAYとする。
+
+    :param timestamp: timestamp列
+    :return: int64の日数配列
+    """
+
+    if getattr(timestamp.dt, 'tz', None) is not None:
+        timestamp = timestamp.dt.tz_localize(None)
+    return timestamp.to_numpy().astype('datetime64[D]').view('int64')
+
+
+def aggregate_arrays(
+        server_codes: np.ndarray,
+        days: np.ndarray,
+        level_codes: np.ndarray,
+        n_levels: int,
+        cpu: np.ndarray,
+        memory: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray, dict[str, np.ndarray]):
+    """
+    コード化済みの配列からサーバー別・日別の件数・合計値を集計する関数
+
+    (サーバーコード, 日数) を1つのグループ番号にまとめ、numpy.bincountで集計する。
+    グループ数が少ない場合は密な配列、多い場合はハッシュによる番号の詰め直しを用いる。
+    グループはサーバーコード・日数の昇順に並ぶ。
+    最大値はnumpy.fmax.at、分位点スケッチはsketch.count_keysで集計し、グループごとの配列に分ける。
+
+    :param server_codes: サーバー名のコード配列（欠損は-1）
+    :param days: 日数配列（欠損はNAT_DAY）
+    :param level_codes: ログレベルのコード配列（欠損は-1）
+    :param n_levels: ログレベルの種類数
+    :param cpu: CPU使用率（欠損はNaN）
+    :param memory: メモリ使用率（欠損はNaN）
+    :return: グループごとのサーバーコード・日数、レベル別件数（グループ数×レベル数）、合計値・件数・最大値・スケッチの辞書
+    """
+
+    valid = (server_codes >= 0) & (days != NAT_DAY)
+    if not valid.all():
+        server_codes, days, level_codes = server_codes[valid], days[valid], level_codes[valid]
+        cpu, memory = cpu[valid], memory[valid]
+
+    if len(days) == 0:
+        empty = np.empty(0, dtype='int64')
+        sums = {col: np.empty(0, dtype='float64' if col.endswith('_sum') else 'int64') for col in USAGE_SUM_COLUMNS}
+        sums.update({col: np.empty(0, dtype='float64') for col in USAGE_MAX_COLUMNS})
+        sums.update({col: np.empty(0, dtype=object) for col in SKETCH_COLUMNS})
+        return empty, empty, np.empty((0, n_levels), dtype='int64'), sums
+
+    day_min = days.min()
+    span = int(days.max() - day_min) + 1
+    raw_ids = server_codes * span + (days - day_min)
+    n_servers = int(server_codes.max()) + 1
+    if n_servers * span <= DENSE_GROUP_LIMIT:
+        group_ids = raw_ids
+        n_groups = n_servers * span
+    else:
+        group_ids, group_keys = pd.factorize(raw_ids, sort=True)
+        n_groups = len(group_keys)
+
+    level_present = level_codes >= 0
+    level_counts = np.bincount(
+        group_ids[level_present] * n_levels + level_codes[level_present],
+        minlength=n_groups * n_levels
+    ).reshape(n_groups, n_levels)
+    row_counts = np.bincount(group_ids, minlength=n_groups)
+
+    sums: dict[str, np.ndarray] = {'level_count': level_counts.sum(axis=1)}
+    for name, values in [('cpu', cpu), ('memory', memory)]:
+        present = ~np.isnan(values)
+        sums[f'{name}_sum'] = np.bincount(group_ids[present], weights=values[present], minlength=n_groups)
+        sums[f'{name}_count'] = np.bincount(group_ids[present], minlength=n_groups)
+        # fmaxは欠損値を無視するため、値の無いグループはNaNのまま残る
+        sums[f'{name}_max'] = np.full(n_groups, np.nan)
+        np.fmax.at(sums[f'{name}_max'], group_ids[present], values[present])
+
+    if n_servers * span <= DENSE_GROUP_LIMIT:
+        # 密な配列では行の無いグループも含まれるため、出現したグループのみを残す
+        group_keys = np.flatnonzero(row_counts)
+        level_counts = level_counts[group_keys]
+        sums = {col: values[group_keys] for col, values in sums.items()}
+        # スケッチは出現したグループのみの番号で集計する（グループ数×バケット数の配列を小さくする）
+        group_ids = (np.cumsum(row_counts > 0) - 1)[group_ids]
+
+    for name, values in [('cpu', cpu), ('memory', memory)]:
+        present = ~np.isnan(values)
+        sums[f'{name}_sketch'] = sketch.pack(
+            *sketch.count_keys(group_ids[present], sketch.encode_keys(values[present])), len(group_keys)
+        )
+
+    return group_keys // span, group_keys % span + day_min, level_counts, sums
+
+
+def build_partial(
+        server_names: pd.Index,
+        level_names: pd.Index,
+        group_servers: np.ndarray,
+        group_days: np.ndarray,
+        level_counts: np.ndarray,
+        sums: dict[str, np.ndarray]) -> pd.DataFrame:
+    """
+    aggregate_arrays関数の集計結果を部分集計のDataFrameに変換する関数
+
+    一度も出現しないログレベル（カテゴリ型の未使用カテゴリ等）の列は作成しない。
+
+    :param server_names: サーバーコードに対応するサーバー名
+    :param level_names: レベルコードに対応するログレベル名
+    :param group_servers: グループごとのサーバーコード
+    :param group_days: グループごとの日数
+    :param level_counts: レベル別件数（グループ数×レベル数）
+    :param sums: 合計値・件数・最大値・スケッチの辞書
+    :return: 部分集計
+    """
+
+    partial = pd.DataFrame({
+        'server_name': server_names.take(group_servers),
+        # datetime64[D]をobject型に変換するとdatetime.dateになる（Series.dt.dateと同じ型）
+        'date': group_days.astype('datetime64[D]').astype(object),
+    })
+    observed_levels = np.flatnonzero(level_counts.sum(axis=0))
+    for level_index in observed_levels:
+        partial[str(level_names[level_index])] = level_counts[:, level_index].astype('int64', copy=False)
+    for col in USAGE_SUM_COLUMNS:
+        partial[col] = sums[col].astype('float64' if col.endswith('_sum') else 'int64', copy=False)
+    for col in USAGE_MAX_COLUMNS + SKETCH_COLUMNS:
+        partial[col] = sums[col]
+    return partial
+
+
+def merge_partials(partials: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    複数の部分集計を1つに結合する関数
+
+    同じサーバー・日付の行は件数・合計値を加算し、最大値は大きい方を取り、スケッチはバケットごとの件数を加算する。
+    ある部分集計に存在しないログレベルの件数は0として扱う。
+
+    :param partials: aggregate_partial関数で作成した部分集計のリスト
+    :return: 結合後の部分集計
+    """
+
+    partials = [partial for partial in partials if not partial.empty]
+    if not partials:
+        return pd.DataFrame(columns=KEY_COLUMNS + USAGE_SUM_COLUMNS)
+    if len(partials) == 1:
+        return partials[0]
+
+    merged = pd.concat(partials, ignore_index=True)
+    special_columns = USAGE_MAX_COLUMNS + SKETCH_COLUMNS
+    value_columns = [col for col in merged.columns if col not in KEY_COLUMNS and col not in special_columns]
+    merged[value_columns] = merged[value_columns].fillna(0)
+    grouped = merged.groupby(KEY_COLUMNS, sort=True)
+    result = grouped[value_columns].sum()
+
+    count_columns = [col for col in value_columns if col not in ['cpu_sum', 'memory_sum']]
+    result[count_columns] = result[count_columns].astype('int64')
+    for col in USAGE_MAX_COLUMNS:
+        if col in merged.columns:
+            result[col] = grouped[col].max().to_numpy(dtype='float64')
+    sketch_columns = [col for col in SKETCH_COLUMNS if col in merged.columns]
+    if sketch_columns:
+        # 各行のスケッチを1つの配列にまとめ、結合後のグループ番号でバケットごとの件数を合算する
+        group_ids = grouped.ngroup().to_numpy()
+        for col in sketch_columns:
+            rows, keys, counts = sketch.unpack(merged[col].to_numpy())
+            result[col] = sketch.pack(*sketch.count_keys(group_ids[rows], keys, weights=counts), len(result))
+    return result.reset_index()
+
+
+def finalize_partial(partial: pd.DataFrame) -> pd.DataFrame:
+    """
+    部分集計からanalyze_df関数と同じ形式の分析結果を作成する関数
+
+    列順はserver_name, date, レベル別件数（レベル名順）, cpu_avg, memory_avg,
+    cpu_p50, cpu_p95, cpu_p99, cpu_max, memory_p50, memory_p95, memory_p99, memory_maxとし、
+    行はserver_name, dateの昇順に並べる。
+    レベルを持つ行が1件もないサーバー・日付のレベル別件数は欠損値とする。
+    分位点はスケッチの代表値（相対誤差1%以内）を最大値以下に収めた値とし、値の無いサーバー・日付は欠損値とする。
+
+    :param partial: aggregate_partial / merge_partials関数で作成した部分集計
+    :return: 分析・集計後のデータ
+    """
+
+    level_columns = sorted(
+        col for col in partial.columns if col not in KEY_COLUMNS + USAGE_SUM_COLUMNS + USAGE_MAX_COLUMNS + SKETCH_COLUMNS
+    )
+    df_analyzed = partial[KEY_COLUMNS + level_columns].copy()
+    no_level = partial['level_count'] == 0
+    if no_level.any():
+        df_analyzed[level_columns] = df_analyzed[level_columns].astype('float64')
+        df_analyzed.loc[no_level, level_columns] = float('nan')
+
+    df_analyzed['cpu_avg'] = partial['cpu_sum'] / partial['cpu_count'].where(partial['cpu_count'] > 0)
+    df_analyzed['memory_avg'] = partial['memory_sum'] / partial['memory_count'].where(partial['memory_count'] > 0)
+    for name in ['cpu', 'memory']:
+        maximum = partial[f'{name}_max'].to_numpy(dtype='float64') if f'{name}_max' in partial.columns \
+            else np.full(len(partial), np.nan)
+        percentiles = {q: np.full(len(partial), np.nan) for q in QUANTILES}
+        if f'{name}_sketch' in partial.columns:
+            rows, keys, counts = sketch.unpack(partial[f'{name}_sketch'].to_numpy())
+            groups, values = sketch.quantiles(rows, keys, counts, list(QUANTILES))
+            for q in QUANTILES:
+                percentiles[q][groups] = values[q]
+        for q in QUANTILES:
+            df_analyzed[f'{name}_p{round(q * 100)}'] = np.where(maximum < percentiles[q], maximum, percentiles[q])
+        df_analyzed[f'{name}_max'] = maximum
+    df_analyzed.columns = pd.Index(df_analyzed.columns.tolist(), dtype='str')
+
+    return df_analyzed.sort_values(KEY_COLUMNS, kind='stable').reset_index(drop=True)
+
+
+class DailyAggregator:
+    """
+    サーバー別・日別の集計値を逐次的に更新するクラス
+
+    チャンク単位でupdateを呼び出し、生データは保持せず部分集計のみを蓄積する。
+    蓄積した部分集計が一定数を超えると結合してまとめるため、
+    メモリ使用量はデータ総量ではなくサーバー数×日数に比例する。
+    """
+
+    def __init__(self, compact_every: int = 64):
+        """
+        :param compact_every: 部分集計をまとめる間隔（蓄積数）
+        """
+
+        self._partials: list[pd.DataFrame] = []
+        self._compact_every = compact_every
+
+    def update(self, df: pd.DataFrame):
+        """
+        パース済みのログデータを集計値に反映する
+
+        :param df: パース済みのログデータ（チャンク）
+        :return: なし
+        """
+
+        if df.empty:
+            return
+        self.merge(aggregate_partial(df))
+
+    def merge(self, partial: pd.DataFrame):
+        """
+        作成済みの部分集計を集計値に反映する
+
+        :param partial: aggregate_partial関数で作成した部分集計
+        :return: なし
+        """
+
+        self._partials.append(partial)
+        if len(self._partials) >= self._compact_every:
+            self._partials = [merge_partials(self._partials)]
+
+    def partial(self) -> pd.DataFrame:
+        """
+        現時点の部分集計を1つにまとめて返す
+
+        :return: 結合後の部分集計
+        """
+
+        self._partials = [merge_partials(self._partials)]
+        return self._partials[0]
+
+    def is_empty(self) -> bool:
+        """
+        :return: 集計値が1件も無い場合はTrue
+        """
+
+        return all(partial.empty for partial in self._partials)
+
+    def result(self) -> pd.DataFrame:
+        """
+        現時点の集計値をanalyze_df関数と同じ形式で返す
+
+        :return: 分析・集計後のデータ
+        """
+
+        return finalize_partial(self.partial())
+
+
 #ここからはテストです
 if __name__ == '__main__':
     setup_logging(level=logging.DEBUG)
@@ -67,3 +400,8 @@ if __name__ == '__main__':
 
     print(analyze_df(data))
 
+    aggregator = DailyAggregator()
+    aggregator.update(data.iloc[:2])
+    aggregator.update(data.iloc[2:])
+    print(aggregator.result())
+
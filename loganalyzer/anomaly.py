@@ -0,0 +1,262 @@
+"""
+異常傾向分析。analyze_df の集計結果に、CPU / メモリ日平均・エラー件数の直近の推移からの乖離（rolling z-score または EWMA）と、
+サーバーごとの平常時の水準（過去全体の中央値・MAD）からの乖離を列として追加し、異常なサーバー・日付を判定する。
+"""
+import logging
+import warnings
+import numpy as np
+import pandas as pd
+from loganalyzer.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# 判定対象の列と、追加する列名の接頭辞
+ANOMALY_METRICS = {'cpu_avg': 'cpu', 'memory_avg': 'memory', 'ERROR': 'error'}
+# detect_anomalies関数で追加する列
+ANOMALY_COLUMNS = [f'{prefix}_{score}' for prefix in ANOMALY_METRICS.values() for score in ['zscore', 'baseline_zscore']] \
+    + ['anomaly_score', 'anomaly']
+ANOMALY_METHODS = ('zscore', 'ewma')
+# 正規分布の標準偏差に換算するためのMADの係数
+_MAD_SCALE = 1.4826
+
+def detect_anomalies(
+        df: pd.DataFrame,
+        method: str = 'zscore',
+        window: int = 7,
+        min_periods: int = 3,
+        alpha: float = 0.3,
+        threshold: float = 3.0,
+        min_std: float = 1.0) -> pd.DataFrame:
+    """
+    分析結果に異常判定の列を追加する関数
+
+    サーバー×日付の2次元配列（行: 日付、列: サーバー）に並べ替え、全サーバー分をまとめて計算する。
+    日付は最初の日から最後の日まで連続させ、データの無い日は欠損値として扱う。
+
+    - {prefix}_zscore: 直近の推移からの乖離。method='zscore'の場合は前日までのwindow日間の平均・標準偏差、
+      method='ewma'の場合は前日までの指数加重移動平均・標準偏差（平滑化係数alpha）に対する標準化得点
+    - {prefix}_baseline_zscore: サーバーごとの全期間の中央値・MAD（標準偏差換算）に対する標準化得点
+    - anomaly_score: 項目ごとに2つの得点の小さい方（片方が欠損値の場合はもう片方）を取り、その項目間の最大値
+    - anomaly: anomaly_scoreがthreshold以上の場合True
+
+    直近の推移と平常時の水準の両方から外れた場合のみ得点が高くなるため、
+    日々のばらつき（直近の標準偏差が小さい時期の小さな変化）や、水準が変わった後も続く乖離は異常としにくい。
+
+    使用率の上昇・エラーの増加を異常とするため、得点は平常より高い場合に正となり、判定には正の値のみを使う。
+    標準偏差（MAD）がmin_std未満の場合はmin_stdとして計算する（変動の無い系列の僅かな変化を異常としないため）。
+    入力のDataFrameは変更しない。
+
+    :param df: analyze_df関数で生成された解析済みデータ
+    :param method: 直近の推移の計算方法（'zscore' または 'ewma'）
+    :param window: method='zscore'の場合の日数
+    :param min_periods: 直近の推移の計算に必要な最小日数（未満の日の得点は欠損値）
+    :param alpha: method='ewma'の場合の平滑化係数（0より大きく1以下）
+    :param threshold: 異常と判定する得点
+    :param min_std: 標準偏差の下限（使用率は%、エラーは件数の単位）
+    :return: 異常判定の列を追加した解析済みデータ
+    """
+
+    if method not in ANOMALY_METHODS:
+        raise ValueError(f'Unsupported anomaly method: {method} (expected one of {ANOMALY_METHODS})')
+    if not 0 < alpha <= 1:
+        raise ValueError(f'alpha must be in (0, 1]: {alpha}')
+
+    logger.info(f'Anomaly detection started ({method}, threshold {threshold})')
+    result = df.copy()
+    if result.empty:
+        for prefix in ANOMALY_METRICS.values():
+            result[f'{prefix}_zscore'] = pd.Series(dtype='float64')
+            result[f'{prefix}_baseline_zscore'] = pd.Series(dtype='float64')
+        result['anomaly_score'] = pd.Series(dtype='float64')
+        result['anomaly'] = pd.Series(dtype='bool')
+        return result
+
+    server_codes, servers = pd.factorize(result['server_name'])
+    days = pd.to_datetime(result['date']).to_numpy().astype('datetime64[D]').view('int64')
+    day_index = days - days.min()
+    shape = (int(day_index.max()) + 1, len(servers))
+
+    scores = []
+    for column, prefix in ANOMALY_METRICS.items():
+        if column in result.columns:
+            values = result[column].to_numpy(dtype='float64', na_value=np.nan)
+        else:
+            # 期間内にERRORが1件もない場合は集計結果に列がないため0件とする
+            values = np.zeros(len(result))
+        matrix = np.full(shape, np.nan)
+        matrix[day_index, server_codes] = values
+
+        recent_z = _recent_zscore(matrix, method, window, min_periods, alpha, min_std)
+        baseline_z = _baseline_zscore(matrix, min_std)
+        result[f'{prefix}_zscore'] = recent_z[day_index, server_codes]
+        result[f'{prefix}_baseline_zscore'] = baseline_z[day_index, server_codes]
+        # fmin / fmaxは欠損値を無視するため、全ての得点が欠損値の行（データ無し）のみ欠損値になり、異常とは判定されない
+        scores.append(np.fmin(result[f'{prefix}_zscore'].to_numpy(), result[f'{prefix}_baseline_zscore'].to_numpy()))
+
+    anomaly_score = np.fmax.reduce(np.column_stack(scores), axis=1)
+    result['anomaly_score'] = anomaly_score
+    with np.errstate(invalid='ignore'):
+        result['anomaly'] = anomaly_score >= threshold
+
+    logger.info(f'Anomaly detection completed: {int(result["anomaly"].sum())} anomalous rows '
+                f'on {result.loc[result["anomaly"], "server_name"].nunique()} servers')
+    return result
+
+
+def summarize_anomalies(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    サーバーごとの異常日数・最大得点・最後の異常日を集計する関数
+
+    :param df: detect_anomalies関数で異常判定の列を追加した解析済みデータ
+    :return: server_name, anomaly_days, max_score, last_anomalyを持ち、異常日数の多い順に並んだデータ
+    """
+
+    anomalous = df[df['anomaly']]
+    summary = anomalous.groupby('server_name', sort=False).agg(
+        anomaly_days=('anomaly', 'size'),
+        max_score=('anomaly_score', 'max'),
+        last_anomaly=('date', 'max'),
+    )
+    return summary.sort_values(['anomaly_days', 'max_score'], ascending=False).reset_index()
+
+
+def _recent_zscore(matrix: np.ndarray, method: str, window: int, min_periods: int, alpha: float,
+                   min_std: float) -> np.ndarray:
+    """
+    前日までの直近の推移に対する標準化得点を全サーバー分まとめて計算する
+
+    pandasのrolling / ewmは列（サーバー）ごとに計算されるため、日付方向の累積和（zscore）または
+    日付ごとの漸化式（ewma、日数分の反復で各回は全サーバー分をまとめて計算する）で統計量を求める。
+    結果はpandasの rolling(window, min_periods) / ewm(alpha, min_periods, ignore_na=True) の
+    平均・標準偏差（不偏）を1日ずらしたものと一致する。
+
+    :param matrix: 行が日付、列がサーバーの値（欠損値はデータの無い日）
+    :return: matrixと同じ形の標準化得点
+    """
+
+    valid = ~np.isnan(matrix)
+    # 桁落ちを避けるため、サーバーごとの平均からの差で計算する
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='Mean of empty slice', category=RuntimeWarning)
+        center = np.nan_to_num(np.nanmean(matrix, axis=0))
+    values = np.where(valid, matrix - center, 0.0)
+
+    if method == 'ewma':
+        count, mean, var = _ewm_before(values, valid, alpha)
+    else:
+        count, mean, var = _rolling_before(values, valid, window)
+
+    # 累積和の差の丸め誤差で、1件の場合に分散が0/0にならないことがあるため件数で判定する
+    std = np.where(count >= 2, np.sqrt(np.maximum(var, 0.0)), np.nan)
+    enough = count >= min_periods
+    mean = np.where(enough, mean, np.nan)
+    std = np.fmax(np.where(enough, std, np.nan), min_std)
+    return (matrix - center - mean) / std
+
+
+def _rolling_before(values: np.ndarray, valid: np.ndarray, window: int) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    各日の前日までwindow日間の件数・平均・不偏分散を累積和の差から求める
+
+    :param values: 欠損値を0にした値
+    :param valid: 値の有無
+    :return: 件数・平均・不偏分散（件数が0・1の場合の分散は使用しない）
+    """
+
+    n_days, n_servers = values.shape
+    # 累積和の先頭に0の行を加え、t行目が前日までの合計、window行前がwindow日より前までの合計になるようにする
+    padded = np.zeros((window + n_days, 3, n_servers))
+    padded[window + 1:, 0] = np.cumsum(values, axis=0)[:-1]
+    padded[window + 1:, 1] = np.cumsum(values * values, axis=0)[:-1]
+    padded[window + 1:, 2] = np.cumsum(valid, axis=0)[:-1]
+    sums, squares, counts = np.moveaxis(padded[window:] - padded[:n_days], 1, 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / counts
+        var = (squares - sums * mean) / (counts - 1)
+    return counts, mean, var
+
+
+def _ewm_before(values: np.ndarray, valid: np.ndarray, alpha: float) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    各日の前日までの指数加重の件数・平均・不偏分散を求める（欠損値の日は重みを減衰させない）
+
+    :param values: 欠損値を0にした値
+    :param valid: 値の有無
+    :return: 件数・平均・不偏分散（件数が0・1の場合の分散は使用しない）
+    """
+
+    n_servers = values.shape[1]
+    count = np.zeros(values.shape)
+    weight_sum = np.zeros(values.shape)
+    weight_square_sum = np.zeros(values.shape)
+    weighted_sum = np.zeros(values.shape)
+    weighted_square_sum = np.zeros(values.shape)
+    state = np.zeros((5, n_servers))
+    decay = np.where(valid, 1 - alpha, 1.0)
+    for day in range(len(values)):
+        count[day], weight_sum[day], weight_square_sum[day], weighted_sum[day], weighted_square_sum[day] = state
+        day_decay = decay[day]
+        state[1:] *= [day_decay, day_decay * day_decay, day_decay, day_decay]
+        day_valid = valid[day]
+        state[0] += day_valid
+        state[1] += day_valid
+        state[2] += day_valid
+        state[3] += values[day]
+        state[4] += values[day] * values[day]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = weighted_sum / weight_sum
+        biased = weighted_square_sum / weight_sum - mean * mean
+        var = biased * weight_sum * weight_sum / (weight_sum * weight_sum - weight_square_sum)
+    return count, mean, var
+
+
+def _baseline_zscore(matrix: np.ndarray, min_std: float) -> np.ndarray:
+    """
+    サーバーごとの全期間の中央値・MADに対する標準化得点を計算する
+
+    :param matrix: 行が日付、列がサーバーの値（欠損値はデータの無い日）
+    :return: matrixと同じ形の標準化得点
+    """
+
+    median = _column_median(matrix)
+    mad = _column_median(np.abs(matrix - median)) * _MAD_SCALE
+    return (matrix - median) / np.fmax(mad, min_std)
+
+
+def _column_median(matrix: np.ndarray) -> np.ndarray:
+    """
+    列ごとに欠損値を除いた中央値を求める（numpy.nanmedianは欠損値を含む2次元配列でマスク配列を経由し遅いため、
+    列ごとに並べ替えて欠損値が末尾に集まることを利用する）
+
+    :param matrix: 行が日付、列がサーバーの値
+    :return: 列ごとの中央値（値が全て欠損値の列は欠損値）
+    """
+
+    ordered = np.sort(matrix, axis=0)
+    counts = (~np.isnan(matrix)).sum(axis=0)
+    columns = np.arange(matrix.shape[1])
+    lower = ordered[np.maximum((counts - 1) // 2, 0), columns]
+    upper = ordered[counts // 2, columns]
+    return np.where(counts > 0, (lower + upper) / 2, np.nan)
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    setup_logging(level=logging.DEBUG)
+
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2026-02-01', periods=30).date
+    data = pd.DataFrame({
+        'server_name': np.repeat(['s1', 's2'], len(dates)),
+        'date': np.tile(dates, 2),
+        'ERROR': rng.poisson(2, 2 * len(dates)),
+        'cpu_avg': rng.normal(40, 3, 2 * len(dates)),
+        'memory_avg': rng.normal(60, 2, 2 * len(dates)),
+    })
+    data.loc[20, 'cpu_avg'] = 95.0
+    data.loc[45, 'ERROR'] = 40
+    detected = detect_anomalies(data)
+    print(detected[detected['anomaly']])
+    print(summarize_anomalies(detected))
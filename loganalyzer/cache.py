@@ -0,0 +1,355 @@
+"""
+ファイル単位の部分集計をキャッシュし、新規・変更ファイルのみを再解析する差分分析処理。
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Union
+import pandas as pd
+from loganalyzer.analyzer import DailyAggregator
+from loganalyzer.filters import LogFilter
+from loganalyzer.loader import collect_log_files
+from loganalyzer.logging_config import setup_logging
+from loganalyzer.streaming import aggregate_file
+
+logger = logging.getLogger(__name__)
+
+# 部分集計の形式を変更した場合は値を上げ、古いキャッシュを破棄する
+CACHE_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+
+class AggregateCache:
+    """
+    ログファイルごとの部分集計を保存するキャッシュ
+
+    キャッシュはパスをキーとし、ファイルサイズ・更新日時・内容ハッシュで有効性を判定する。
+    サイズと更新日時が一致する場合はハッシュ計算を省略し、
+    更新日時のみ異なる場合は内容ハッシュを比較して変更の有無を判定する。
+    部分集計はpickle形式、管理情報はmanifest.jsonとしてキャッシュディレクトリに保存する。
+    """
+
+    def __init__(self, cache_dir: Path):
+        """
+        :param cache_dir: キャッシュの保存先ディレクトリ
+        """
+
+        self.cache_dir = Path(cache_dir)
+        self.partial_dir = self.cache_dir / 'partials'
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self._entries: dict[str, dict] = self._load_manifest()
+
+    def _load_manifest(self) -> dict[str, dict]:
+        """
+        管理情報を読み込む。存在しない・破損している・形式が古い場合は空とする。
+
+        :return: ファイルパスをキーとした管理情報
+        """
+
+        manifest_path = self.cache_dir / MANIFEST_NAME
+        if not manifest_path.exists():
+            return {}
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Cache manifest is broken, ignoring cache: {e}')
+            return {}
+
+        if manifest.get('version') != CACHE_VERSION:
+            logger.info(f'Cache version changed, ignoring cache: {self.cache_dir.resolve()}')
+            return {}
+        return manifest.get('entries', {})
+
+    def lookup(self, file: Path) -> Union[pd.DataFrame, None]:
+        """
+        ファイルの部分集計をキャッシュから取得する
+
+        :param file: ログファイルのパス
+        :return: キャッシュ済みの部分集計、未登録または変更済みの場合はNone
+        """
+
+        entry = self.fresh_entry(file)
+        if entry is None:
+            return None
+        return self.read_partial(file, entry)
+
+    def fresh_entry(self, file: Path) -> Union[dict, None]:
+        """
+        ファイルが変更されていない場合に管理情報を返す
+
+        管理情報にはファイルに含まれるサーバー名と日付範囲も記録されているため、
+        部分集計やログファイルを開かずに絞り込み条件との一致を判定できる。
+
+        :param file: ログファイルのパス
+        :return: 管理情報、未登録または変更済みの場合はNone
+        """
+
+        entry = self._entries.get(_cache_key(file))
+        if entry is None:
+            return None
+
+        stat = file.stat()
+        if stat.st_size != entry['size']:
+            return None
+        if stat.st_mtime_ns != entry['mtime_ns']:
+            # 更新日時のみ変わった（touch・コピー等）場合は内容で判定する
+            if file_digest(file) != entry['digest']:
+                return None
+            entry['mtime_ns'] = stat.st_mtime_ns
+        return entry
+
+    def read_partial(self, file: Path, entry: dict) -> Union[pd.DataFrame, None]:
+        """
+        管理情報に対応する部分集計を読み込む
+
+        :param file: ログファイルのパス
+        :param entry: fresh_entryで取得した管理情報
+        :return: 部分集計、読込に失敗した場合はNone
+        """
+
+        try:
+            return pd.read_pickle(self.partial_dir / entry['partial'])
+        except (OSError, ValueError, EOFError) as e:
+            logger.warning(f'Failed to read cached partial for {file.resolve()}: {e}')
+            return None
+
+    def snapshot(self, file: Path) -> dict:
+        """
+        読込前のファイルのサイズ・更新日時・内容ハッシュを取得する（読込・集計後にstoreに渡す）
+
+        :param file: ログファイルのパス
+        :return: サイズ・更新日時・内容ハッシュ
+        """
+
+        stat = file.stat()
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': file_digest(file)}
+
+    def store(self, file: Path, partial: pd.DataFrame, snapshot: dict) -> bool:
+        """
+        ファイルの部分集計をキャッシュに保存する
+
+        管理情報には読込前に取得したサイズ・更新日時・内容ハッシュを記録する。
+        読込・集計中にファイルが変更された（サイズ・更新日時が読込前と異なる）場合は、
+        部分集計に含まれない行がある可能性があるため保存せず、次回に解析し直す。
+
+        :param file: ログファイルのパス
+        :param partial: ファイル全体の部分集計
+        :param snapshot: 読込前にsnapshotで取得したサイズ・更新日時・内容ハッシュ
+        :return: 保存した場合はTrue
+        """
+
+        try:
+            stat = file.stat()
+            changed = stat.st_size != snapshot['size'] or stat.st_mtime_ns != snapshot['mtime_ns']
+        except OSError:
+            changed = True
+        if changed:
+            logger.warning(f'File changed while aggregating, not caching: {file.resolve()}')
+            self.discard(file)
+            return False
+
+        key = _cache_key(file)
+        partial_name = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest() + '.pkl'
+        partial.to_pickle(self.partial_dir / partial_name)
+        self._entries[key] = {
+            'size': snapshot['size'],
+            'mtime_ns': snapshot['mtime_ns'],
+            'digest': snapshot['digest'],
+            'partial': partial_name,
+            'servers': sorted(str(server) for server in partial['server_name'].unique()),
+            'first_day': partial['date'].min().isoformat() if not partial.empty else None,
+            'last_day': partial['date'].max().isoformat() if not partial.empty else None,
+        }
+        return True
+
+    def evict_missing(self, data_dir: Path, present_files: list[Path]) -> int:
+        """
+        指定ディレクトリ配下のファイルのうち、存在しなくなったファイルのキャッシュを削除する
+
+        キャッシュは複数のディレクトリで共有できるため、他のディレクトリのファイルのキャッシュは削除しない。
+
+        :param data_dir: 走査したディレクトリのパス
+        :param present_files: 現在のdata_dir配下の読込対象ファイルのリスト
+        :return: 削除した件数
+        """
+
+        data_dir_resolved = Path(data_dir).resolve()
+        present_keys = {_cache_key(file) for file in present_files}
+        stale_keys = [
+            key for key in self._entries
+            if key not in present_keys and Path(key).is_relative_to(data_dir_resolved)
+        ]
+        for key in stale_keys:
+            entry = self._entries.pop(key)
+            (self.partial_dir / entry['partial']).unlink(missing_ok=True)
+            logger.info(f'Evicted cache entry: {key}')
+        return len(stale_keys)
+
+    def discard(self, file: Path):
+        """
+        ファイルのキャッシュを削除する（読込・解析に失敗した変更済みファイル用）
+
+        :param file: ログファイルのパス
+        :return: なし
+        """
+
+        entry = self._entries.pop(_cache_key(file), None)
+        if entry is not None:
+            (self.partial_dir / entry['partial']).unlink(missing_ok=True)
+
+    def save(self):
+        """
+        管理情報を保存する。書き込み途中の破損を避けるため一時ファイルから置き換える。
+
+        :return: なし
+        """
+
+        manifest_path = self.cache_dir / MANIFEST_NAME
+        tmp_path = manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'entries': self._entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+
+
+def analyze_cached(
+        data_dir : Path,
+        cache_dir : Path,
+        chunksize : Union[int, None] = None,
+        log_filter : Union[LogFilter, None] = None) -> pd.DataFrame:
+    """
+    キャッシュを利用して指定ディレクトリのログを差分分析する関数
+
+    新規・変更ファイルのみを読込・クレンジング・部分集計してキャッシュに保存し、
+    未変更ファイルはキャッシュ済みの部分集計を使用する。
+    data_dir配下の削除されたファイルのキャッシュは破棄する（他のディレクトリのキャッシュは残す）。
+    結果はanalyze_df関数で全ファイルを処理した場合と同じ形式になる。
+
+    絞り込み条件を指定した場合、パスまたは記録済みのサーバー名・日付範囲が一致しないファイルは開かない。
+    期間の境界が日付単位の場合は部分集計を日付で絞り込み、
+    時刻を含む場合は対象ファイルを条件付きで解析する（この結果はキャッシュしない）。
+
+    :param data_dir:　ログデータが格納されているディレクトリのパス
+    :param cache_dir:　キャッシュの保存先ディレクトリのパス
+    :param chunksize:　CSVの1チャンクあたりの行数、指定しない場合はファイル単位で処理する
+    :param log_filter:　絞り込み条件、指定しない場合は全行を対象とする
+    :return:　分析・集計後のデータ
+    """
+
+    data_dir_resolved = data_dir.resolve()
+    logger.info(f'Cached analysis started: {data_dir_resolved}')
+
+    cache = AggregateCache(cache_dir)
+    target_files = collect_log_files(data_dir)
+    # 絞り込みで対象外になったファイルのキャッシュを消さないよう、削除判定は全ファイルで行う
+    cache.evict_missing(data_dir, target_files)
+    if log_filter is not None and log_filter.is_active():
+        target_files = [file for file in target_files if log_filter.match_file(file)]
+    else:
+        log_filter = None
+    partial_filterable = log_filter is None or log_filter.is_day_aligned()
+
+    aggregator = DailyAggregator()
+    loaded_count = 0
+    hit_count = 0
+    pruned_count = 0
+    for file in target_files:
+        entry = cache.fresh_entry(file)
+        if entry is not None and log_filter is not None and not _entry_matches(entry, log_filter):
+            loaded_count += 1
+            pruned_count += 1
+            continue
+
+        partial = cache.read_partial(file, entry) if entry is not None and partial_filterable else None
+        if partial is not None:
+            hit_count += 1
+        elif partial_filterable:
+            # 集計中の追記を検出できるよう、サイズ・更新日時・内容ハッシュは読込前に取得する
+            snapshot = cache.snapshot(file)
+            file_aggregator = aggregate_file(file, chunksize)
+            if file_aggregator is None:
+                cache.discard(file)
+                continue
+            partial = file_aggregator.partial()
+            cache.store(file, partial, snapshot)
+            if partial.empty:
+                logger.error(f'No data found from file after parsing: {file.resolve()}')
+        else:
+            file_aggregator = aggregate_file(file, chunksize, log_filter)
+            if file_aggregator is None:
+                continue
+            partial = file_aggregator.partial()
+
+        loaded_count += 1
+        if log_filter is not None and partial_filterable:
+            partial = log_filter.filter_partial(partial)
+        if not partial.empty:
+            aggregator.merge(partial)
+
+    cache.save()
+    logger.info(f'Cache hits: {hit_count}, pruned: {pruned_count}, parsed: {loaded_count - hit_count - pruned_count}')
+
+    if loaded_count == 0:
+        logger.error(f'No csv or json file in directory: {data_dir_resolved}')
+        raise FileNotFoundError(f'No csv or json file in directory: {data_dir_resolved}')
+    if aggregator.is_empty():
+        logger.error(f'All files are empty or empty after parsing')
+        raise RuntimeError(f'All files are empty or empty after parsing')
+
+    logger.info(f'Cached analysis completed: {loaded_count} files')
+    return aggregator.result()
+
+
+def _entry_matches(entry : dict, log_filter : LogFilter) -> bool:
+    """
+    キャッシュに記録済みのサーバー名・日付範囲が絞り込み条件と重なるか判定する関数
+
+    :param entry:　キャッシュの管理情報
+    :param log_filter:　絞り込み条件
+    :return:　重なる可能性がある場合はTrue（記録が無い場合もTrue）
+    """
+
+    servers = entry.get('servers')
+    if servers is not None and log_filter.servers is not None and log_filter.servers.isdisjoint(servers):
+        return False
+    if entry.get('first_day') is None or entry.get('last_day') is None:
+        return servers is None
+    return log_filter.match_days(
+        datetime.date.fromisoformat(entry['first_day']),
+        datetime.date.fromisoformat(entry['last_day'])
+    )
+
+
+def file_digest(file : Path) -> str:
+    """
+    ファイル内容のハッシュ値を計算する関数
+
+    :param file:　対象ファイルのパス
+    :return:　16進文字列のハッシュ値
+    """
+
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file, 'rb') as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_key(file : Path) -> str:
+    """
+    :param file:　ログファイルのパス
+    :return:　キャッシュのキー（絶対パス文字列）
+    """
+
+    return str(file.resolve())
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    setup_logging(level=logging.DEBUG)
+    sample_dir = Path(__file__).parent.parent / 'data' / 'sample_logs'
+    test_cache_dir = Path(__file__).parent.parent / 'data' / 'cache'
+    print(analyze_cached(sample_dir, test_cache_dir))
+    print(analyze_cached(sample_dir, test_cache_dir))
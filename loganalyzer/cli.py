@@ -0,0 +1,257 @@
+"""
+コマンドラインのエントリポイント（python -m loganalyzer）。サブコマンドで集計結果の表示（analyze）・Excel出力（export）・グラフ生成（plot）を行う。
+--result-storeを指定すると集計結果をSQLiteに保存し、serveでパイプラインを再実行せずに保存済みの集計結果をHTTPで返す。
+
+pandas・openpyxl・matplotlibは読込に時間がかかるため、モジュールの読込時には標準ライブラリのみを読み込み、
+サブコマンドの実行時に必要なモジュールのみを読み込む（--helpや引数の誤りの場合はpandasも読み込まない）。
+
+実行例:
+    python -m loganalyzer analyze data/sample_logs --since 2026-02-01 --servers srv1 srv2
+    python -m loganalyzer export data/sample_logs --mode workbook --output-dir data/output
+    python -m loganalyzer plot data/sample_logs --per-server
+    python -m loganalyzer analyze data/sample_logs --result-store data/output/results.sqlite
+    python -m loganalyzer serve data/output/results.sqlite --port 8081
+"""
+import argparse
+import datetime
+import logging
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from loganalyzer.filters import LogFilter
+
+logger = logging.getLogger(__name__)
+
+# ログ出力レベル
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+# analyzeの表示形式
+OUTPUT_FORMATS = ('table', 'csv')
+# exporter.EXPORT_MODESと同じ（引数の解析時にpandasを読み込まないよう値を持つ）
+EXPORT_MODES = ('files', 'workbook')
+
+def main(argv: Union[list[str], None] = None) -> int:
+    """
+    コマンドライン引数を解析し、サブコマンドを実行する関数
+
+    :param argv: コマンドライン引数、指定しない場合はsys.argv[1:]
+    :return: 終了コード（成功時は0、ログの読込に失敗した場合は1）
+    """
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is run_serve:
+        # 保存済みの集計結果を返すのみのため、ログの集計は行わない
+        if not args.store.exists():
+            parser.error(f'{args.store} does not exist')
+        from loganalyzer.logging_config import setup_logging
+        setup_logging(log_dir=args.log_dir, level=getattr(logging, args.log_level))
+        run_serve(None, args)
+        return 0
+    if not args.data_dir.exists():
+        parser.error(f'{args.data_dir} does not exist')
+
+    from loganalyzer.filters import LogFilter
+    from loganalyzer.instrumentation import Instrumentation, activate
+    from loganalyzer.logging_config import setup_logging
+
+    try:
+        log_filter = LogFilter(since=args.since, until=args.until, servers=args.servers,
+                               prune_by_file_name=args.prune_by_file_name)
+    except ValueError as e:
+        # sinceがuntil以降の場合
+        parser.error(str(e))
+
+    setup_logging(log_dir=args.log_dir, level=getattr(logging, args.log_level))
+    instrumentation = None
+    if args.report:
+        from loganalyzer.exporter import DEFAULT_OUTPUT_DIR
+        instrumentation = Instrumentation(DEFAULT_OUTPUT_DIR if args.output_dir is None else args.output_dir)
+        activate(instrumentation)
+
+    try:
+        analyzed_df = analyze(args, log_filter)
+        args.command(analyzed_df, args)
+    except (FileNotFoundError, RuntimeError) as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 1
+    finally:
+        if instrumentation is not None:
+            activate(None)
+            instrumentation.write_report()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    サブコマンドごとの引数を定義したパーサーを作成する関数
+
+    :return: 引数のパーサー
+    """
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('data_dir', type=Path, help='ログデータが格納されているディレクトリ')
+    common.add_argument('--since', type=timestamp_arg,
+                        help="対象期間の開始（'YYYY-MM-DD' または 'YYYY-MM-DD HH:MM:SS'）")
+    common.add_argument('--until', type=timestamp_arg, help='対象期間の終了（日付のみの場合はその日の終わりまで）')
+    common.add_argument('--servers', nargs='+', metavar='SERVER', help='対象サーバー名')
+    common.add_argument('--prune-by-file-name', action='store_true',
+                        help='ファイル名中の日付が1つだけのファイルを、その日付が対象期間外の場合は読み込まない')
+    common.add_argument('--workers', type=int, help='ログファイル並列読込のワーカー数')
+    mode = common.add_mutually_exclusive_group()
+    mode.add_argument('--stream', action='store_true', help='生データを保持せずファイル・チャンク単位で集計する')
+    mode.add_argument('--cache-dir', type=Path, help='ファイル単位の部分集計キャッシュの保存先')
+    mode.add_argument('--shard-workers', type=int, help='サーバー単位のシャードに分けて並列に集計するプロセス数')
+    common.add_argument('--chunksize', type=int, help='--stream・--cache-dirの場合のCSVの1チャンクあたりの行数')
+    common.add_argument('--no-anomaly', dest='detect_anomaly', action='store_false', help='異常判定を行わない')
+    common.add_argument('--output-dir', type=Path, help='Excel・グラフ・実行レポートの出力先（既定はdata/output）')
+    common.add_argument('--report', action='store_true', help='実行レポート（JSON）を出力先に保存する')
+    common.add_argument('--result-store', type=Path, help='集計結果を保存するSQLiteファイル（serveで問い合わせできる）')
+    common.add_argument('--log-dir', type=Path, help='このプログラムのログ保存先（既定はlogs）')
+    common.add_argument('--log-level', choices=LOG_LEVELS, default='WARNING', help='このプログラムのログのレベル')
+
+    parser = argparse.ArgumentParser(prog='loganalyzer', description='運用ログの集計・Excel出力・グラフ生成')
+    subparsers = parser.add_subparsers(required=True, metavar='command')
+
+    analyze_parser = subparsers.add_parser('analyze', parents=[common], help='サーバー・日別の集計結果を表示する')
+    analyze_parser.add_argument('--format', choices=OUTPUT_FORMATS, default='table', help='表示形式')
+    analyze_parser.add_argument('-o', '--output', type=Path, help='表示せずにファイルに保存する')
+    analyze_parser.set_defaults(command=run_analyze)
+
+    export_parser = subparsers.add_parser('export', parents=[common], help='集計結果をExcelに出力する')
+    export_parser.add_argument('--mode', choices=EXPORT_MODES, default='files',
+                               help="'files': サーバーごとに1ファイル、'workbook': 1ファイルにサーバーごとのシート")
+    export_parser.add_argument('--export-workers', type=int, help="--mode filesの場合の並列書込のプロセス数")
+    export_parser.set_defaults(command=run_export)
+
+    plot_parser = subparsers.add_parser('plot', parents=[common], help='集計結果のグラフを生成する')
+    plot_parser.add_argument('--chart-workers', type=int, help='グラフの並列描画のプロセス数')
+    plot_parser.add_argument('--per-server', action='store_true', help='サーバーごとのグラフも生成する')
+    plot_parser.set_defaults(command=run_plot)
+
+    serve_parser = subparsers.add_parser('serve', help='保存済みの集計結果をHTTPで返す（Ctrl+Cで終了）')
+    serve_parser.add_argument('store', type=Path, help='--result-storeで保存したSQLiteファイル')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='待ち受けるアドレス')
+    serve_parser.add_argument('--port', type=int, default=8081, help='待ち受けるポート番号')
+    serve_parser.add_argument('--log-dir', type=Path, help='このプログラムのログ保存先（既定はlogs）')
+    serve_parser.add_argument('--log-level', choices=LOG_LEVELS, default='INFO', help='このプログラムのログのレベル')
+    serve_parser.set_defaults(command=run_serve)
+    return parser
+
+
+def timestamp_arg(value: str) -> str:
+    """
+    --since・--untilの値が日付または日時として解釈できるか確認する関数（pandasを読み込まずに標準ライブラリで判定する）
+
+    :param value: 引数の値
+    :return: 引数の値（そのまま）
+    """
+
+    try:
+        datetime.datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid date or datetime: '{value}' (expected 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS')"
+        ) from None
+    return value
+
+
+def analyze(args: argparse.Namespace, log_filter: 'LogFilter') -> 'pd.DataFrame':
+    """
+    引数で指定された処理方式でログを集計する関数（処理方式の選択はmain.pyと共通のpipeline.analyze_logsで行う）
+
+    :param args: コマンドライン引数
+    :param log_filter: 引数から作成した絞り込み条件
+    :return: 分析・集計後のデータ（--no-anomalyを指定しない場合は異常判定の列を含む）
+    """
+
+    from loganalyzer.pipeline import analyze_logs
+
+    if log_filter.is_active():
+        logger.info(f'Filter: {log_filter}')
+    return analyze_logs(
+        args.data_dir, log_filter, workers=args.workers, stream=args.stream, chunksize=args.chunksize,
+        cache_dir=args.cache_dir, shard_workers=args.shard_workers, detect_anomaly=args.detect_anomaly,
+        result_store=args.result_store
+    )
+
+
+def run_analyze(analyzed_df: 'pd.DataFrame', args: argparse.Namespace):
+    """
+    集計結果を表形式またはCSVで標準出力（--outputを指定した場合はファイル）に書き出す関数
+
+    :param analyzed_df: 分析・集計後のデータ
+    :param args: コマンドライン引数
+    :return: なし
+    """
+
+    if args.format == 'csv':
+        text = analyzed_df.to_csv(index=False)
+    else:
+        text = analyzed_df.to_string(index=False) + '\n'
+    if args.output is None:
+        sys.stdout.write(text)
+    else:
+        args.output.write_text(text, encoding='utf-8')
+        logger.info(f'Result saved to {args.output.resolve()}')
+
+
+def run_export(analyzed_df: 'pd.DataFrame', args: argparse.Namespace):
+    """
+    集計結果をExcelに出力し、出力したファイルパスを表示する関数（openpyxlはここで初めて読み込まれる）
+
+    :param analyzed_df: 分析・集計後のデータ
+    :param args: コマンドライン引数
+    :return: なし
+    """
+
+    from loganalyzer.exporter import export_result
+    from loganalyzer.instrumentation import stage
+
+    with stage('export') as record:
+        record.rows_in = len(analyzed_df)
+        files = export_result(analyzed_df, args.output_dir, mode=args.mode, workers=args.export_workers)
+        record.files = len(files)
+    for file in files:
+        print(file)
+
+
+def run_plot(analyzed_df: 'pd.DataFrame', args: argparse.Namespace):
+    """
+    集計結果のグラフを生成し、画像のファイルパスを表示する関数（matplotlibは描画する場合のみ読み込まれる）
+
+    :param analyzed_df: 分析・集計後のデータ
+    :param args: コマンドライン引数
+    :return: なし
+    """
+
+    from loganalyzer.instrumentation import stage
+    from loganalyzer.visualizer import visualize_result
+
+    with stage('visualize') as record:
+        record.rows_in = len(analyzed_df)
+        files = visualize_result(analyzed_df, args.output_dir, workers=args.chart_workers, per_server=args.per_server)
+        record.files = len(files)
+    for file in files:
+        print(file)
+
+
+def run_serve(analyzed_df: None, args: argparse.Namespace):
+    """
+    保存済みの集計結果の問い合わせに答えるHTTPサーバーを起動する関数（Ctrl+Cで終了するまで戻らない）
+
+    :param analyzed_df: 使用しない（集計は行わない）
+    :param args: コマンドライン引数
+    :return: なし
+    """
+
+    from loganalyzer.results import serve_results
+
+    serve_results(args.store, host=args.host, port=args.port)
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:] or ['analyze', str(Path(__file__).parent.parent / 'data' / 'sample_logs')]))
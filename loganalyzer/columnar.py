@@ -0,0 +1,277 @@
+"""
+クレンジング済みログを列指向形式（Parquet / Feather）でサーバー・日付別に分割保存し、列の射影・パーティション絞り込み付きで読み込む。
+"""
+import datetime
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Iterable, Union
+from urllib.parse import quote, unquote
+import pandas as pd
+from loganalyzer.loader import collect_log_files, read_log_file
+from loganalyzer.logging_config import setup_logging
+from loganalyzer.parser import ANALYSIS_COLUMNS, LOG_DTYPES, parse_one
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+SOURCES_NAME = '_sources.json'
+# 列指向形式で保持する型（文字列列はカテゴリ型で辞書エンコードする）
+STORE_DTYPES = {'server_name': 'category', 'level': 'category'}
+# 保存先から読み込んだtimestampの型（Parquet / Featherの日時型）
+STORE_TIMESTAMP_DTYPE = 'datetime64[us]'
+
+def convert_to_store(data_dir : Path, store_dir : Path, fmt : str = 'parquet') -> int:
+    """
+    指定ディレクトリのログファイルをクレンジングし、列指向形式の保存先に変換する関数
+
+    ファイルごとにparse_oneでクレンジングした上で、
+    store_dir/server_name=<サーバー名>/date=<YYYY-MM-DD>/<元ファイルID>.<拡張子> に分割して保存する。
+    server_name・levelはカテゴリ型、timestampは日時型で保存する。
+
+    変換済みの元ファイルはサイズ・更新日時を記録し、変更が無い場合は再変換しない。
+    変更・削除された元ファイルの変換結果は削除する。
+    読込・解析に失敗したファイルはログに記録した上でスキップする。
+
+    :param data_dir:　ログデータが格納されているディレクトリのパス
+    :param store_dir:　列指向形式の保存先ディレクトリのパス
+    :param fmt:　保存形式（'parquet' または 'feather'）
+    :return:　今回変換したファイル数
+    """
+
+    _require_pyarrow()
+    if fmt not in STORE_FORMATS:
+        raise ValueError(f'Unsupported store format: {fmt}')
+
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    logger.info(f'Converting {data_dir.resolve()} to {fmt} store: {store_dir.resolve()}')
+
+    sources = _load_sources(store_dir)
+    target_files = [file for file in collect_log_files(data_dir) if not _is_inside(file, store_dir)]
+    target_keys = {str(file.resolve()) for file in target_files}
+    for key in [key for key in sources if key not in target_keys]:
+        _remove_parts(store_dir, sources.pop(key))
+        logger.info(f'Removed converted data of deleted file: {key}')
+
+    converted_count = 0
+    for file in target_files:
+        key = str(file.resolve())
+        stat = file.stat()
+        source = sources.get(key)
+        if source and source['size'] == stat.st_size and source['mtime_ns'] == stat.st_mtime_ns \
+                and source['format'] == fmt:
+            continue
+
+        try:
+            df = read_log_file(file)
+            parsed_df = parse_one(df, file)
+        except (ValueError, TypeError, KeyError):
+            logger.exception(f'Failed to convert file: {file.resolve()}')
+            continue
+        except Exception as e:
+            logger.error(f'Failed to read {file.resolve()}: {e}')
+            continue
+
+        if source:
+            _remove_parts(store_dir, source)
+        parts = write_partitions(parsed_df, store_dir, _source_id(key), fmt)
+        sources[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'format': fmt, 'parts': parts}
+        converted_count += 1
+
+    _save_sources(store_dir, sources)
+    logger.info(f'Converted {converted_count} files to {fmt} store')
+    return converted_count
+
+
+def write_partitions(df : pd.DataFrame, store_dir : Path, part_name : str, fmt : str = 'parquet') -> list[str]:
+    """
+    クレンジング済みログをサーバー・日付別に分割して保存する関数
+
+    :param df:　parse_oneでクレンジング済みのログデータ
+    :param store_dir:　列指向形式の保存先ディレクトリのパス
+    :param part_name:　分割ファイル名（拡張子なし）、同名ファイルは上書きする
+    :param fmt:　保存形式（'parquet' または 'feather'）
+    :return:　保存したファイルのstore_dirからの相対パスのリスト
+    """
+
+    if df.empty:
+        return []
+    df = df.astype(STORE_DTYPES)
+    parts: list[str] = []
+    dates = df['timestamp'].dt.strftime('%Y-%m-%d')
+    for (server_name, date), part_df in df.groupby([df['server_name'], dates], observed=True, sort=True):
+        part_dir = store_dir / f'server_name={quote(str(server_name), safe="")}' / f'date={date}'
+        part_dir.mkdir(parents=True, exist_ok=True)
+        part_path = part_dir / f'{part_name}{STORE_FORMATS[fmt]}'
+        part_df = part_df.reset_index(drop=True)
+        if fmt == 'parquet':
+            part_df.to_parquet(part_path, index=False)
+        else:
+            part_df.to_feather(part_path)
+        parts.append(part_path.relative_to(store_dir).as_posix())
+    return parts
+
+
+def load_store(
+        store_dir : Path,
+        columns : Union[list[str], None] = None,
+        servers : Union[Iterable[str], None] = None,
+        since : Union[datetime.date, str, None] = None,
+        until : Union[datetime.date, str, None] = None) -> pd.DataFrame:
+    """
+    列指向形式の保存先からクレンジング済みログを読み込む関数
+
+    ディレクトリ名（server_name=… / date=…）でサーバー・日付を判定し、
+    条件に一致しないパーティションのファイルは開かない。
+    各ファイルからはcolumnsで指定した列のみを読み込む。
+    server_name・levelはカテゴリ型で返す。
+    一致するパーティションが無い場合も、列の型（LOG_DTYPES・日時型）を揃えた空のデータを返す。
+
+    :param store_dir:　列指向形式の保存先ディレクトリのパス
+    :param columns:　読み込む列、指定しない場合は集計に必要な列（messageを除く）
+    :param servers:　対象サーバー名、指定しない場合は全サーバー
+    :param since:　対象期間の開始日（この日を含む）
+    :param until:　対象期間の終了日（この日を含む）
+    :return:　クレンジング済みログデータ（analyze_dfにそのまま渡せる）
+    """
+
+    _require_pyarrow()
+    store_dir = Path(store_dir)
+    columns = list(columns) if columns is not None else ANALYSIS_COLUMNS
+    logger.info(f'Loading store: {store_dir.resolve()}')
+
+    part_files = list_partitions(store_dir, servers=servers, since=since, until=until)
+    df_list = [read_log_file(part_file, columns=columns) for part_file in part_files]
+    logger.info(f'Loaded {len(df_list)} partition files from store')
+    if not df_list:
+        dtypes = {**LOG_DTYPES, 'timestamp': STORE_TIMESTAMP_DTYPE}
+        return pd.DataFrame({col: pd.Series(dtype=dtypes.get(col, 'object')) for col in columns})
+
+    df = pd.concat(df_list, ignore_index=True)
+    # ファイル間でカテゴリが異なると連結時に文字列型に戻るため、カテゴリ型に揃え直す
+    return df.astype({col: dtype for col, dtype in STORE_DTYPES.items() if col in df.columns})
+
+
+def list_partitions(
+        store_dir : Path,
+        servers : Union[Iterable[str], None] = None,
+        since : Union[datetime.date, str, None] = None,
+        until : Union[datetime.date, str, None] = None) -> list[Path]:
+    """
+    条件に一致するパーティションのファイルを列挙する関数
+
+    サーバーで絞り込んだ後に日付ディレクトリを走査するため、対象外のサーバーは走査しない。
+
+    :param store_dir:　列指向形式の保存先ディレクトリのパス
+    :param servers:　対象サーバー名、指定しない場合は全サーバー
+    :param since:　対象期間の開始日（この日を含む）
+    :param until:　対象期間の終了日（この日を含む）
+    :return:　ファイルパスのリスト（サーバー名・日付順）
+    """
+
+    server_set = set(servers) if servers is not None else None
+    since_str = str(since) if since is not None else None
+    until_str = str(until) if until is not None else None
+
+    part_files: list[Path] = []
+    for server_dir in sorted(Path(store_dir).glob('server_name=*')):
+        server_name = unquote(server_dir.name.split('=', 1)[1])
+        if server_set is not None and server_name not in server_set:
+            continue
+        for date_dir in sorted(server_dir.glob('date=*')):
+            # 日付はYYYY-MM-DD形式のため文字列比較で範囲判定できる
+            date = date_dir.name.split('=', 1)[1]
+            if since_str is not None and date < since_str:
+                continue
+            if until_str is not None and date > until_str:
+                continue
+            part_files.extend(sorted(
+                file for file in date_dir.iterdir() if file.suffix in STORE_FORMATS.values()
+            ))
+    return part_files
+
+
+def _require_pyarrow():
+    """
+    列指向形式の読み書きに必要なpyarrowが利用可能か確認する
+
+    :return: なし
+    """
+
+    if importlib.util.find_spec('pyarrow') is None:
+        raise ImportError('pyarrow is required for the columnar store: pip install pyarrow')
+
+
+def _source_id(key : str) -> str:
+    """
+    :param key:　元ファイルの絶対パス文字列
+    :return:　分割ファイル名に使う元ファイルID
+    """
+
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def _is_inside(file : Path, directory : Path) -> bool:
+    """
+    :param file:　対象ファイルのパス
+    :param directory:　ディレクトリのパス
+    :return:　fileがdirectory配下にある場合はTrue（保存先を入力ディレクトリ内に置いた場合の再変換防止）
+    """
+
+    return file.resolve().is_relative_to(directory.resolve())
+
+
+def _load_sources(store_dir : Path) -> dict[str, dict]:
+    """
+    :param store_dir:　列指向形式の保存先ディレクトリのパス
+    :return:　変換済み元ファイルの管理情報
+    """
+
+    sources_path = store_dir / SOURCES_NAME
+    if not sources_path.exists():
+        return {}
+    try:
+        with open(sources_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f'Store source list is broken, converting all files again: {e}')
+        return {}
+
+
+def _save_sources(store_dir : Path, sources : dict[str, dict]):
+    """
+    :param store_dir:　列指向形式の保存先ディレクトリのパス
+    :param sources:　変換済み元ファイルの管理情報
+    :return:　なし
+    """
+
+    sources_path = store_dir / SOURCES_NAME
+    tmp_path = sources_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(sources, f, ensure_ascii=False)
+    os.replace(tmp_path, sources_path)
+
+
+def _remove_parts(store_dir : Path, source : dict):
+    """
+    :param store_dir:　列指向形式の保存先ディレクトリのパス
+    :param source:　元ファイルの管理情報
+    :return:　なし
+    """
+
+    for part in source.get('parts', []):
+        (store_dir / part).unlink(missing_ok=True)
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    setup_logging(level=logging.DEBUG)
+    sample_dir = Path(__file__).parent.parent / 'data' / 'sample_logs'
+    test_store_dir = Path(__file__).parent.parent / 'data' / 'store'
+    convert_to_store(sample_dir, test_store_dir)
+    print(load_store(test_store_dir))
+    print(load_store(test_store_dir, servers=['srv1'], since='2026-02-02', until='2026-02-03'))
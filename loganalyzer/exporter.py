@@ -1,49 +1,95 @@
 """
 集計結果をサーバーごとにシート分けして Excel で出力。保存先は data/output。
 """
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
+import itertools
+import re
+import numpy as np
 import pandas as pd
 import logging
 from pathlib import Path
+from typing import Iterable, Iterator, Union
 from loganalyzer.analyzer import analyze_df
+from loganalyzer.anomaly import summarize_anomalies
 from loganalyzer.logging_config import setup_logging
 
 logger = logging.getLogger(__name__)
 
-def export_result(df : pd.DataFrame):
+# 出力モード（'files': サーバーごとに1ファイル、'workbook': 1ファイルにサーバーごとのシート）
+EXPORT_MODES = ('files', 'workbook')
+# 既定の出力先
+DEFAULT_OUTPUT_DIR = Path(__file__).parent.parent / 'data' / 'output'
+# Excelのシート名に使用できない文字と最大長
+_INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+_MAX_SHEET_NAME_LENGTH = 31
+# 異常日数の一覧のシート名（mode='files'の場合はファイル名の先頭）
+ANOMALY_SHEET_NAME = 'anomalies'
+# DataFrameをExcelの行に変換する単位の行数（全行のリストを作らずに変換する）
+_ROW_BLOCK_SIZE = 10000
+
+def export_result(df : pd.DataFrame, output_dir : Union[Path, None] = None, mode : str = 'files',
+                  workers : Union[int, None] = None) -> list[Path]:
     """
     解析済みデータをExcelファイルとして出力する関数
 
     出力用ディレクトリを作成する（存在しない場合）
-    元のDataFrameをコピーしてから処理を行う（元データを変更せずvisualizerに渡すため）
-    date列を「YYYY-MM-DD」形式の文字列に変換する
+    元のDataFrameは変更しない（visualizerに渡すため）
+    date列を「YYYY-MM-DD」形式の文字列に一括変換する
     サーバー名ごとにデータを分割し、Excelファイルとして保存する
 
+    mode='files'の場合はサーバーごとに1ファイルを出力する。workersに2以上を指定した場合はプロセスを分けて並列に書き込む。
+    mode='workbook'の場合は1つのブックにサーバーごとのシートを追加して出力する。
+    いずれもopenpyxlの書込専用モードで行を逐次書き込み、行はシートを書き込む時点でサーバーごとに少しずつ変換するため、
+    セル・全サーバーの行を保持せず一定のメモリで出力できる。
+    異常判定（detect_anomalies関数）の列がある場合は、サーバーごとの異常日数の一覧も出力する
+    （mode='workbook'の場合は先頭のシート、mode='files'の場合は別ファイル「anomalies_YYYYMMDD_summary.xlsx」。
+    サーバーごとのファイル名は必ず「_YYYYMMDD.xlsx」で終わるため、どのサーバー名とも重ならない）。
+
     :param df: analyze_df関数で生成された解析済みデータ
-    :return: なし
+    :param output_dir: 出力先のディレクトリのパス、指定しない場合はdata/output
+    :param mode: 出力モード（'files' または 'workbook'）
+    :param workers: mode='files'の場合の並列書込のプロセス数、指定しない場合（または1以下）は逐次書込
+    :return: 出力したファイルパスのリスト
     """
+    if mode not in EXPORT_MODES:
+        raise ValueError(f'Unsupported export mode: {mode} (expected one of {EXPORT_MODES})')
+
     logger.info(f'Export started')
     df_copy = df.copy()
     try:
-        df_copy['date'] = df_copy['date'].apply(lambda x: x.strftime('%Y-%m-%d'))
-    except (KeyError, TypeError):
+        df_copy['date'] = format_dates(df_copy['date'])
+    except (KeyError, TypeError, ValueError):
         logger.exception('Date column is invalid')
 
-    output_dir = Path(__file__).parent.parent / 'data' / 'output'
+    output_dir = DEFAULT_OUTPUT_DIR if output_dir is None else Path(output_dir)
     try:
         output_dir.mkdir(parents=True, exist_ok=True)
         today = datetime.today().strftime('%Y%m%d')
+        header = [str(col) for col in df_copy.columns]
+        grouped = df_copy.groupby('server_name', sort=True)
+        server_names = [str(server_name) for server_name in grouped.groups]
+        summary = _anomaly_summary(df_copy)
 
-        for server_name, df_by_server in df_copy.groupby('server_name'):
-            filename = output_dir / f'{server_name}_{today}.xlsx'
-            logger.info(f'Exporting {server_name} data to {filename}')
-            df_by_server.to_excel(
-                filename,
-                index = False,
-                sheet_name = str(server_name),
-                header = True
-            )
-            logger.info(f'{server_name} data exported')
+        if mode == 'workbook':
+            filename = output_dir / f'report_{today}.xlsx'
+            logger.info(f'Exporting {len(server_names)} servers to {filename}')
+            summary_names = [ANOMALY_SHEET_NAME] if summary is not None else []
+            sheet_names = sheet_titles(summary_names + server_names)
+            # 各サーバーの行はそのシートを書き込む時点で生成する
+            workbook_sheets = ((sheet_name, header, _iter_rows(df_by_server))
+                               for sheet_name, (_, df_by_server) in zip(sheet_names[len(summary_names):], grouped))
+            if summary is not None:
+                workbook_sheets = itertools.chain([(sheet_names[0], *summary)], workbook_sheets)
+            write_workbook(filename, workbook_sheets)
+            exported = [filename]
+        else:
+            exported = _export_files(grouped, server_names, header, output_dir, today, workers)
+            if summary is not None:
+                filename = output_dir / f'{ANOMALY_SHEET_NAME}_{today}_summary.xlsx'
+                logger.info(f'Exporting anomaly summary to {filename}')
+                write_workbook(filename, [(ANOMALY_SHEET_NAME, *summary)])
+                exported.append(filename)
 
     except (OSError, MemoryError) as e:
         logger.exception(f'Export failed:{e}')
@@ -51,6 +97,157 @@ def export_result(df : pd.DataFrame):
 
     else:
         logger.info(f'Export completed')
+    return exported
+
+
+def format_dates(dates : pd.Series) -> pd.Series:
+    """
+    日付の列を「YYYY-MM-DD」形式の文字列に一括変換する関数
+
+    行ごとのstrftimeではなく、datetime64[D]の配列に変換してnumpyで文字列化する。
+    欠損値は空文字列とする。
+
+    :param dates: datetime.dateまたは日時型の列
+    :return: 文字列に変換した列
+    """
+    timestamps = pd.to_datetime(dates)
+    if isinstance(timestamps.dtype, pd.DatetimeTZDtype):
+        timestamps = timestamps.dt.tz_localize(None)
+    days = timestamps.to_numpy().astype('datetime64[D]')
+    formatted = days.astype(str)
+    formatted[np.isnat(days)] = ''
+    return pd.Series(formatted, index=dates.index, dtype=object)
+
+
+def sheet_titles(server_names : Iterable[str]) -> list[str]:
+    """
+    サーバー名からExcelのシート名を作成する関数
+
+    シート名に使用できない文字は「_」に置換し、31文字に切り詰める。
+    置換・切り詰めにより重複した場合は末尾に連番を付ける。
+
+    :param server_names: サーバー名
+    :return: サーバー名と同じ順のシート名のリスト
+    """
+    titles: list[str] = []
+    used: set[str] = set()
+    for server_name in server_names:
+        title = _INVALID_SHEET_CHARS.sub('_', server_name)[:_MAX_SHEET_NAME_LENGTH].strip("'") or 'sheet'
+        candidate, n = title, 1
+        while candidate.lower() in used:
+            suffix = f'_{n}'
+            candidate = title[:_MAX_SHEET_NAME_LENGTH - len(suffix)] + suffix
+            n += 1
+        used.add(candidate.lower())
+        titles.append(candidate)
+    return titles
+
+
+def write_workbook(filename : Path, sheets : Iterable[tuple[str, list[str], Iterable[list]]]):
+    """
+    書込専用モードのブックにシートを順に書き込んで保存する関数
+
+    シート・行はイテレータでもよく、書き込む時点で1つずつ取り出す。
+
+    :param filename: 出力ファイルパス
+    :param sheets: （シート名, ヘッダー, 行）の並び
+    :return: なし
+    """
+    # openpyxlは読込に時間がかかるため、書き込む場合のみ読み込む
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for sheet_name, header, rows in sheets:
+        worksheet = workbook.create_sheet(title=sheet_name)
+        worksheet.append(header)
+        for row in rows:
+            worksheet.append(row)
+    workbook.save(filename)
+
+
+def _iter_rows(df : pd.DataFrame) -> Iterator[list]:
+    """
+    DataFrameをExcelに書き込む行に変換して順に返すジェネレータ（欠損値はNone＝空セル）
+
+    _ROW_BLOCK_SIZE行ずつ変換するため、全行のPythonの値のリストを同時に保持しない。
+
+    :param df: 変換するDataFrame
+    :return: Pythonの値の行を順に返すイテレータ
+    """
+    for start in range(0, len(df), _ROW_BLOCK_SIZE):
+        block = df.iloc[start:start + _ROW_BLOCK_SIZE]
+        yield from block.astype(object).where(block.notna(), None).to_numpy().tolist()
+
+
+def _anomaly_summary(df : pd.DataFrame) -> Union[tuple[list[str], list[list]], None]:
+    """
+    サーバーごとの異常日数の一覧をExcelに書き込むヘッダーと行に変換する関数
+
+    :param df: 日付を文字列に変換した解析済みデータ
+    :return: ヘッダーと行のリスト、anomaly列が無い場合はNone
+    """
+
+    if 'anomaly' not in df.columns:
+        return None
+    summary = summarize_anomalies(df)
+    return [str(col) for col in summary.columns], list(_iter_rows(summary))
+
+
+def _export_files(grouped : Iterable[tuple[str, pd.DataFrame]], server_names : list[str], header : list[str],
+                  output_dir : Path, today : str, workers : Union[int, None]) -> list[Path]:
+    """
+    サーバーごとに1ファイルずつ出力する関数
+
+    サーバーごとのデータはgroupbyから1つずつ取り出して書き込む（全サーバーの行を同時に作らない）。
+    workersに2以上を指定した場合はプロセスプールで並列に書き込み、行の変換も各プロセスで行う。
+    プロセスに渡す書込待ちのデータはworkersの2倍までとする。
+    書込失敗は呼び出し側で例外として受け取る（子プロセスのログ設定に依存しないため）。
+
+    :param grouped: サーバー名でグループ化した解析済みデータ（サーバー名の昇順）
+    :param server_names: groupedと同じ順のサーバー名
+    :param header: ヘッダー
+    :param output_dir: 出力先のディレクトリのパス
+    :param today: ファイル名に付ける日付
+    :param workers: 並列書込のプロセス数
+    :return: 出力したファイルパスのリスト
+    """
+    filenames = [output_dir / f'{server_name}_{today}.xlsx' for server_name in server_names]
+    jobs = zip(filenames, sheet_titles(server_names), (df_by_server for _, df_by_server in grouped))
+
+    if workers is not None and workers > 1 and len(filenames) > 1:
+        logger.info(f'Exporting {len(filenames)} files with {workers} workers')
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = {}
+            for filename, sheet_name, df_by_server in jobs:
+                if len(pending) >= workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                        logger.info(f'Exported {pending.pop(future)}')
+                pending[pool.submit(_write_server_file, filename, sheet_name, header, df_by_server)] = filename
+            for future, filename in pending.items():
+                future.result()
+                logger.info(f'Exported {filename}')
+    else:
+        for filename, sheet_name, df_by_server in jobs:
+            logger.info(f'Exporting {sheet_name} data to {filename}')
+            _write_server_file(filename, sheet_name, header, df_by_server)
+            logger.info(f'{sheet_name} data exported')
+
+    return filenames
+
+
+def _write_server_file(filename : Path, sheet_name : str, header : list[str], df : pd.DataFrame):
+    """
+    1サーバー分のデータを1シートのブックに書き込む関数（並列書込の場合は子プロセスで実行される）
+
+    :param filename: 出力ファイルパス
+    :param sheet_name: シート名
+    :param header: ヘッダー
+    :param df: 1サーバー分の解析済みデータ
+    :return: なし
+    """
+    write_workbook(filename, [(sheet_name, header, _iter_rows(df))])
 
 
 #ここからはテストです
@@ -73,3 +270,4 @@ if __name__ == '__main__':
     df_analyzed = analyze_df(data)
 
     export_result(df_analyzed)
+    export_result(df_analyzed, mode='workbook')
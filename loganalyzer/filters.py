@@ -0,0 +1,243 @@
+"""
+期間（since / until）・サーバー名による絞り込み条件。ファイル名・記録済み期間によるファイル単位の除外と、行単位の絞り込みを行う。
+"""
+import datetime
+import re
+from pathlib import Path
+from typing import Iterable, Union
+from urllib.parse import unquote
+import pandas as pd
+
+# ファイル名中の日付（YYYY-MM-DD / YYYYMMDD / YYYY_MM_DD）
+_FILE_DATE_PATTERN = re.compile(r'(?<!\d)(\d{4})[-_]?(\d{2})[-_]?(\d{2})(?!\d)')
+# ファイル名の日付で除外する場合も、日付の境界付近の行が含まれ得るため前後1日は対象とみなす
+_FILE_DATE_MARGIN = datetime.timedelta(days=1)
+
+class LogFilter:
+    """
+    ログの絞り込み条件
+
+    sinceは指定時刻を含み、untilも指定時刻を含む。
+    日付のみ（'YYYY-MM-DD' や datetime.date）を指定した場合、untilはその日の終わりまでを含む。
+    serversを指定した場合は、そのサーバーの行のみを対象とする。
+    ファイル名中の日付によるファイルの除外は、prune_by_file_name=Trueを指定した場合のみ行う
+    （期間をまたぐファイルや追記されたファイルの行を読み落とさないため）。
+    """
+
+    def __init__(
+            self,
+            since: Union[str, datetime.date, None] = None,
+            until: Union[str, datetime.date, None] = None,
+            servers: Union[Iterable[str], None] = None,
+            prune_by_file_name: bool = False):
+        """
+        :param since: 対象期間の開始（日付または日時）
+        :param until: 対象期間の終了（日付または日時）
+        :param servers: 対象サーバー名
+        :param prune_by_file_name: Trueの場合、ファイル名中の日付が1つだけのファイルをその日付（前後1日）で除外する
+        """
+
+        self.since = pd.Timestamp(since) if since is not None else None
+        # 内部では終了を「この時刻より前」として保持する
+        if until is None:
+            self._until_exclusive = None
+        elif _is_date_only(until):
+            self._until_exclusive = pd.Timestamp(until).normalize() + pd.Timedelta(days=1)
+        else:
+            self._until_exclusive = pd.Timestamp(until) + pd.Timedelta(1, 'ns')
+        self.servers = frozenset(servers) if servers is not None else None
+        self.prune_by_file_name = prune_by_file_name
+
+        if self.since is not None and self._until_exclusive is not None and self.since >= self._until_exclusive:
+            raise ValueError(f'since must be earlier than until: {since} - {until}')
+
+    def is_active(self) -> bool:
+        """
+        :return: 何らかの条件が指定されている場合はTrue
+        """
+
+        return self.since is not None or self._until_exclusive is not None or self.servers is not None
+
+    def is_day_aligned(self) -> bool:
+        """
+        :return: 期間の境界が日付単位の場合はTrue（日別集計の段階で正確に絞り込める）
+        """
+
+        return all(
+            bound is None or bound == bound.normalize()
+            for bound in [self.since, self._until_exclusive]
+        )
+
+    def first_day(self) -> Union[datetime.date, None]:
+        """
+        :return: 対象期間の最初の日付、指定なしの場合はNone
+        """
+
+        return self.since.date() if self.since is not None else None
+
+    def last_day(self) -> Union[datetime.date, None]:
+        """
+        :return: 対象期間の最後の日付、指定なしの場合はNone
+        """
+
+        if self._until_exclusive is None:
+            return None
+        return (self._until_exclusive - pd.Timedelta(1, 'ns')).date()
+
+    def time_bounds(self) -> (Union[pd.Timestamp, None], Union[pd.Timestamp, None]):
+        """
+        :return: 対象期間の開始（この時刻を含む）と終了（この時刻を含まない）、指定なしの場合はNone
+        """
+
+        return self.since, self._until_exclusive
+
+    def match_server(self, server_name: str) -> bool:
+        """
+        :param server_name: サーバー名
+        :return: 対象サーバーの場合はTrue
+        """
+
+        return self.servers is None or server_name in self.servers
+
+    def match_days(self, first: Union[datetime.date, None], last: Union[datetime.date, None]) -> bool:
+        """
+        日付範囲が対象期間と重なるか判定する
+
+        :param first: 範囲の最初の日付（不明の場合はNone）
+        :param last: 範囲の最後の日付（不明の場合はNone）
+        :return: 重なる可能性がある場合はTrue
+        """
+
+        first_day, last_day = self.first_day(), self.last_day()
+        if first_day is not None and last is not None and last < first_day:
+            return False
+        if last_day is not None and first is not None and first > last_day:
+            return False
+        return True
+
+    def match_file(self, file: Path) -> bool:
+        """
+        ファイルを開かずに、パスから対象となり得るか判定する
+
+        パーティション形式のディレクトリ名（server_name=… / date=…）を判定に使用する。
+        prune_by_file_name=Trueの場合は、ファイル名中の日付が1つだけのファイルに限り、
+        その日付（前後1日の余裕を持たせる）も判定に使用する。
+        日付が複数あるファイル名（期間・複数日の集約）は、ファイル名からは範囲を判断できないため対象とみなす。
+        判定材料が無い場合は対象とみなし、読込後に行単位で絞り込む。
+
+        :param file: ログファイルのパス
+        :return: 対象となり得る場合はTrue
+        """
+
+        for part in file.parts[:-1]:
+            key, sep, value = part.partition('=')
+            if not sep:
+                continue
+            if key == 'server_name' and not self.match_server(unquote(value)):
+                return False
+            if key == 'date':
+                day = _parse_date(value)
+                if day is not None and not self.match_days(day, day):
+                    return False
+
+        if not self.prune_by_file_name or (self.since is None and self._until_exclusive is None):
+            return True
+        days = [_parse_date('-'.join(match.groups())) for match in _FILE_DATE_PATTERN.finditer(file.name)]
+        if len(days) != 1 or days[0] is None:
+            return True
+        return self.match_days(days[0] - _FILE_DATE_MARGIN, days[0] + _FILE_DATE_MARGIN)
+
+    def filter_df(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        行単位でサーバー名・期間を絞り込む（timestampは日時型に変換済みであること）
+
+        :param df: ログデータ
+        :return: 条件に一致する行のみのログデータ
+        """
+
+        return self.filter_time(self.filter_servers(df))
+
+    def filter_servers(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        行単位でサーバー名を絞り込む（timestampの変換前に適用できる）
+
+        :param df: ログデータ
+        :return: 対象サーバーの行のみのログデータ
+        """
+
+        if self.servers is None:
+            return df
+        return df[df['server_name'].isin(self.servers)]
+
+    def filter_time(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        行単位で期間を絞り込む（timestampは日時型に変換済みであること）
+
+        :param df: ログデータ
+        :return: 対象期間の行のみのログデータ
+        """
+
+        if self.since is None and self._until_exclusive is None:
+            return df
+        mask = pd.Series(True, index=df.index)
+        if self.since is not None:
+            mask &= df['timestamp'] >= self.since
+        if self._until_exclusive is not None:
+            mask &= df['timestamp'] < self._until_exclusive
+        return df if mask.all() else df[mask]
+
+    def filter_partial(self, partial: pd.DataFrame) -> pd.DataFrame:
+        """
+        サーバー別・日別の部分集計を日付単位で絞り込む（is_day_alignedがTrueの場合のみ正確）
+
+        :param partial: 部分集計
+        :return: 条件に一致する行のみの部分集計
+        """
+
+        mask = pd.Series(True, index=partial.index)
+        if self.servers is not None:
+            mask &= partial['server_name'].isin(self.servers)
+        first_day, last_day = self.first_day(), self.last_day()
+        if first_day is not None:
+            mask &= partial['date'] >= first_day
+        if last_day is not None:
+            mask &= partial['date'] <= last_day
+        return partial if mask.all() else partial[mask].reset_index(drop=True)
+
+    def __repr__(self) -> str:
+        servers = sorted(self.servers) if self.servers is not None else None
+        return (f'LogFilter(since={self.since}, until={self.last_day() if self.is_day_aligned() else self._until_exclusive}, '
+                f'servers={servers}, prune_by_file_name={self.prune_by_file_name})')
+
+
+def _is_date_only(value: Union[str, datetime.date]) -> bool:
+    """
+    :param value: 日付または日時
+    :return: 時刻を含まない指定の場合はTrue
+    """
+
+    if isinstance(value, str):
+        return len(value.strip()) <= 10
+    return isinstance(value, datetime.date) and not isinstance(value, datetime.datetime)
+
+
+def _parse_date(value: str) -> Union[datetime.date, None]:
+    """
+    :param value: 'YYYY-MM-DD'形式の文字列
+    :return: 日付、不正な場合はNone
+    """
+
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    log_filter = LogFilter(since='2026-02-02', until='2026-02-03', servers=['srv1'], prune_by_file_name=True)
+    print(log_filter)
+    print(log_filter.match_file(Path('srv1_20260205.csv')), log_filter.match_file(Path('srv1_20260203.csv')))
+    print(log_filter.match_file(Path('srv1_2026-01-01_2026-02-07.csv')), LogFilter(since='2026-02-05').match_file(Path('app_2026-02-01.csv')))
+    print(log_filter.match_file(Path('store/server_name=srv2/date=2026-02-02/x.parquet')))
+    print(log_filter.match_file(Path('log_sample_1.csv')))
@@ -0,0 +1,290 @@
+"""
+ログディレクトリを監視し、新規ファイル・追記された行のみを読込・クレンジングして集計値を随時更新する追記監視（follow）処理。
+"""
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Union
+import pandas as pd
+from loganalyzer.analyzer import DailyAggregator, finalize_partial, merge_partials
+from loganalyzer.exporter import export_result
+from loganalyzer.filters import LogFilter
+from loganalyzer.loader import collect_log_files, log_file_format, read_csv_block, read_json_lines_block, read_log_file
+from loganalyzer.logging_config import setup_logging
+from loganalyzer.parser import parse_one
+from loganalyzer.results import ResultStore
+from loganalyzer.streaming import RowHashSet
+from loganalyzer.visualizer import visualize_result
+
+logger = logging.getLogger(__name__)
+
+# 1回に読み込む追記分の最大バイト数（大きなファイルを初回に読み込む場合もメモリ使用量を抑える）
+BLOCK_SIZE = 64 * 1024 * 1024
+# 追記分の重複判定に使う既出行の期間（最新のtimestampからこの期間内の行のみハッシュ値を保持する）
+DEDUP_WINDOW = pd.Timedelta(hours=1)
+
+class _FileState:
+    """
+    監視中のファイル1つ分の読込位置と集計値
+    """
+
+    __slots__ = ('inode', 'size', 'mtime_ns', 'offset', 'header', 'aggregator', 'seen_rows')
+
+    def __init__(self, inode: int, dedup_window: Union[pd.Timedelta, None]):
+        self.inode = inode
+        self.size = -1
+        self.mtime_ns = -1
+        self.offset = 0
+        self.header = b''
+        self.aggregator = DailyAggregator()
+        self.seen_rows = RowHashSet(dedup_window)
+
+
+class LogFollower:
+    """
+    ログディレクトリの新規ファイル・追記を検出し、サーバー別・日別の集計値を更新する
+
+    非圧縮のCSV / JSON Linesはファイルごとに読込位置（バイト単位）を記録し、pollのたびに追記された完全な行のみを読み込む
+    （処理量はファイルサイズによらず追記された行数に比例する）。書き込み途中の最終行（改行で終わっていない行）は次回に読み込む。
+    JSON（配列形式）/ Parquet / Feather・圧縮ファイルは追記分のみを読めない形式のため、更新された場合はファイル全体を読み直す。
+    ファイルが短くなった・置き換えられた（ローテーション）場合は先頭から読み直す。
+
+    集計値はファイルごとに保持するため、読み直したファイル・削除されたファイルの集計値は正しく差し替え・除外される。
+    クレンジングはparse_one、ファイル内の重複削除は行ハッシュ（ストリーミング処理と同じ）で行う。
+    監視し続けても処理量・メモリ使用量が増え続けないよう、追記分の重複はファイルの最新のtimestampから
+    dedup_window以内の行とのみ判定する（それより古い行と同じ行が追記された場合は重複として除外されない）。
+    """
+
+    def __init__(self, data_dir: Path, log_filter: Union[LogFilter, None] = None, block_size: int = BLOCK_SIZE,
+                 dedup_window: Union[pd.Timedelta, None] = DEDUP_WINDOW):
+        """
+        :param data_dir: 監視するディレクトリのパス
+        :param log_filter: 絞り込み条件、指定しない場合は全行を対象とする
+        :param block_size: 1回に読み込む追記分の最大バイト数
+        :param dedup_window: 追記分の重複判定に使う既出行の期間、Noneの場合はファイルの全行と判定する（行数に比例してメモリを使用する）
+        """
+
+        self.data_dir = Path(data_dir)
+        self.log_filter = log_filter
+        self.block_size = block_size
+        self.dedup_window = dedup_window
+        self._files: dict[Path, _FileState] = {}
+        self._scanned = False
+
+    def poll(self) -> int:
+        """
+        ディレクトリを走査し、新規ファイル・追記分を集計値に反映する
+
+        :return: 集計値に反映した行数
+        """
+
+        target_files = collect_log_files(self.data_dir, self.log_filter, log_skipped=not self._scanned)
+        self._scanned = True
+        for file in set(self._files) - set(target_files):
+            logger.info(f'File removed, dropping its aggregates: {file.resolve()}')
+            del self._files[file]
+
+        new_rows = 0
+        for file in target_files:
+            try:
+                new_rows += self._poll_file(file)
+            except (OSError, ValueError, EOFError) as e:
+                # 書き込み中（JSONの配列・圧縮ファイルの途中など）・削除直後などで読めない場合は、
+                # 前回までの集計値のまま次回に再試行する（監視は継続する）
+                logger.warning(f'Failed to read {file.resolve()}, retrying on next poll: {e}')
+        return new_rows
+
+    def result(self) -> Union[pd.DataFrame, None]:
+        """
+        現時点の集計値をanalyze_df関数と同じ形式で返す
+
+        :return: 分析・集計後のデータ、集計値が1件も無い場合はNone
+        """
+
+        partials = [state.aggregator.partial() for state in self._files.values() if not state.aggregator.is_empty()]
+        if not partials:
+            return None
+        return finalize_partial(merge_partials(partials))
+
+    def _poll_file(self, file: Path) -> int:
+        """
+        1つのファイルの変更を検出して集計値に反映する
+
+        読み直す場合は新しい集計値に読み込み、読込に成功してから差し替える（失敗した場合は前回までの集計値を残す）。
+        サイズ・更新日時は読込に成功した場合のみ記録するため、失敗した場合は次回に再試行される。
+
+        :param file: 対象ファイルのパス
+        :return: 集計値に反映した行数
+        """
+
+        stat = file.stat()
+        state = self._files.get(file)
+        if state is not None and stat.st_size == state.size and stat.st_mtime_ns == state.mtime_ns:
+            return 0
+
+        fmt, compression = log_file_format(file)
+        appendable = fmt in ('csv', 'jsonl') and compression is None
+        if state is not None and (stat.st_ino != state.inode or stat.st_size < state.offset or not appendable):
+            if appendable:
+                logger.info(f'File truncated or replaced, reading from the start: {file.resolve()}')
+            state = None
+        if state is None:
+            state = _FileState(stat.st_ino, self.dedup_window)
+
+        if appendable:
+            new_rows = self._read_appended(file, state, stat.st_size, fmt)
+        else:
+            new_rows = self._aggregate(file, state, read_log_file(file))
+        self._files[file] = state
+        state.size = stat.st_size
+        state.mtime_ns = stat.st_mtime_ns
+        return new_rows
+
+    def _read_appended(self, file: Path, state: _FileState, size: int, fmt: str) -> int:
+        """
+        CSV / JSON Linesファイルの前回の読込位置以降の完全な行を読み込み、集計値に反映する
+
+        CSVは初回にヘッダー行を記録し、追記分の先頭に付けて読み込む。
+
+        :param file: 対象ファイルのパス
+        :param state: 対象ファイルの読込位置と集計値
+        :param size: 現在のファイルサイズ
+        :param fmt: ファイルの形式（'csv' または 'jsonl'）
+        :return: 集計値に反映した行数
+        """
+
+        new_rows = 0
+        with open(file, 'rb') as f:
+            if fmt == 'csv' and not state.header:
+                header = f.readline()
+                if not header.endswith(b'\n'):
+                    # ヘッダー行の書き込み途中
+                    return 0
+                state.header = header
+                state.offset = len(header)
+
+            f.seek(state.offset)
+            while state.offset < size:
+                data = f.read(min(self.block_size, size - state.offset))
+                end = data.rfind(b'\n') + 1
+                if end == 0:
+                    if len(data) < self.block_size:
+                        # 書き込み途中の行のみ
+                        break
+                    # ブロックより長い行は次の改行まで読み足す
+                    data += f.readline()
+                    end = len(data) if data.endswith(b'\n') else 0
+                    if end == 0:
+                        break
+                # 読込に失敗した場合は読込位置を進めず、次回に同じ位置から再試行する
+                if fmt == 'csv':
+                    df = read_csv_block(state.header + data[:end], file)
+                else:
+                    df = read_json_lines_block(data[:end], file)
+                state.offset += end
+                f.seek(state.offset)
+                new_rows += self._aggregate(file, state, df)
+        return new_rows
+
+    def _aggregate(self, file: Path, state: _FileState, df: pd.DataFrame) -> int:
+        """
+        読み込んだ行をクレンジングし、ファイルの集計値に反映する
+
+        クレンジングに失敗した行の範囲は読み飛ばす（一括処理でファイルを除外するのと同じ扱い）。
+
+        :param file: 対象ファイルのパス
+        :param state: 対象ファイルの読込位置と集計値
+        :param df: 読み込んだログデータ
+        :return: 集計値に反映した行数
+        """
+
+        try:
+            parsed_df = parse_one(df, file, self.log_filter)
+        except (ValueError, TypeError, KeyError):
+            logger.exception(f'Failed to parse file: {file.resolve()}')
+            return 0
+        parsed_df = state.seen_rows.drop_seen(parsed_df)
+        state.aggregator.update(parsed_df)
+        return len(parsed_df)
+
+
+def follow(data_dir: Path, interval: float = 2.0, flush_interval: float = 30.0,
+           log_filter: Union[LogFilter, None] = None, output_dir: Union[Path, None] = None,
+           export_mode: str = 'files', chart_workers: Union[int, None] = None,
+           stop_event: Union[threading.Event, None] = None, max_polls: Union[int, None] = None,
+           result_store: Union[Path, None] = None) -> Union[pd.DataFrame, None]:
+    """
+    ログディレクトリを監視し続け、集計値を随時更新してExcel・グラフを定期的に出力し直す関数
+
+    interval秒ごとに新規ファイル・追記分を集計値に反映する（ログの追記から集計値への反映までの遅延はinterval秒程度）。
+    前回の出力からflush_interval秒以上経過し、かつ集計値が更新されている場合にExcel・グラフを出力する。
+    グラフは内容が変化したもののみ再描画される（visualize_resultのキャッシュ）。
+    stop_eventが設定される、max_polls回監視する、またはCtrl+Cで終了し、終了時に未出力の更新があれば出力する。
+
+    :param data_dir: 監視するディレクトリのパス
+    :param interval: 監視間隔（秒）
+    :param flush_interval: Excel・グラフの出力間隔（秒）
+    :param log_filter: 絞り込み条件、指定しない場合は全行を対象とする
+    :param output_dir: Excel・グラフの出力先、指定しない場合はdata/output
+    :param export_mode: Excel出力モード（'files' または 'workbook'）
+    :param chart_workers: グラフの並列描画のプロセス数
+    :param stop_event: 終了を指示するイベント
+    :param max_polls: 監視回数の上限、指定しない場合は終了を指示されるまで監視する
+    :param result_store: 集計結果の保存先（SQLite）のファイルパス、指定した場合は出力のたびに集計結果を保存する
+    :return: 終了時点の分析・集計結果、集計値が1件も無い場合はNone
+    """
+
+    data_dir_resolved = Path(data_dir).resolve()
+    logger.info(f'Following {data_dir_resolved} (interval {interval}s, flush every {flush_interval}s)')
+    stop_event = stop_event or threading.Event()
+    follower = LogFollower(Path(data_dir), log_filter)
+    store = None if result_store is None else ResultStore(Path(result_store))
+    dirty = False
+    last_flush = float('-inf')
+    polls = 0
+
+    def flush():
+        analyzed_df = follower.result()
+        if analyzed_df is None:
+            logger.info('No data to export yet')
+            return
+        export_result(analyzed_df, output_dir, mode=export_mode)
+        visualize_result(analyzed_df, output_dir, workers=chart_workers)
+        if store is not None:
+            # 保存すると問い合わせ結果のキャッシュは次の問い合わせ時に破棄される
+            store.update(analyzed_df)
+
+    try:
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            new_rows = follower.poll()
+            polls += 1
+            if new_rows:
+                dirty = True
+                logger.info(f'Aggregated {new_rows} new rows in {time.perf_counter() - start:.3f}s')
+            if dirty and time.monotonic() - last_flush >= flush_interval:
+                flush()
+                dirty = False
+                last_flush = time.monotonic()
+            if max_polls is not None and polls >= max_polls:
+                break
+            stop_event.wait(max(interval - (time.perf_counter() - start), 0))
+    except KeyboardInterrupt:
+        logger.info('Follow mode interrupted')
+
+    if dirty:
+        flush()
+    if store is not None:
+        store.close()
+    logger.info(f'Follow mode stopped after {polls} polls')
+    return follower.result()
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    setup_logging(level=logging.DEBUG)
+    follower = LogFollower(Path(__file__).parent.parent / 'data' / 'sample_logs')
+    print(follower.poll())
+    print(follower.result())
+    print(follower.poll())
@@ -0,0 +1,668 @@
+"""
+ローカルの TCP / HTTP エンドポイントでログレコードを受信し、parse_one でクレンジングしながら集計値を随時更新する取込サーバー。
+"""
+import asyncio
+import http.client
+import io
+import json
+import logging
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Union
+import pandas as pd
+from loganalyzer.analyzer import DailyAggregator
+from loganalyzer.exporter import export_result
+from loganalyzer.filters import LogFilter
+from loganalyzer.loader import read_csv_block
+from loganalyzer.logging_config import setup_logging
+from loganalyzer.parser import REQUIRED_COLUMNS, parse_one
+from loganalyzer.results import ResultStore
+from loganalyzer.streaming import RowHashSet
+from loganalyzer.visualizer import visualize_result
+
+logger = logging.getLogger(__name__)
+
+PROTOCOLS = ('tcp', 'http')
+# parse_oneのログ出力に使用する取込元の名前
+INGEST_SOURCE = Path('<ingest>')
+# 1リクエスト（TCPは1行）あたりの最大バイト数
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+# 待ち行列に保持する受信データの合計の最大バイト数（受信したバイト列の長さで数える）
+QUEUE_BYTES = 256 * 1024 * 1024
+# マイクロバッチをまたぐ重複判定に使う既出行の期間（再送されたレコードを二重に集計しないため）
+DEDUP_WINDOW = pd.Timedelta(hours=1)
+# TCPの1回の読込バイト数
+_TCP_READ_BYTES = 1024 * 1024
+_HTTP_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                 413: 'Payload Too Large'}
+
+class IngestStats:
+    """
+    取込件数とスループットの集計
+
+    受信件数はイベントループ、採用・除外件数は集計スレッドで更新するため、更新・参照はロックを取得して行う。
+    """
+
+    def __init__(self):
+        # スループットは最初のレコードの受信時点から計測する
+        self.started: Union[float, None] = None
+        self.received = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.parse_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_received(self, count: int):
+        """
+        :param count: 受信したレコード数
+        :return: なし
+        """
+
+        with self._lock:
+            if self.started is None:
+                self.started = time.perf_counter()
+            self.received += count
+
+    def add_batch(self, accepted: int, rejected: int, parse_seconds: float, parsed: bool = True):
+        """
+        :param accepted: 集計値に反映したレコード数
+        :param rejected: 除外したレコード数（クレンジング・重複除去で除いたもの）
+        :param parse_seconds: クレンジング・集計にかかった時間（秒）
+        :param parsed: Falseの場合はバッチ全体を除外した（クレンジングに失敗した）ものとして数える
+        :return: なし
+        """
+
+        with self._lock:
+            if parsed:
+                self.batches += 1
+                self.accepted += accepted
+                self.parse_seconds += parse_seconds
+            self.rejected += rejected
+
+    def to_dict(self, queue_depth: int = 0, queue_bytes: int = 0) -> dict:
+        """
+        :param queue_depth: 現在の待ち行列の長さ
+        :param queue_bytes: 現在の待ち行列（受信中を含む）のバイト数
+        :return: 受信・採用・除外件数、処理済みバッチ数、受信スループット（件/秒）等
+        """
+
+        with self._lock:
+            elapsed = 0.0 if self.started is None else time.perf_counter() - self.started
+            return {
+                'received': self.received,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'batches': self.batches,
+                'queue_depth': queue_depth,
+                'queue_bytes': queue_bytes,
+                'elapsed_seconds': round(elapsed, 3),
+                'records_per_second': round(self.received / elapsed, 1) if elapsed > 0 else 0.0,
+                'parse_records_per_second': round(self.accepted / self.parse_seconds, 1) if self.parse_seconds > 0 else 0.0,
+            }
+
+
+class _ByteBudget:
+    """
+    待ち行列に保持する受信データのバイト数の上限
+
+    acquireは確保済みのバイト数と合わせて上限を超える間は待機する。
+    上限より大きい1件も、確保済みのバイト数が0の場合は受け付ける（永久に待機しないよう）。
+    イベントループのスレッドからのみ使用するため、ロックは使用しない。
+    """
+
+    def __init__(self, limit: int):
+        """
+        :param limit: 上限のバイト数
+        """
+
+        self.limit = limit
+        self.used = 0
+        self._released = asyncio.Event()
+
+    async def acquire(self, size: int):
+        """
+        :param size: 確保するバイト数
+        :return: なし
+        """
+
+        while self.used and self.used + size > self.limit:
+            self._released.clear()
+            await self._released.wait()
+        self.used += size
+
+    def release(self, size: int):
+        """
+        :param size: 解放するバイト数（acquireで確保したバイト数）
+        :return: なし
+        """
+
+        self.used -= size
+        self._released.set()
+
+
+class IngestServer:
+    """
+    ログレコードを受信し、マイクロバッチ単位でクレンジング・集計する取込サーバー
+
+    TCP: 接続ごとに改行区切りで送信する。最初の行が「{」または「[」で始まる場合はJSON（1行に1レコードまたはレコードの配列）、
+         それ以外はCSV（最初の行をヘッダーとする）として扱う。送信終了後に受付件数をJSONで1行返す。
+    HTTP: POST /ingest にJSON（レコードまたはレコードの配列、JSON Lines）またはCSV（Content-Type: text/csv）を送信する。
+          GET /stats で取込件数・スループット、GET /result で現時点の集計値を返す。
+
+    受信したレコードは上限付きの待ち行列を経由して1つの集計タスクに渡す。上限は件数（queue_size）と
+    受信したバイト数の合計（queue_bytes）で、バイト数はHTTPは本文を読み込む前（Content-Length）、
+    TCPは行のまとまりをデコードする前に確保し、集計が終わった時点で解放する。
+    上限に達している間は受信側が待機する（TCPは読込を止め、HTTPは本文を読まずに応答を遅らせる）ため、
+    集計が追いつかない場合も待ち行列のメモリ使用量はおおむねqueue_bytes（とデコード後のデータ）に収まる。
+    集計タスクはbatch_rows件またはbatch_interval秒ごとにまとめてparse_oneでクレンジングし、
+    analyze_df関数と同じ集計（DailyAggregator）に反映する。
+    重複の除去はマイクロバッチ内に加えて、これまでの最新のtimestampからdedup_window以内の既出行とも行う
+    （タイムアウト後に再送されたレコードを二重に集計しない。それより古い行と同じ行は除外されない）。
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, protocol: str = 'http', queue_size: int = 64,
+                 batch_rows: int = 50_000, batch_interval: float = 0.5, log_filter: Union[LogFilter, None] = None,
+                 queue_bytes: int = QUEUE_BYTES, dedup_window: Union[pd.Timedelta, None] = DEDUP_WINDOW):
+        """
+        :param host: 待ち受けるアドレス
+        :param port: 待ち受けるポート番号、0の場合は空いているポートを使用する
+        :param protocol: プロトコル（'tcp' または 'http'）
+        :param queue_size: 待ち行列に保持する受信データ（リクエスト・行のまとまり）の最大数
+        :param batch_rows: マイクロバッチの最大件数
+        :param batch_interval: マイクロバッチをまとめる最大待ち時間（秒）
+        :param log_filter: 絞り込み条件、指定しない場合は全件を対象とする
+        :param queue_bytes: 待ち行列に保持する受信データの合計の最大バイト数
+        :param dedup_window: マイクロバッチをまたぐ重複判定に使う既出行の期間、Noneの場合はすべての既出行と判定する
+        """
+
+        if protocol not in PROTOCOLS:
+            raise ValueError(f'Unsupported protocol: {protocol} (expected one of {PROTOCOLS})')
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.batch_rows = batch_rows
+        self.batch_interval = batch_interval
+        self.log_filter = log_filter
+        self.stats = IngestStats()
+        self.aggregator = DailyAggregator()
+        self.version = 0
+        # 集計スレッドのみが参照する（マイクロバッチは1つずつ順に集計する）
+        self._seen_rows = RowHashSet(dedup_window)
+        # 集計スレッドとイベントループ（/result）から集計値を参照するためのロック
+        self._lock = threading.Lock()
+        self._queue_size = queue_size
+        self._queue_bytes = queue_bytes
+        self._queue: Union[asyncio.Queue, None] = None
+        self._budget: Union[_ByteBudget, None] = None
+        self._server: Union[asyncio.AbstractServer, None] = None
+        self._consumer: Union[asyncio.Task, None] = None
+
+    async def start(self):
+        """
+        待ち受けと集計タスクを開始する（portが0の場合は割り当てられたポート番号をportに設定する）
+
+        :return: なし
+        """
+
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._budget = _ByteBudget(self._queue_bytes)
+        self._consumer = asyncio.create_task(self._consume())
+        handler = self._handle_http if self.protocol == 'http' else self._handle_tcp
+        self._server = await asyncio.start_server(handler, self.host, self.port, limit=MAX_REQUEST_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f'Ingest server listening on {self.protocol}://{self.host}:{self.port}')
+
+    async def stop(self):
+        """
+        待ち受けを終了し、待ち行列に残ったデータを集計してから集計タスクを終了する
+
+        :return: なし
+        """
+
+        self._server.close()
+        await self._server.wait_closed()
+        await self._queue.join()
+        self._consumer.cancel()
+        try:
+            await self._consumer
+        except asyncio.CancelledError:
+            pass
+        logger.info(f'Ingest server stopped: {self.stats.to_dict()}')
+
+    def result(self) -> Union[pd.DataFrame, None]:
+        """
+        :return: 現時点の集計値（analyze_df関数と同じ形式）、集計値が1件も無い場合はNone
+        """
+
+        with self._lock:
+            if self.aggregator.is_empty():
+                return None
+            return self.aggregator.result()
+
+    def stats_dict(self) -> dict:
+        """
+        :return: 取込件数・スループットと、現在の待ち行列の長さ・バイト数
+        """
+
+        if self._queue is None:
+            return self.stats.to_dict()
+        return self.stats.to_dict(self._queue.qsize(), self._budget.used)
+
+    async def _submit(self, df: pd.DataFrame, size: int):
+        """
+        受信したレコードを待ち行列に追加する（件数が満杯の場合は空くまで待機する）
+
+        :param df: 受信したレコード
+        :param size: 受信したバイト数（呼び出し元で確保済み、集計後に解放する）
+        :return: なし
+        """
+
+        self.stats.add_received(len(df))
+        await self._queue.put((df, size))
+
+    async def _consume(self):
+        """
+        待ち行列からレコードを取り出し、マイクロバッチ単位でクレンジング・集計する
+
+        :return: なし
+        """
+
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            rows = len(batch[0][0])
+            deadline = loop.time() + self.batch_interval
+            while rows < self.batch_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                rows += len(batch[-1][0])
+            try:
+                # クレンジング・集計はCPU負荷が高いため、受信を止めないよう別スレッドで実行する
+                await asyncio.to_thread(self._aggregate, [df for df, _ in batch])
+            except Exception:
+                logger.exception('Failed to aggregate ingested records')
+            finally:
+                for _, size in batch:
+                    self._budget.release(size)
+                    self._queue.task_done()
+
+    def _aggregate(self, batch: list[pd.DataFrame]):
+        """
+        :param batch: マイクロバッチ（受信したレコードのリスト）
+        :return: なし
+        """
+
+        start = time.perf_counter()
+        df = pd.concat(batch, ignore_index=True) if len(batch) > 1 else batch[0]
+        try:
+            parsed_df = parse_one(df, INGEST_SOURCE, self.log_filter)
+        except (ValueError, TypeError, KeyError):
+            logger.exception(f'Rejected a batch of {len(df)} records')
+            self.stats.add_batch(0, len(df), 0.0, parsed=False)
+            return
+        parsed_df = self._seen_rows.drop_seen(parsed_df)
+        with self._lock:
+            self.aggregator.update(parsed_df)
+            self.version += 1
+        self.stats.add_batch(len(parsed_df), len(df) - len(parsed_df), time.perf_counter() - start)
+
+    async def _handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        TCP接続からレコードを受信する
+
+        受信したデータを完全な行の単位でまとめて待ち行列に渡す（行ごとに渡すと集計側の負荷が増えるため）。
+
+        :param reader: 受信ストリーム
+        :param writer: 送信ストリーム
+        :return: なし
+        """
+
+        accepted = 0
+        header = None
+        is_json = None
+        pending = b''
+        try:
+            while True:
+                chunk = await reader.read(_TCP_READ_BYTES)
+                pending += chunk
+                if len(pending) > MAX_REQUEST_BYTES:
+                    raise ValueError('line too long')
+                # 受信途中の最終行は次の受信分と合わせて処理する（接続終了時は残りすべて）
+                end = pending.rfind(b'\n') + 1 if chunk else len(pending)
+                block, pending = pending[:end], pending[end:]
+                if is_json is None and block.strip():
+                    block = block.lstrip()
+                    is_json = block[:1] in (b'{', b'[')
+                    if not is_json:
+                        header, _, block = block.partition(b'\n')
+                        header += b'\n'
+                if block.strip():
+                    # 待ち行列のバイト数の上限に達している間は、ここで待機して読込を止める
+                    await self._budget.acquire(len(block))
+                    try:
+                        df = await asyncio.to_thread(decode_records, block, is_json, header)
+                    except BaseException:
+                        self._budget.release(len(block))
+                        raise
+                    await self._submit(df, len(block))
+                    accepted += len(df)
+                if not chunk:
+                    break
+            writer.write(json.dumps({'accepted': accepted}).encode() + b'\n')
+            await writer.drain()
+        except (ValueError, KeyError) as e:
+            logger.warning(f'Rejected a TCP stream: {e}')
+            writer.write(json.dumps({'accepted': accepted, 'error': str(e)}).encode() + b'\n')
+        except ConnectionError as e:
+            logger.warning(f'TCP connection closed: {e}')
+        finally:
+            writer.close()
+
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        HTTP/1.1の接続を処理する（keep-aliveで複数のリクエストを受け付ける）
+
+        :param reader: 受信ストリーム
+        :param writer: 送信ストリーム
+        :return: なし
+        """
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_REQUEST_BYTES:
+                    await self._respond(writer, 413, {'error': 'request too large'})
+                    break
+                reserved = 0
+                if method == 'POST' and path.split('?', 1)[0] == '/ingest':
+                    # 待ち行列のバイト数の上限に達している間は、本文を読み込まずに待機する
+                    await self._budget.acquire(length)
+                    reserved = length
+                try:
+                    body = await reader.readexactly(length) if length else b''
+                except BaseException:
+                    self._budget.release(reserved)
+                    raise
+                status, payload = await self._route(method, path, headers, body, reserved)
+                await self._respond(writer, status, payload)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.debug(f'HTTP connection closed: {e}')
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, headers: dict, body: bytes,
+                     reserved: int = 0) -> (int, Union[dict, list]):
+        """
+        :param reserved: POST /ingestの場合に確保済みの待ち行列のバイト数（待ち行列に追加しない場合は解放する）
+        :return: ステータスコードと応答内容
+        """
+
+        path = path.split('?', 1)[0]
+        if path == '/ingest':
+            if method != 'POST':
+                return 405, {'error': 'use POST'}
+            is_json = 'csv' not in headers.get('content-type', '')
+            try:
+                df = await asyncio.to_thread(decode_records, body, is_json)
+            except (ValueError, KeyError) as e:
+                self._budget.release(reserved)
+                return 400, {'error': str(e)}
+            except BaseException:
+                self._budget.release(reserved)
+                raise
+            await self._submit(df, reserved)
+            return 202, {'accepted': len(df)}
+        if path == '/stats' and method == 'GET':
+            return 200, self.stats_dict()
+        if path == '/result' and method == 'GET':
+            result = self.result()
+            if result is None:
+                return 200, []
+            result = result.assign(date=result['date'].astype(str))
+            return 200, json.loads(result.to_json(orient='records'))
+        return 404, {'error': f'not found: {path}'}
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, payload: Union[dict, list]):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(
+            f'HTTP/1.1 {status} {_HTTP_REASONS.get(status, "")}\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body
+        )
+        await writer.drain()
+
+
+def decode_records(data: bytes, is_json: bool, header: Union[bytes, None] = None) -> pd.DataFrame:
+    """
+    受信したバイト列をログレコードのDataFrameに変換する関数
+
+    JSONはレコード、レコードの配列、改行区切りのレコード（JSON Lines）のいずれにも対応する。
+    CSVはheaderを指定した場合はそれをヘッダー行とし、指定しない場合は先頭行をヘッダー行とする。
+
+    :param data: 受信したバイト列
+    :param is_json: JSONの場合はTrue、CSVの場合はFalse
+    :param header: CSVのヘッダー行
+    :return: 受信したレコード（列はREQUIRED_COLUMNS）
+    :raises ValueError: 形式が不正な場合
+    :raises KeyError: 必須列が不足している場合
+    """
+
+    if is_json:
+        text = data.decode('utf-8').strip()
+        records = []
+        if text:
+            try:
+                records = _json_records(json.loads(text))
+            except json.JSONDecodeError:
+                # 改行区切りのレコード（JSON Lines）
+                for line in text.splitlines():
+                    if line.strip():
+                        records.extend(_json_records(json.loads(line)))
+        df = pd.DataFrame.from_records(records)
+    else:
+        df = read_csv_block((header or b'') + data, INGEST_SOURCE)
+
+    if df.empty:
+        return pd.DataFrame(columns=REQUIRED_COLUMNS)
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise KeyError(f'Missing columns: {missing}')
+    return df[REQUIRED_COLUMNS]
+
+
+def _json_records(value) -> list[dict]:
+    """
+    :param value: JSONの値
+    :return: レコードのリスト
+    """
+
+    if isinstance(value, dict):
+        return [value]
+    if isinstance(value, list) and all(isinstance(record, dict) for record in value):
+        return value
+    raise ValueError('JSON must be a record or an array of records')
+
+
+async def serve(host: str = '127.0.0.1', port: int = 8080, protocol: str = 'http', flush_interval: float = 30.0,
+                log_filter: Union[LogFilter, None] = None, output_dir: Union[Path, None] = None,
+                export_mode: str = 'files', stop_event: Union[asyncio.Event, None] = None,
+                stats_interval: float = 10.0, result_store: Union[Path, None] = None) -> Union[pd.DataFrame, None]:
+    """
+    取込サーバーを起動し、終了を指示されるまで受信・集計を続ける関数
+
+    stats_interval秒ごとにスループットをログに記録し、
+    集計値が更新されている場合はflush_interval秒ごとにExcel・グラフを出力し直す。
+
+    :param host: 待ち受けるアドレス
+    :param port: 待ち受けるポート番号
+    :param protocol: プロトコル（'tcp' または 'http'）
+    :param flush_interval: Excel・グラフの出力間隔（秒）
+    :param log_filter: 絞り込み条件、指定しない場合は全件を対象とする
+    :param output_dir: Excel・グラフの出力先、指定しない場合はdata/output
+    :param export_mode: Excel出力モード（'files' または 'workbook'）
+    :param stop_event: 終了を指示するイベント
+    :param stats_interval: スループットをログに記録する間隔（秒）
+    :param result_store: 集計結果の保存先（SQLite）のファイルパス、指定した場合は出力のたびに集計結果を保存する
+    :return: 終了時点の集計値、集計値が1件も無い場合はNone
+    """
+
+    server = IngestServer(host, port, protocol, log_filter=log_filter)
+    await server.start()
+    stop_event = stop_event or asyncio.Event()
+    store = None if result_store is None else ResultStore(Path(result_store))
+    flushed_version = 0
+    last_flush = last_stats = time.monotonic()
+
+    async def flush():
+        nonlocal flushed_version
+        analyzed_df = server.result()
+        if analyzed_df is None:
+            return
+        flushed_version = server.version
+        await asyncio.to_thread(export_result, analyzed_df, output_dir, export_mode)
+        await asyncio.to_thread(visualize_result, analyzed_df, output_dir)
+        if store is not None:
+            # 保存すると問い合わせ結果のキャッシュは次の問い合わせ時に破棄される
+            await asyncio.to_thread(store.update, analyzed_df)
+
+    try:
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            now = time.monotonic()
+            if now - last_stats >= stats_interval:
+                logger.info(f'Ingest stats: {server.stats_dict()}')
+                last_stats = now
+            if server.version != flushed_version and now - last_flush >= flush_interval:
+                await flush()
+                last_flush = now
+    finally:
+        await server.stop()
+        if server.version != flushed_version:
+            await flush()
+        if store is not None:
+            store.close()
+    return server.result()
+
+
+def run_server(**kwargs) -> Union[pd.DataFrame, None]:
+    """
+    取込サーバーを起動し、Ctrl+C（SIGINT）で終了するまで受信・集計を続ける関数
+
+    SIGINTを受けた場合も待ち行列に残ったデータを集計し、Excel・グラフを出力してから終了する。
+
+    :param kwargs: serve関数の引数（stop_eventを除く）
+    :return: 終了時点の集計値、集計値が1件も無い場合はNone
+    """
+
+    async def _run():
+        stop_event = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGINT, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windowsではシグナルハンドラを登録できないため、KeyboardInterruptで終了する
+            pass
+        return await serve(stop_event=stop_event, **kwargs)
+
+    return asyncio.run(_run())
+
+
+def send_records(host: str, port: int, records: Union[pd.DataFrame, Iterable[dict]], protocol: str = 'http',
+                 fmt: str = 'json', batch_size: int = 10_000) -> dict:
+    """
+    取込サーバーにレコードを送信するクライアント関数（動作確認・負荷試験用）
+
+    :param host: 取込サーバーのアドレス
+    :param port: 取込サーバーのポート番号
+    :param records: 送信するレコード
+    :param protocol: プロトコル（'tcp' または 'http'）
+    :param fmt: 送信形式（'json' または 'csv'）
+    :param batch_size: 1リクエスト（TCPは1回の送信）あたりのレコード数
+    :return: 送信件数、受付件数、所要時間、送信スループット（件/秒）
+    """
+
+    df = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(list(records))
+    start = time.perf_counter()
+    accepted = 0
+    if protocol == 'http':
+        connection = http.client.HTTPConnection(host, port)
+        try:
+            for i in range(0, len(df), batch_size):
+                body, content_type = _encode_batch(df.iloc[i:i + batch_size], fmt, header=True)
+                connection.request('POST', '/ingest', body, {'Content-Type': content_type})
+                response = connection.getresponse()
+                payload = json.loads(response.read())
+                if response.status != 202:
+                    raise RuntimeError(f'Ingest failed: {response.status} {payload}')
+                accepted += payload['accepted']
+        finally:
+            connection.close()
+    elif protocol == 'tcp':
+        with socket.create_connection((host, port)) as sock:
+            for i in range(0, len(df), batch_size):
+                body, _ = _encode_batch(df.iloc[i:i + batch_size], fmt, header=(i == 0))
+                sock.sendall(body)
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile('rb') as f:
+                payload = json.loads(f.readline())
+            if 'error' in payload:
+                raise RuntimeError(f'Ingest failed: {payload}')
+            accepted = payload['accepted']
+    else:
+        raise ValueError(f'Unsupported protocol: {protocol} (expected one of {PROTOCOLS})')
+
+    seconds = time.perf_counter() - start
+    return {'sent': len(df), 'accepted': accepted, 'seconds': seconds,
+            'records_per_second': len(df) / seconds if seconds > 0 else 0.0}
+
+
+def _encode_batch(df: pd.DataFrame, fmt: str, header: bool) -> (bytes, str):
+    """
+    :return: 送信するバイト列とContent-Type（JSONは改行区切りのレコード）
+    """
+
+    if fmt == 'json':
+        return df.to_json(orient='records', lines=True, force_ascii=False).encode('utf-8'), 'application/json'
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=header)
+        return buffer.getvalue().encode('utf-8'), 'text/csv'
+    raise ValueError(f'Unsupported format: {fmt}')
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    setup_logging(level=logging.INFO)
+
+    async def _demo():
+        server = IngestServer(protocol='http')
+        await server.start()
+        records = pd.read_csv(Path(__file__).parent.parent / 'data' / 'sample_logs' / 'log_sample_1.csv')
+        print(await asyncio.to_thread(send_records, server.host, server.port, records))
+        await server.stop()
+        print(server.stats.to_dict())
+        print(server.result())
+
+    asyncio.run(_demo())
@@ -0,0 +1,382 @@
+"""
+処理段階ごと・ファイルごとの処理時間・CPU時間・メモリ使用量・行数を計測し、JSON の実行レポートとして保存する。
+
+計測は activate で有効にした Instrumentation に記録する。有効にしていない場合、stage / measure_file は
+何も計測しない共有オブジェクトを返すため、各モジュールの計測箇所はほぼ処理時間に影響しない。
+"""
+import cProfile
+import datetime
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Union
+
+logger = logging.getLogger(__name__)
+
+# 対応するプロファイラー（pyinstrumentは任意の依存ライブラリ）
+PROFILERS = ('cprofile', 'pyinstrument')
+PYINSTRUMENT_AVAILABLE = importlib.util.find_spec('pyinstrument') is not None
+REPORT_VERSION = 1
+
+# 有効な計測（activateで設定する）
+_active: Union['Instrumentation', None] = None
+
+
+class PeakRSS:
+    """
+    常駐メモリ（RSS）の最大値を別スレッドで計測する
+
+    /proc/self/statm を一定間隔で読むため、pyarrowなどPython外で確保したメモリも含まれる。
+    計測全体の最大値に加え、start_window / end_window で区切った区間（ファイル単位など）の最大値も計測できる。
+    /proc がない環境では計測しない（peak_delta・end_windowはNone）。
+    """
+
+    _STATM = Path('/proc/self/statm')
+
+    def __init__(self, interval: float = 0.005):
+        """
+        :param interval: 計測間隔（秒）
+        """
+
+        self.interval = interval
+        self.available = self._STATM.exists()
+        self.peak_delta: Union[int, None] = None
+        self._start = 0
+        self._peak = 0
+        self._window_start = 0
+        self._window_peak = 0
+        self._stop = threading.Event()
+        self._thread: Union[threading.Thread, None] = None
+
+    def __enter__(self):
+        if self.available:
+            self._start = self._peak = self._read()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+            self.peak_delta = self._peak - self._start
+        return False
+
+    def start_window(self):
+        """
+        区間の計測を開始する
+
+        :return: なし
+        """
+
+        if self.available:
+            self._window_start = self._window_peak = self._read()
+
+    def end_window(self) -> Union[int, None]:
+        """
+        :return: start_windowからの区間のRSSの最大増加量（バイト）、計測できない場合はNone
+        """
+
+        if not self.available:
+            return None
+        self._sample()
+        return self._window_peak - self._window_start
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = self._read()
+        self._peak = max(self._peak, rss)
+        self._window_peak = max(self._window_peak, rss)
+
+    def _read(self) -> int:
+        return int(self._STATM.read_text().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class Record:
+    """
+    1つの処理段階または1つのファイルの計測結果
+
+    rows_in / rows_out / files は計測対象の処理側で設定する。
+    """
+
+    __slots__ = ('name', 'file', 'wall_seconds', 'cpu_seconds', 'peak_rss_delta', 'rows_in', 'rows_out', 'files',
+                 'error', 'profile')
+
+    def __init__(self, name: str, file: Union[Path, None] = None):
+        """
+        :param name: 処理段階の名前
+        :param file: ファイル単位の計測の場合は対象ファイルのパス
+        """
+
+        self.name = name
+        self.file = file
+        self.wall_seconds: Union[float, None] = None
+        self.cpu_seconds: Union[float, None] = None
+        self.peak_rss_delta: Union[int, None] = None
+        self.rows_in: Union[int, None] = None
+        self.rows_out: Union[int, None] = None
+        self.files: Union[int, None] = None
+        self.error: Union[str, None] = None
+        self.profile: Union[str, None] = None
+
+    def to_dict(self) -> dict:
+        """
+        :return: 値が設定されている項目のみの辞書
+        """
+
+        record = {'stage': self.name}
+        if self.file is not None:
+            record['file'] = str(self.file)
+        for key in self.__slots__[2:]:
+            value = getattr(self, key)
+            if value is not None:
+                record[key] = value
+        return record
+
+
+class _NullRecord:
+    """
+    計測が無効な場合に返す記録先（設定された値は捨てる）
+    """
+
+    __slots__ = ()
+
+    def __setattr__(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_RECORD = _NullRecord()
+
+
+class Instrumentation:
+    """
+    1回の実行の計測結果を保持し、実行レポートを作成する
+
+    処理段階ごとに壁時計時間・CPU時間（プロセス全体）・RSSの最大増加量・入出力行数・ファイル数を、
+    ファイルごとに同じ項目（並列処理時は行数のみ）を記録する。
+    profile_stageを指定した場合、その処理段階をcProfileまたはpyinstrumentで計測し、結果をreport_dirに保存する。
+    """
+
+    def __init__(self, report_dir: Path, profile_stage: Union[str, None] = None, profiler: str = 'cprofile'):
+        """
+        :param report_dir: 実行レポート・プロファイル結果の保存先ディレクトリのパス
+        :param profile_stage: プロファイルを取得する処理段階の名前、指定しない場合は取得しない
+        :param profiler: プロファイラー（'cprofile' または 'pyinstrument'）
+        """
+
+        if profiler not in PROFILERS:
+            raise ValueError(f'Unsupported profiler: {profiler} (expected one of {PROFILERS})')
+        if profile_stage is not None and profiler == 'pyinstrument' and not PYINSTRUMENT_AVAILABLE:
+            raise ImportError('pyinstrument is required for profiler="pyinstrument" (pip install pyinstrument)')
+
+        self.report_dir = Path(report_dir)
+        self.profile_stage = profile_stage
+        self.profiler = profiler
+        self.started_at = datetime.datetime.now()
+        self.stages: list[Record] = []
+        self.files: list[Record] = []
+        self._run_id = self.started_at.strftime('%Y%m%d_%H%M%S')
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._rss: Union[PeakRSS, None] = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Record]:
+        """
+        処理段階を計測する
+
+        :param name: 処理段階の名前
+        :return: 計測結果の記録先（rows_in / rows_out / filesを設定する）
+        """
+
+        record = Record(name)
+        self.stages.append(record)
+        profiler = self._start_profiler() if name == self.profile_stage else None
+        rss = PeakRSS()
+        previous_rss, self._rss = self._rss, rss
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            with rss:
+                yield record
+        except BaseException as e:
+            record.error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.process_time() - cpu_start
+            record.peak_rss_delta = rss.peak_delta
+            self._rss = previous_rss
+            if profiler is not None:
+                record.profile = str(self._stop_profiler(profiler, name))
+            logger.info(f'Stage {name}: {record.wall_seconds:.3f}s wall, {record.cpu_seconds:.3f}s cpu, '
+                        f'rows {record.rows_in} -> {record.rows_out}')
+
+    @contextmanager
+    def measure_file(self, name: str, file: Path) -> Iterator[Record]:
+        """
+        処理段階の中の1ファイル分の処理を計測する
+
+        :param name: 処理段階の名前
+        :param file: 対象ファイルのパス
+        :return: 計測結果の記録先（rows_in / rows_outを設定する）
+        """
+
+        record = Record(name, file)
+        self.files.append(record)
+        rss = self._rss
+        if rss is not None:
+            rss.start_window()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.process_time() - cpu_start
+            if rss is not None:
+                record.peak_rss_delta = rss.end_window()
+
+    def add_file(self, name: str, file: Path, rows_in: Union[int, None] = None,
+                 rows_out: Union[int, None] = None, error: Union[str, None] = None):
+        """
+        計測せずにファイルの処理結果のみを記録する（並列処理で子プロセスが処理したファイルなど）
+
+        :param name: 処理段階の名前
+        :param file: 対象ファイルのパス
+        :param rows_in: 入力行数
+        :param rows_out: 出力行数
+        :param error: エラー内容
+        :return: なし
+        """
+
+        record = Record(name, file)
+        record.rows_in = rows_in
+        record.rows_out = rows_out
+        record.error = error
+        self.files.append(record)
+
+    def report(self) -> dict:
+        """
+        :return: 実行レポート
+        """
+
+        return {
+            'version': REPORT_VERSION,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'wall_seconds': time.perf_counter() - self._wall_start,
+            'cpu_seconds': time.process_time() - self._cpu_start,
+            'stages': [record.to_dict() for record in self.stages],
+            'files': [record.to_dict() for record in self.files],
+        }
+
+    def write_report(self) -> Path:
+        """
+        実行レポートをreport_dirにJSON形式で保存する
+
+        :return: 保存したファイルパス
+        """
+
+        self.report_dir.mkdir(parents=True, exist_ok=True)
+        path = self.report_dir / f'run_report_{self._run_id}.json'
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+        logger.info(f'Run report saved to {path}')
+        return path
+
+    def _start_profiler(self):
+        if self.profiler == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def _stop_profiler(self, profiler, name: str) -> Path:
+        self.report_dir.mkdir(parents=True, exist_ok=True)
+        if self.profiler == 'pyinstrument':
+            profiler.stop()
+            path = self.report_dir / f'profile_{name}_{self._run_id}.html'
+            path.write_text(profiler.output_html(), encoding='utf-8')
+        else:
+            profiler.disable()
+            path = self.report_dir / f'profile_{name}_{self._run_id}.prof'
+            profiler.dump_stats(path)
+        logger.info(f'Profile of stage {name} saved to {path}')
+        return path
+
+
+def activate(instrumentation: Union[Instrumentation, None]):
+    """
+    計測を有効にする（Noneを指定した場合は無効にする）
+
+    :param instrumentation: 記録先
+    :return: なし
+    """
+
+    global _active
+    _active = instrumentation
+
+
+def stage(name: str):
+    """
+    有効な計測に処理段階を記録する。無効な場合は何もしない記録先を返す。
+
+    :param name: 処理段階の名前
+    :return: with文で使用する記録先
+    """
+
+    if _active is None:
+        return _NULL_RECORD
+    return _active.stage(name)
+
+
+def measure_file(name: str, file: Path):
+    """
+    有効な計測にファイル単位の処理を記録する。無効な場合は何もしない記録先を返す。
+
+    :param name: 処理段階の名前
+    :param file: 対象ファイルのパス
+    :return: with文で使用する記録先
+    """
+
+    if _active is None:
+        return _NULL_RECORD
+    return _active.measure_file(name, file)
+
+
+def add_file(name: str, file: Path, rows_in: Union[int, None] = None, rows_out: Union[int, None] = None,
+             error: Union[str, None] = None):
+    """
+    有効な計測にファイルの処理結果のみを記録する。無効な場合は何もしない。
+
+    :param name: 処理段階の名前
+    :param file: 対象ファイルのパス
+    :param rows_in: 入力行数
+    :param rows_out: 出力行数
+    :param error: エラー内容
+    :return: なし
+    """
+
+    if _active is not None:
+        _active.add_file(name, file, rows_in, rows_out, error)
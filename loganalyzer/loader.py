@@ -1,72 +1,595 @@
 """
-指定ディレクトリを再帰的に読み込み、CSV/JSON のログファイルを DataFrame のリストとして読み込む。
+指定ディレクトリを再帰的に読み込み、CSV/JSON/JSON Lines のログファイルを DataFrame のリストとして読み込む。
+gzip / bz2 / zstd で圧縮されたファイルは、ディスクに展開せずにストリームとして読み込む。
 """
+import bz2
+import gzip
+import importlib.util
+import io
+import json
 import logging
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+from typing import BinaryIO, Iterator, Union
+import numpy as np
 import pandas as pd
+from loganalyzer.filters import LogFilter
+from loganalyzer.instrumentation import add_file, measure_file
 from loganalyzer.logging_config import setup_logging
+from loganalyzer.parser import LOG_DTYPES, USAGE_COLUMNS
 
 logger = logging.getLogger(__name__)
 
-def load_logs_from_dir(data_dir : Path) -> (list[pd.DataFrame], list[Path]):
+# 読込対象の拡張子と形式（大文字・小文字は区別しない。.parquet / .featherの読込にはpyarrowが必要）
+LOG_FILE_SUFFIXES = {
+    '.csv': 'csv',
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.parquet': 'parquet',
+    '.feather': 'feather',
+}
+# 圧縮形式の拡張子（CSV / JSON / JSON Linesのみ。例: .jsonl.gz、.csv.zst）
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.bz2': 'bz2', '.zst': 'zstd', '.zstd': 'zstd'}
+# pyarrowがある場合はCSVの読込にpyarrowエンジン（マルチスレッド）を使用する
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+# JSON Linesはpyarrowがある場合はpyarrowのJSONリーダーで読み込み、pyarrowで読めない行（型の混在・不正な行）を含む場合や
+# pyarrowがない場合は、orjson（ない場合は標準ライブラリのjson）でデコードする
+ORJSON_AVAILABLE = importlib.util.find_spec('orjson') is not None
+# zstdの展開に使用するライブラリ（zstandard、ない場合はpyarrow）
+ZSTANDARD_AVAILABLE = importlib.util.find_spec('zstandard') is not None
+# JSON Linesを一度にデコードする行数（分割読込で行数を指定しない場合）
+JSON_LINES_BATCH = 65536
+# 圧縮ファイル・JSON Linesを読み込む単位（バイト）
+_READ_BLOCK_SIZE = 1 << 20
+# 分割読込ではチャンクごとに型指定の失敗をやり直せないため、失敗しない型のみ指定する
+_CHUNK_DTYPES = {col: dtype for col, dtype in LOG_DTYPES.items() if col not in USAGE_COLUMNS}
+# pandasの既定の文字列型（pandas 3以降でpyarrowがある場合はpyarrow形式）
+_STR_DTYPE = pd.Series([], dtype='str').dtype
+
+def load_logs_from_dir(
+        data_dir : Path,
+        workers : Union[int, None] = None,
+        log_filter : Union[LogFilter, None] = None) -> (list[pd.DataFrame], list[Path]):
     """
     指定ディレクトリのログファイルを読み込む関数
 
-    対象となるCSVおよびJSON形式のログファイルを再帰的に検索し、
+    対象となるCSVおよびJSON形式（列指向形式のParquet / Featherを含む）のログファイルを再帰的に検索し、
     ファイルをDataFrame形式で読み込む。
 
+    workersに2以上を指定した場合は並列読込を行う。
+    CPU負荷の高いJSONのパースはプロセスプール、I/O中心のCSV読込はスレッドプールで処理する。
+    並列時も返却順は逐次読込と同じ（ディレクトリ走査順）になる。
+    絞り込み条件を指定した場合、パスから対象外と判定できるファイルは開かずにスキップする。
+
     読み込みに成功したファイルとDataFrameのリストを返却する。
     不正なファイル形式や読み込み失敗時は、ログに記録した上で処理をスキップする。
 
     :param data_dir:　ログデータが格納されているディレクトリのパス
+    :param workers:　並列読込のワーカー数、指定しない場合（または1以下）は逐次読込
+    :param log_filter:　絞り込み条件、指定しない場合は全ファイルを対象とする
     :return:　読み込んだログデータのDataFrameリストと、ファイルパスのリスト。
     """
 
-    df_list: list[pd.DataFrame] = []
-    file_list: list[Path] = []
     data_dir_resolved = data_dir.resolve()
     logger.info(f'Loading files from {data_dir_resolved}')
 
+    target_files = collect_log_files(data_dir, log_filter)
+    if workers is not None and workers > 1:
+        df_or_none_list = _load_parallel(target_files, workers)
+    else:
+        df_or_none_list = [_load_one_safely(file) for file in target_files]
+
+    df_list: list[pd.DataFrame] = []
+    file_list: list[Path] = []
+    for file, df in zip(target_files, df_or_none_list):
+        # 読み込み成功時のみリストに追加（None を渡さない）
+        if df is not None:
+            df_list.append(df)
+            file_list.append(file)
+
+    if not df_list:
+        logger.exception(f'No csv or json file in directory: {data_dir_resolved}')
+        raise FileNotFoundError(f'No csv or json file in directory: {data_dir_resolved}')
+
+    logger.info(f'Loaded {len(df_list)} files from {data_dir_resolved}')
+    return df_list, file_list
+
+
+def collect_log_files(data_dir : Path, log_filter : Union[LogFilter, None] = None,
+                      log_skipped : bool = True) -> list[Path]:
+    """
+    指定ディレクトリを再帰的に走査し、読込対象のログファイルを列挙する関数
+
+    ファイルでないもの、対象外の拡張子（log_file_formatで形式を判定できないもの）はログに記録した上で除外する。
+    絞り込み条件を指定した場合、パス（ファイル名中の日付・パーティション名）から対象外と判定できるファイルも除外する。
+    返却順はディレクトリ走査順とする。
+
+    :param data_dir:　ログデータが格納されているディレクトリのパス
+    :param log_filter:　絞り込み条件、指定しない場合はパスによる除外を行わない
+    :param log_skipped:　Falseの場合、対象外のファイルをログに記録しない（繰り返し走査する場合）
+    :return:　読込対象ファイルパスのリスト
+    """
+
+    target_files: list[Path] = []
     for file in data_dir.rglob('*'):
         file_resolved = file.resolve()
 
         if not file.is_file():
-            logger.warning(f'This is not a file: {file_resolved}')
+            if log_skipped:
+                logger.warning(f'This is not a file: {file_resolved}')
+            continue
+        if log_file_format(file)[0] is None:
+            if log_skipped:
+                logger.warning(f'File does not have a .csv, .json, .jsonl, .parquet or .feather extension '
+                               f'(optionally .gz, .bz2 or .zst compressed): {file_resolved}')
             continue
-        if not file.suffix in ['.csv', '.json']:
-            logger.warning(f'File does not have a .csv or .json extension: {file_resolved}')
+        if log_filter is not None and not log_filter.match_file(file):
+            logger.debug(f'Skipped by filter: {file_resolved}')
             continue
+        target_files.append(file)
+
+    return target_files
+
+
+def read_log_file(file : Path, columns : Union[list[str], None] = None) -> pd.DataFrame:
+    """
+    1つのログファイルを拡張子に応じてDataFrameとして読み込む関数
+
+    プロセスプールから呼び出されるため、モジュールのトップレベルに定義している。
+    CSV / JSON / JSON Linesは列の型（LOG_DTYPES）を指定して読み込む。圧縮ファイルは展開しながら読み込む。
+    JSON Linesは行ごとに列が異なってもよく（ない列は欠損値）、デコードできない行はログに記録して除外する。
+    Parquet / Featherはcolumnsで指定した列のみをファイルから読み込む（列の射影）。
+    読み込み失敗時の例外は呼び出し元に通知する。
+
+    :param file:　読込対象ファイルのパス
+    :param columns:　読み込む列、指定しない場合は全列
+    :return:　読み込んだログデータ
+    """
+
+    fmt, _ = log_file_format(file)
+    if fmt == 'csv':
+        return _read_csv_typed(file, columns)
+    elif fmt == 'json':
+        with open_log_stream(file) as stream:
+            df = _apply_log_dtypes(pd.read_json(stream))
+        return df[columns] if columns is not None else df
+    elif fmt == 'jsonl':
+        chunks = list(_read_json_lines(file, JSON_LINES_BATCH))
+        df = _apply_log_dtypes(chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True))
+        return df[columns] if columns is not None else df
+    elif fmt == 'parquet':
+        return pd.read_parquet(file, columns=columns)
+    elif fmt == 'feather':
+        return pd.read_feather(file, columns=columns)
+    raise ValueError(f'Unsupported file type: {file}')
+
+
+def log_file_format(file : Path) -> (Union[str, None], Union[str, None]):
+    """
+    ファイル名の拡張子（大文字・小文字を区別しない）からログの形式と圧縮形式を判定する関数
+
+    例: log.CSV → ('csv', None)、app.jsonl.gz → ('jsonl', 'gzip')、app.csv.zst → ('csv', 'zstd')
+
+    :param file:　ファイルパス
+    :return:　形式（LOG_FILE_SUFFIXESの値）と圧縮形式（COMPRESSION_SUFFIXESの値、非圧縮の場合はNone）、
+              対象外の場合は(None, None)
+    """
+
+    name = Path(file.name.lower())
+    compression = COMPRESSION_SUFFIXES.get(name.suffix)
+    if compression is not None:
+        name = name.with_suffix('')
+    fmt = LOG_FILE_SUFFIXES.get(name.suffix)
+    if fmt is None or (compression is not None and fmt in ('parquet', 'feather')):
+        return None, None
+    return fmt, compression
+
+
+def open_log_stream(file : Path) -> BinaryIO:
+    """
+    ログファイルをバイナリのストリームとして開く関数（圧縮ファイルは展開しながら読み込むストリーム）
+
+    zstdはzstandard、ない場合はpyarrowで展開する。
+
+    :param file:　読込対象ファイルのパス
+    :return:　読込用のストリーム（呼び出し元で閉じる）
+    """
+
+    _, compression = log_file_format(file)
+    if compression is None:
+        return open(file, 'rb')
+    elif compression == 'gzip':
+        return gzip.open(file, 'rb')
+    elif compression == 'bz2':
+        return bz2.open(file, 'rb')
+    elif ZSTANDARD_AVAILABLE:
+        import zstandard
+        return zstandard.open(file, 'rb')
+    elif PYARROW_AVAILABLE:
+        import pyarrow as pa
+        return pa.input_stream(str(file), compression='zstd')
+    raise ValueError(f'Reading zstd-compressed files requires zstandard or pyarrow: {file}')
+
+
+def read_csv_block(block : bytes, file : Path) -> pd.DataFrame:
+    """
+    メモリ上のCSV（ヘッダー行と、ファイルに追記された行）を列の型を指定して読み込む関数
+
+    追記監視（follow）で、ファイルの追記分のみを読み込むために使用する。
+    型の指定・失敗時の読み直しはCSVファイルの読込と同じ。
+
+    :param block:　ヘッダー行から始まるCSVのバイト列
+    :param file:　読込元のファイルパス（ログ出力用）
+    :return:　読み込んだログデータ
+    """
+
+    return _read_csv_typed(file, block=block)
+
+
+def read_json_lines_block(block : bytes, file : Path) -> pd.DataFrame:
+    """
+    メモリ上のJSON Lines（ファイルに追記された完全な行）を読み込む関数
+
+    追記監視（follow）で、ファイルの追記分のみを読み込むために使用する。
+    デコード・不正な行の除外・型の変換はJSON Linesファイルの読込と同じ。
+
+    :param block:　完全な行（改行で終わる行）のみからなるJSON Linesのバイト列
+    :param file:　読込元のファイルパス（ログ出力用）
+    :return:　読み込んだログデータ
+    """
+
+    return _apply_log_dtypes(_decode_json_lines(block, file))
+
+
+def _read_csv_typed(file : Path, columns : Union[list[str], None] = None,
+                    block : Union[bytes, None] = None) -> pd.DataFrame:
+    """
+    CSVファイルを列の型を指定して読み込む関数
+
+    pyarrowがある場合はpyarrowのCSVリーダー（マルチスレッド）で列の型を指定して読み込む。
+    timestampは文字列のまま読み込み、parse_oneで変換する（pyarrowの日時推定は使用しない）。
+    数値列に数値以外の値が含まれる等で型指定の読込に失敗した場合は、
+    型を指定せずに読み直し、変換できる列のみ型を揃える（使用率はparse_oneで数値に変換する）。
+    圧縮ファイルは展開しながら読み込む（読み直す場合は開き直す）。
+
+    :param file:　読込対象ファイルのパス
+    :param columns:　読み込む列、指定しない場合は全列
+    :param block:　指定した場合はファイルではなくこのバイト列を読み込む
+    :return:　読み込んだログデータ
+    """
+
+    try:
+        with _open_csv_source(file, block) as source:
+            if PYARROW_AVAILABLE:
+                return _read_csv_arrow(source, columns)
+            return pd.read_csv(source, usecols=columns, dtype=LOG_DTYPES)
+    except (ValueError, TypeError) as e:
+        logger.warning(f'Typed read failed, reading without dtypes: {file.resolve()}: {e}')
+    with _open_csv_source(file, block) as source:
+        return _apply_log_dtypes(pd.read_csv(source, usecols=columns))
+
+
+@contextmanager
+def _open_csv_source(file : Path, block : Union[bytes, None] = None) -> Iterator[Union[Path, BinaryIO]]:
+    """
+    CSVの読込元を開く（非圧縮のファイルはパスのまま、圧縮ファイルは展開するストリーム、blockはメモリ上のストリーム）
+
+    :param file:　読込対象ファイルのパス
+    :param block:　指定した場合はファイルではなくこのバイト列を読み込む
+    :return:　読込元（パスまたはストリーム）
+    """
+
+    if block is not None:
+        yield io.BytesIO(block)
+    elif log_file_format(file)[1] is None:
+        yield file
+    else:
+        with open_log_stream(file) as stream:
+            yield stream
+
+
+def _read_csv_arrow(file : Union[Path, io.BytesIO], columns : Union[list[str], None] = None) -> pd.DataFrame:
+    """
+    pyarrowのCSVリーダーで列の型を指定して読み込む関数
+
+    server_name・levelは辞書型（pandasではカテゴリ型）、文字列列は空文字を欠損値として読み込む（pd.read_csvと同じ）。
+
+    :param file:　読込対象ファイルのパス（またはバイト列・展開したファイルのストリーム）
+    :param columns:　読み込む列、指定しない場合は全列
+    :return:　読み込んだログデータ
+    """
+
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    column_types = {
+        'server_name': pa.dictionary(pa.int32(), pa.string()),
+        'timestamp': pa.string(),
+        'level': pa.dictionary(pa.int32(), pa.string()),
+        'cpu_usage': pa.float32(),
+        'memory_usage': pa.float32(),
+        'message': pa.string(),
+    }
+    convert_options = pa_csv.ConvertOptions(
+        column_types=column_types,
+        include_columns=columns or [],
+        strings_can_be_null=True,
+    )
+    table = pa_csv.read_csv(file, convert_options=convert_options)
+    return table.to_pandas(types_mapper=_arrow_string_mapper)
 
-        df = None
-        if file.suffix.lower() == '.csv':
+
+def _arrow_string_mapper(arrow_type) -> Union[object, None]:
+    """
+    pyarrowの文字列型をpandasの文字列型（pyarrow形式の場合）に対応付ける
+
+    :param arrow_type:　pyarrowの型
+    :return:　対応するpandasの型、既定の変換を使う場合はNone
+    """
+
+    import pyarrow as pa
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        if getattr(_STR_DTYPE, 'storage', None) == 'pyarrow':
+            return _STR_DTYPE
+    return None
+
+
+def _apply_log_dtypes(df : pd.DataFrame) -> pd.DataFrame:
+    """
+    読込済みのログデータの列をLOG_DTYPESの型に変換する関数
+
+    変換できない列（数値以外を含む使用率、日時型に変換済みのtimestamp等）はそのままとする。
+
+    :param df:　読み込んだログデータ
+    :return:　型を揃えたログデータ
+    """
+
+    for col, dtype in LOG_DTYPES.items():
+        if col not in df.columns or pd.api.types.is_datetime64_any_dtype(df[col].dtype):
+            continue
+        try:
+            df[col] = df[col].astype(dtype)
+        except (ValueError, TypeError):
+            continue
+    return df
+
+
+def read_log_chunks(file : Path, chunksize : Union[int, None] = None) -> Iterator[pd.DataFrame]:
+    """
+    1つのログファイルをチャンク単位で読み込むジェネレータ
+
+    CSV / JSON Linesはchunksize行ずつ読み込み、ファイル全体をメモリに展開しない（圧縮ファイルも展開しながら読み込む）。
+    JSON（配列形式）は分割読込できないため、ファイル全体を1チャンクとして返す。
+    読み込み失敗時の例外は呼び出し元に通知する。
+
+    :param file:　読込対象ファイルのパス
+    :param chunksize:　CSV / JSON Linesの1チャンクあたりの行数、指定しない場合はファイル全体を1チャンクとする
+    :return:　ログデータのチャンクを順に返すイテレータ
+    """
+
+    fmt, _ = log_file_format(file)
+    if chunksize and fmt == 'csv':
+        with _open_csv_source(file) as source, pd.read_csv(source, chunksize=chunksize, dtype=_CHUNK_DTYPES) as reader:
+            # 使用率の列はチャンクごとに推定される型（int64 / float64）を、変換できる場合はLOG_DTYPESの型に揃える
+            for chunk in reader:
+                yield _apply_log_dtypes(chunk)
+    elif chunksize and fmt == 'jsonl':
+        for chunk in _read_json_lines(file, chunksize):
+            yield _apply_log_dtypes(chunk)
+    else:
+        yield read_log_file(file)
+
+
+def _read_json_lines(file : Path, batch_size : int) -> Iterator[pd.DataFrame]:
+    """
+    JSON Lines（1行に1つのJSONオブジェクト）のファイルをbatch_size行ずつDataFrameとして読み込むジェネレータ
+
+    ファイルはブロック単位で読み込み、batch_size行をまとめて1回でデコードする（_decode_json_lines）。
+    列は行ごとに異なってもよく、ない列は欠損値とする。型の変換は呼び出し元で行う。
+
+    :param file:　読込対象ファイルのパス
+    :param batch_size:　1回にデコードする行数
+    :return:　batch_size行（空行を含む）ごとのログデータを順に返すイテレータ（空のファイルの場合は列のみのDataFrame）
+    """
+
+    with open_log_stream(file) as stream:
+        batches = 0
+        for data in _iter_line_batches(stream, batch_size):
+            yield _decode_json_lines(data, file)
+            batches += 1
+        # 空のファイルの場合も列のみのDataFrameを1つ返す
+        if batches == 0:
+            yield _decode_json_lines(b'', file)
+
+
+def _read_json_lines_arrow(data : bytes) -> pd.DataFrame:
+    """
+    pyarrowのJSONリーダーでJSON Linesを読み込む関数
+
+    ログの列は型を指定して読み込む（timestampは文字列のまま、ない列は欠損値）。それ以外の列は型を推定して読み込む。
+    pyarrowのJSONリーダーは辞書型に変換できないため、server_name・levelは文字列で読み込み、呼び出し元でカテゴリ型に変換する。
+
+    :param data:　JSON Linesのバイト列
+    :return:　読み込んだログデータ
+    """
+
+    import pyarrow as pa
+    from pyarrow import json as pa_json
+
+    schema = pa.schema([
+        ('server_name', pa.string()),
+        ('timestamp', pa.string()),
+        ('level', pa.string()),
+        ('cpu_usage', pa.float32()),
+        ('memory_usage', pa.float32()),
+        ('message', pa.string()),
+    ])
+    parse_options = pa_json.ParseOptions(explicit_schema=schema, unexpected_field_behavior='infer')
+    table = pa_json.read_json(io.BytesIO(data), parse_options=parse_options)
+    return table.to_pandas(types_mapper=_arrow_string_mapper)
+
+
+def _iter_line_batches(stream : BinaryIO, batch_size : int) -> Iterator[bytes]:
+    """
+    ストリームをブロック単位で読み込み、batch_size行ずつのバイト列を順に返すジェネレータ
+
+    ブロックごとに改行の位置をnumpyで一度に求め、batch_size行目の改行の位置で区切るため、
+    Pythonの処理は行数によらずブロック数・バッチ数程度で済む（展開するストリームは行単位の読込が遅いため、ブロック単位で読み込む）。
+
+    :param stream:　読込用のストリーム
+    :param batch_size:　1つのバイト列に含める行数（最後のバイト列は少なくてもよい）
+    :return:　完全な行のみからなるバイト列を順に返すイテレータ
+    """
+
+    pending: list[bytes] = []
+    pending_lines = 0
+    rest = b''
+    while True:
+        block = stream.read(_READ_BLOCK_SIZE)
+        if not block:
+            break
+        block = rest + block
+        end = block.rfind(b'\n') + 1
+        block, rest = block[:end], block[end:]
+        newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+        # ブロック内の何行目まで・何バイト目までを切り出したか
+        taken_lines = 0
+        start = 0
+        while pending_lines + len(newlines) - taken_lines >= batch_size:
+            # batch_size行目の改行までを切り出す
+            taken_lines += batch_size - pending_lines
+            position = int(newlines[taken_lines - 1]) + 1
+            pending.append(block[start:position])
+            yield b''.join(pending)
+            start = position
+            pending, pending_lines = [], 0
+        pending.append(block[start:])
+        pending_lines += len(newlines) - taken_lines
+    pending.append(rest)
+    data = b''.join(pending)
+    if data.strip():
+        yield data
+
+
+def _decode_json_lines(data : bytes, file : Path) -> pd.DataFrame:
+    """
+    JSON Linesの行をデコードしてDataFrameにする関数
+
+    pyarrowがある場合はpyarrowのJSONリーダーで読み込む。値の型が行によって異なる・不正な行を含む等で
+    pyarrowで読めない場合や、pyarrowがない場合は、orjson（ない場合はjson）でまとめてデコードし、
+    まとめてデコードできない場合のみ1行ずつデコードし直して不正な行を除外する。
+
+    :param data:　JSON Lines（1行に1つのJSONオブジェクト、空行を含んでもよい）のバイト列
+    :param file:　読込元のファイルパス（ログ出力用）
+    :return:　デコードしたログデータ（行がない場合はLOG_DTYPESの列のみの空のDataFrame）
+    """
+
+    if PYARROW_AVAILABLE and data.strip():
+        try:
+            return _read_json_lines_arrow(data)
+        except ValueError as e:
+            logger.debug(f'Arrow JSON read failed, decoding line by line: {file.resolve()}: {e}')
+
+    if ORJSON_AVAILABLE:
+        import orjson
+        loads = orjson.loads
+    else:
+        loads = json.loads
+
+    lines = [line for line in data.split(b'\n') if line.strip()]
+    try:
+        records = loads(b'[' + b','.join(lines) + b']')
+    except ValueError:
+        records = []
+        for line in lines:
             try:
-                logger.info(f'Loading csv file: {file_resolved}')
-                df = pd.read_csv(file)
-            except Exception as e:
-                logger.error(f'Failed to read {file_resolved}: {e}')
+                records.append(loads(line))
+            except ValueError:
+                continue
+    valid = [record for record in records if isinstance(record, dict)]
+    if len(valid) < len(lines):
+        logger.warning(f'Skipped {len(lines) - len(valid)} invalid JSON lines: {file.resolve()}')
+    if not valid:
+        return pd.DataFrame(columns=list(LOG_DTYPES))
+    return pd.DataFrame(valid)
+
+
+def _load_one_safely(file : Path) -> Union[pd.DataFrame, None]:
+    """
+    1つのログファイルを逐次読み込み、失敗時はログに記録してNoneを返す関数
+
+    :param file:　読込対象ファイルのパス
+    :return:　読み込んだログデータ、失敗時はNone
+    """
+
+    file_resolved = file.resolve()
+    with measure_file('load', file) as record:
+        try:
+            logger.info(f'Loading {_file_kind(file)} file: {file_resolved}')
+            df = read_log_file(file)
+        except Exception as e:
+            logger.error(f'Failed to read {file_resolved}: {e}')
+            record.error = str(e)
+            return None
+        record.rows_out = len(df)
+        return df
+
 
-        elif file.suffix.lower() == '.json':
+def _file_kind(file : Path) -> str:
+    """
+    :param file:　ログファイルのパス
+    :return:　ログ出力用の形式名（例: 'csv'、'jsonl (gzip)'）
+    """
+
+    fmt, compression = log_file_format(file)
+    return fmt if compression is None else f'{fmt} ({compression})'
+
+
+def _load_parallel(target_files : list[Path], workers : int) -> list[Union[pd.DataFrame, None]]:
+    """
+    ログファイルを並列に読み込む関数
+
+    JSON / JSON Linesはプロセスプール、CSVはスレッドプールに投入し、
+    結果は投入順（target_filesの順）に回収する。
+    読み込み失敗はワーカー側ではなく呼び出し側でログに記録する（子プロセスのログ設定に依存しないため）。
+
+    :param target_files:　読込対象ファイルパスのリスト
+    :param workers:　各プールのワーカー数
+    :return:　target_filesと同じ順のDataFrame（失敗時はNone）のリスト
+    """
+
+    logger.info(f'Loading {len(target_files)} files with {workers} workers')
+    futures: list[Future] = []
+    with ProcessPoolExecutor(max_workers=workers) as process_pool, \
+            ThreadPoolExecutor(max_workers=workers) as thread_pool:
+        for file in target_files:
+            # Parquet / Featherの読込はpyarrow内部で並列化・GIL解放されるためスレッドで扱う
+            pool = process_pool if log_file_format(file)[0] in ('json', 'jsonl') else thread_pool
+            futures.append(pool.submit(read_log_file, file))
+
+        df_or_none_list: list[Union[pd.DataFrame, None]] = []
+        for file, future in zip(target_files, futures):
+            file_resolved = file.resolve()
             try:
-                logger.info(f'Loading json file: {file_resolved}')
-                df = pd.read_json(file)
+                df = future.result()
+                df_or_none_list.append(df)
+                logger.info(f'Loaded {_file_kind(file)} file: {file_resolved}')
+                # ワーカー側の処理時間は計測できないため行数のみ記録する
+                add_file('load', file, rows_out=len(df))
             except Exception as e:
                 logger.error(f'Failed to read {file_resolved}: {e}')
+                df_or_none_list.append(None)
+                add_file('load', file, error=str(e))
 
-        # 読み込み成功時のみリストに追加（None を渡さない）
-        if df is not None:
-            df_list.append(df)
-            file_list.append(file)
-
-    if not df_list:
-        logger.exception(f'No csv or json file in directory: {data_dir_resolved}')
-        raise FileNotFoundError(f'No csv or json file in directory: {data_dir_resolved}')
-
-    logger.info(f'Loaded {len(df_list)} files from {data_dir_resolved}')
-    return df_list, file_list
+    return df_or_none_list
 
 #ここからはテストです
 if __name__ == '__main__':
     setup_logging(level= logging.DEBUG)
     dfs, files = load_logs_from_dir(Path(__file__).parent.parent / 'data' / 'sample_logs' )
     print(dfs)
-    print(files)
\ No newline at end of file
+    print(files)
+    dfs_parallel, files_parallel = load_logs_from_dir(Path(__file__).parent.parent / 'data' / 'sample_logs', workers=4)
+    print(files == files_parallel and all(a.equals(b) for a, b in zip(dfs, dfs_parallel)))
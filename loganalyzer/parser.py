@@ -1,14 +1,76 @@
 """
 単一/複数ログファイルのクレンジングと結合。必須列チェック・欠損除去・日時変換・重複削除を行う。
 """
+import numpy as np
 import pandas as pd
 import logging
+from pandas.api.types import union_categoricals
 from pathlib import Path
+from typing import Union
+from loganalyzer.filters import LogFilter
+from loganalyzer.instrumentation import measure_file
 from loganalyzer.logging_config import setup_logging
 
 logger = logging.getLogger(__name__)
 
-def parse_all(df_list : list[pd.DataFrame], file_list : list[Path]) -> pd.DataFrame:
+# 解析・出力で参照する必須列
+REQUIRED_COLUMNS = ['server_name', 'timestamp', 'level', 'cpu_usage', 'memory_usage', 'message']
+# 集計で参照する列（messageを除く）
+ANALYSIS_COLUMNS = ['server_name', 'timestamp', 'level', 'cpu_usage', 'memory_usage']
+# 読込時に指定する列の型（timestampはparse_timestampsで変換するため文字列のまま読み込む）
+LOG_DTYPES = {
+    'server_name': 'category',
+    'timestamp': 'str',
+    'level': 'category',
+    'cpu_usage': 'float32',
+    'memory_usage': 'float32',
+    'message': 'str',
+}
+USAGE_COLUMNS = ['cpu_usage', 'memory_usage']
+# 省メモリ形式（compact_logs）でカテゴリ型（辞書符号化）にする列
+CATEGORY_COLUMNS = ['server_name', 'level']
+# 省メモリ形式のtimestampの型（1970-01-01からの秒数をint64で保持する日時型）
+COMPACT_TIMESTAMP_DTYPE = 'datetime64[s]'
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+# 'YYYY-MM-DD HH:MM:SS'の文字数・区切り文字の位置・数字の位置
+_TIMESTAMP_WIDTH = 19
+_SEPARATORS = {4: '-', 7: '-', 10: ' ', 13: ':', 16: ':'}
+_SEPARATOR_POSITIONS = list(_SEPARATORS)
+_SEPARATOR_CODES = np.array([ord(separator) for separator in _SEPARATORS.values()], dtype='uint8')
+_DIGIT_POSITIONS = [position for position in range(_TIMESTAMP_WIDTH) if position not in _SEPARATORS]
+# 各桁（14桁）の上限値（分・秒の十の位は5）
+_DIGIT_MAX = np.array([9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 5, 9, 5, 9], dtype='uint8')
+# 各桁から年・月・日・時・その日の経過秒数を求める重み行列
+_FIELD_WEIGHTS = np.array([
+    # 年    月   日   時   経過秒数
+    [1000, 0, 0, 0, 0],
+    [100, 0, 0, 0, 0],
+    [10, 0, 0, 0, 0],
+    [1, 0, 0, 0, 0],
+    [0, 10, 0, 0, 0],
+    [0, 1, 0, 0, 0],
+    [0, 0, 10, 0, 0],
+    [0, 0, 1, 0, 0],
+    [0, 0, 0, 10, 36000],
+    [0, 0, 0, 1, 3600],
+    [0, 0, 0, 0, 600],
+    [0, 0, 0, 0, 60],
+    [0, 0, 0, 0, 10],
+    [0, 0, 0, 0, 1],
+], dtype='float32')
+# 高速変換の対象とする年の範囲と、その範囲の月ごとの月初（1970-01-01からの日数）・日数の表
+_FIRST_YEAR, _LAST_YEAR = 1678, 2261
+_MONTH_STARTS = np.arange(
+    np.datetime64(f'{_FIRST_YEAR}-01'), np.datetime64(f'{_LAST_YEAR + 1}-02'), dtype='datetime64[M]'
+).astype('datetime64[D]').view('int64')
+_MONTH_START_DAYS = _MONTH_STARTS[:-1]
+_DAYS_IN_MONTH = np.diff(_MONTH_STARTS).astype('int32')
+# pd.to_datetimeが返す日時型の単位（pandasのバージョンにより異なるため合わせる）
+_DATETIME_DTYPE = pd.to_datetime(pd.Series(['2000-01-01 00:00:00']), format=TIMESTAMP_FORMAT).dtype
+
+def parse_all(df_list : list[pd.DataFrame], file_list : list[Path], log_filter : Union[LogFilter, None] = None,
+              compact : bool = False, intern_messages : bool = True) -> pd.DataFrame:
     """
     複数ログファイルのデータをクレンジングし、一つにまとめる関数
 
@@ -19,9 +81,13 @@ def parse_all(df_list : list[pd.DataFrame], file_list : list[Path]) -> pd.DataFr
     処理をスキップすることで全体処理への影響を最小限に抑える。
 
     有効なデータのみを統合し、1つのDataFrameとして返却する。
+    compact=Trueの場合は、ファイル間でカテゴリを揃えて結合し（文字列への戻りを防ぐ）、省メモリ形式（compact_logs関数）で返却する。
 
     :param df_list:　読み込まれたログデータのDataFrameリスト
     :param file_list:　各DataFrameに対応するファイルパスのリスト
+    :param log_filter:　行の絞り込み条件、指定しない場合は全行を対象とする
+    :param compact:　Trueの場合、省メモリ形式で返却する
+    :param intern_messages:　compact=Trueの場合に、message列もカテゴリ型（同じメッセージを1つだけ保持する辞書）にする
     :return:　クレンジング・統合されたログデータ
     """
 
@@ -30,14 +96,21 @@ def parse_all(df_list : list[pd.DataFrame], file_list : list[Path]) -> pd.DataFr
     for df,file_path in zip(df_list, file_list):
         file_resolved = file_path.resolve()
 
-        try:
-            parsed_df = parse_one(df, file_resolved)
-        except (ValueError, TypeError, KeyError) as e:
-            logger.exception(f'Failed to parse file: {file_resolved}')
-            continue
+        with measure_file('parse', file_path) as record:
+            record.rows_in = len(df)
+            try:
+                parsed_df = parse_one(df, file_resolved, log_filter)
+            except (ValueError, TypeError, KeyError) as e:
+                logger.exception(f'Failed to parse file: {file_resolved}')
+                record.error = f'{type(e).__name__}: {e}'
+                continue
+            record.rows_out = len(parsed_df)
 
         if parsed_df.empty:
-            logger.error(f'No data found from file after parsing: {file_resolved}')
+            if log_filter is not None and log_filter.is_active():
+                logger.info(f'No rows matched the filter: {file_resolved}')
+            else:
+                logger.error(f'No data found from file after parsing: {file_resolved}')
             continue
         parsed_df_list.append(parsed_df)
 
@@ -46,38 +119,46 @@ def parse_all(df_list : list[pd.DataFrame], file_list : list[Path]) -> pd.DataFr
         raise RuntimeError(f'All files are empty or empty after parsing')
 
     logger.info('All Parsing completed')
+    if compact:
+        return compact_logs(concat_logs(parsed_df_list), intern_messages=intern_messages)
     return pd.concat(parsed_df_list, ignore_index=True)
 
 
-def parse_one(df : pd.DataFrame, file : Path) -> pd.DataFrame:
+def parse_one(df : pd.DataFrame, file : Path, log_filter : Union[LogFilter, None] = None) -> pd.DataFrame:
     """
     単一ログファイルのデータをクレンジングする関数
 
     必須列の存在確認、欠損したデートの除外、日時形式変換、重複データ削除などの前処理を行う。
+    日時変換は固定長形式の高速変換（parse_timestamps）、重複削除は行ハッシュの比較（drop_duplicate_rows）で行う。
+    絞り込み条件が指定された場合は、日時変換・重複削除の前に対象外の行を除外する。
     不正なデータ形式や必須項目不足の場合は例外を検知し、上位処理に通知する。
 
     :param df: 1つのログファイルから読み込まれたDataFrame
     :param file: 対象ログファイルのパス
+    :param log_filter: 行の絞り込み条件、指定しない場合は全行を対象とする
     :return:　クレンジングされたログデータ
     """
 
     if df.empty:
         return df
     file_resolved = file.resolve()
-    # 解析・出力で参照する必須列
-    column_list = ['server_name', 'timestamp', 'level', 'cpu_usage', 'memory_usage', 'message']
-    if not all(col in df.columns for col in column_list):
+    if not all(col in df.columns for col in REQUIRED_COLUMNS):
         logger.error(f'Missing columns in file: {file_resolved}')
         raise KeyError(f'Missing columns in file: {file_resolved}')
 
     logger.info(f'Parsing file: {file_resolved}')
     try:
         df = df.dropna(subset=['server_name', 'timestamp', 'message'])
+        if log_filter is not None:
+            df = log_filter.filter_servers(df)
 
-        df['timestamp'] = pd.to_datetime(df['timestamp'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+        df['timestamp'] = parse_timestamps(df['timestamp'])
         df = df.dropna(subset=['timestamp'])
+        if log_filter is not None:
+            df = log_filter.filter_time(df)
 
-        df = df.drop_duplicates()
+        df = coerce_usage(df)
+        df = drop_duplicate_rows(df)
     except (ValueError, TypeError, KeyError) as e:
         logger.error(f'Data is not valid: {file_resolved}: {e}')
         raise
@@ -86,6 +167,229 @@ def parse_one(df : pd.DataFrame, file : Path) -> pd.DataFrame:
     return df
 
 
+def parse_timestamps(series : pd.Series) -> pd.Series:
+    """
+    'YYYY-MM-DD HH:MM:SS'形式の文字列を日時型に変換する関数
+
+    pd.to_datetime(format='%Y-%m-%d %H:%M:%S', errors='coerce')と同じ結果を返す。
+    固定長（19文字）の文字列を文字コードの行列として扱い、各桁をnumpyで一括計算する。
+    pyarrow形式の文字列列はバッファをコピーせずに参照する。
+    固定長形式として解釈できない行（桁数違い・範囲外の値など）のみpd.to_datetimeで変換するため、
+    不正な値は従来どおり欠損値（NaT）になる。
+    既に日時型の場合はそのまま返す。
+
+    :param series: timestamp列
+    :return: 日時型に変換したtimestamp列
+    """
+
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series
+
+    codes = _timestamp_char_codes(series)
+    result = np.full(len(series), np.datetime64('NaT'), dtype=_DATETIME_DTYPE)
+    if codes is None:
+        is_parsed = np.zeros(len(series), dtype=bool)
+    else:
+        seconds, is_parsed = _timestamp_seconds(codes)
+        result[is_parsed] = seconds[is_parsed].astype('datetime64[s]').astype(_DATETIME_DTYPE)
+
+    # 高速変換で解釈できなかった行は従来の方法で変換する（不正値はNaT）
+    rest = ~is_parsed
+    if rest.any() and (rest := rest & series.notna().to_numpy()).any():
+        result[rest] = pd.to_datetime(
+            series[rest].astype(str), format=TIMESTAMP_FORMAT, errors='coerce'
+        ).to_numpy().astype(_DATETIME_DTYPE)
+    return pd.Series(result, index=series.index, name=series.name)
+
+
+def _timestamp_char_codes(series : pd.Series) -> Union[np.ndarray, None]:
+    """
+    文字列列を（行数×20）の文字コード行列に変換する関数
+
+    20文字目が0でない行は19文字を超える文字列であり、固定長形式ではない。
+
+    :param series: timestamp列
+    :return: 文字コードの行列、文字列以外の値を含む場合はNone
+    """
+
+    array = series.array
+    pa_array = getattr(array, '_pa_array', None)
+    if pa_array is not None and pa_array.null_count == 0 and len(pa_array) > 0:
+        # pyarrowの文字列バッファは全行が19バイトなら連続した固定長データとして参照できる
+        import pyarrow as pa
+        combined = pa_array.combine_chunks()
+        if pa.types.is_large_string(combined.type):
+            offsets_dtype = 'int64'
+        elif pa.types.is_string(combined.type):
+            offsets_dtype = 'int32'
+        else:
+            offsets_dtype = None
+        if offsets_dtype is not None:
+            _, offsets_buffer, data_buffer = combined.buffers()
+            offsets = np.frombuffer(offsets_buffer, dtype=offsets_dtype)[combined.offset:combined.offset + len(combined) + 1]
+            if (np.diff(offsets) == _TIMESTAMP_WIDTH).all():
+                data = np.frombuffer(data_buffer, dtype='uint8')[offsets[0]:offsets[-1]]
+                codes = np.zeros((len(combined), _TIMESTAMP_WIDTH + 1), dtype='uint8')
+                codes[:, :_TIMESTAMP_WIDTH] = data.reshape(-1, _TIMESTAMP_WIDTH)
+                return codes
+
+    values = series.to_numpy(dtype=object)
+    try:
+        return values.astype(f'U{_TIMESTAMP_WIDTH + 1}').view('uint32').reshape(len(values), _TIMESTAMP_WIDTH + 1)
+    except (TypeError, ValueError):
+        return None
+
+
+def _timestamp_seconds(codes : np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    文字コード行列から1970-01-01からの秒数を計算する関数
+
+    各桁の検証は行列全体に対して一括で行い、年・月・日・時・経過秒数は桁の重み行列との積で求める。
+    日付から日数への変換は、月ごとの月初日数・日数の表を引いて求める。
+
+    :param codes: _timestamp_char_codesで作成した文字コード行列
+    :return: 秒数の配列と、固定長形式として正しく解釈できた行を示す配列
+    """
+
+    if codes.dtype != np.uint8:
+        # ASCII以外の文字を含む行は固定長形式ではない（下位バイトが数字と一致する文字を除外する）
+        is_valid = (codes < 128).all(axis=1)
+        codes = codes.astype('uint8')
+    else:
+        is_valid = np.ones(len(codes), dtype=bool)
+    is_valid &= codes[:, _TIMESTAMP_WIDTH] == 0
+    is_valid &= (codes[:, _SEPARATOR_POSITIONS] == _SEPARATOR_CODES).all(axis=1)
+
+    # uint8の減算は'0'未満で桁あふれして大きな値になるため、上限の判定だけで数字か判定できる
+    # （分・秒の十の位は5以下も同時に判定する）
+    digits = codes[:, _DIGIT_POSITIONS] - np.uint8(ord('0'))
+    is_valid &= (digits <= _DIGIT_MAX).all(axis=1)
+    # 値は最大86399のためfloat32の行列積でも誤差なく計算できる
+    fields = np.ascontiguousarray((digits.astype('float32') @ _FIELD_WEIGHTS).astype('int32').T)
+    year, month, day, hour, second_of_day = fields
+
+    # 対応範囲外の年（日時型の表現範囲の境界付近）はpd.to_datetimeに任せる
+    is_valid &= (year >= _FIRST_YEAR) & (year <= _LAST_YEAR) & (month >= 1) & (month <= 12) & (hour <= 23)
+    month_index = np.clip((year - _FIRST_YEAR) * 12 + month - 1, 0, len(_DAYS_IN_MONTH) - 1)
+    is_valid &= (day >= 1) & (day <= _DAYS_IN_MONTH[month_index])
+
+    seconds = (_MONTH_START_DAYS[month_index] + (day - 1)) * 86400 + second_of_day
+    return seconds, is_valid
+
+
+def coerce_usage(df : pd.DataFrame) -> pd.DataFrame:
+    """
+    CPU / メモリ使用率の列を数値型に揃える関数
+
+    型指定付きで読み込めなかったファイルでは文字列が混在するため、
+    数値に変換できない値を欠損値として扱う（平均値の算出対象から除外される）。
+
+    :param df: ログデータ
+    :return: 使用率の列を数値型にしたログデータ
+    """
+
+    for col in USAGE_COLUMNS:
+        if not pd.api.types.is_numeric_dtype(df[col].dtype):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(LOG_DTYPES[col])
+    return df
+
+
+def concat_logs(df_list : list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    カテゴリ型の列を保ったまま複数のログデータを結合する関数
+
+    pd.concatはファイルごとにカテゴリが異なるカテゴリ型の列を文字列（object型）に戻すため、
+    そのような列は全ファイルのカテゴリの和集合（名前順）のカテゴリ型として結合する。
+
+    :param df_list: ログデータのリスト
+    :return: 結合したログデータ
+    """
+
+    df_list = list(df_list)
+    if not df_list:
+        return pd.concat(df_list, ignore_index=True)
+    mixed = [
+        col for col in df_list[0].columns
+        if all(col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype) for df in df_list)
+        and any(df[col].dtype != df_list[0][col].dtype for df in df_list)
+    ]
+    if not mixed:
+        return pd.concat(df_list, ignore_index=True)
+
+    # カテゴリ型の列はunion_categoricalsで符号を付け直して結合し、それ以外の列のみpd.concatで結合する
+    combined = pd.concat([df.drop(columns=mixed) for df in df_list], ignore_index=True)
+    for col in mixed:
+        combined[col] = union_categoricals([df[col].array for df in df_list], sort_categories=True)
+    return combined[df_list[0].columns]
+
+
+def compact_logs(df : pd.DataFrame, intern_messages : bool = True) -> pd.DataFrame:
+    """
+    クレンジング済みのログデータを省メモリ形式に変換する関数
+
+    - server_name, level: カテゴリ型（値の辞書と整数コード）
+    - timestamp: 1970-01-01からの秒数をint64で保持する日時型（COMPACT_TIMESTAMP_DTYPE）
+    - cpu_usage, memory_usage: 全ての値が0〜255の整数の場合はuint8、それ以外（小数・欠損値を含む）はfloat32
+    - message: intern_messages=Trueの場合はカテゴリ型（同じメッセージは1つだけ保持する）
+
+    列の型以外は変わらないため、analyze_df等はそのまま受け付け、同じ集計結果を返す。
+    元のDataFrameは変更しない。
+
+    :param df: クレンジング済みのログデータ
+    :param intern_messages: Trueの場合、message列もカテゴリ型にする
+    :return: 省メモリ形式のログデータ
+    """
+
+    dtypes = {}
+    for col in CATEGORY_COLUMNS + (['message'] if intern_messages else []):
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            dtypes[col] = 'category'
+    for col in USAGE_COLUMNS:
+        if col in df.columns:
+            dtypes[col] = _compact_usage_dtype(df[col])
+    compacted = df.astype(dtypes)
+
+    if 'timestamp' in compacted.columns and isinstance(compacted['timestamp'].dtype, np.dtype) \
+            and compacted['timestamp'].dtype.kind == 'M' and compacted['timestamp'].dtype != COMPACT_TIMESTAMP_DTYPE:
+        values = compacted['timestamp'].to_numpy()
+        seconds = values.astype(COMPACT_TIMESTAMP_DTYPE)
+        # 秒未満を含む場合は単位を変えない（値を丸めないため）
+        if ((seconds.astype(values.dtype) == values) | np.isnat(values)).all():
+            compacted['timestamp'] = seconds
+    return compacted
+
+
+def _compact_usage_dtype(series : pd.Series) -> str:
+    """
+    :param series: 使用率の列
+    :return: 全ての値が0〜255の整数の場合は'uint8'、それ以外は'float32'
+    """
+
+    values = series.to_numpy(dtype='float64', na_value=np.nan)
+    if len(values) and not np.isnan(values).any() and values.min() >= 0 and values.max() <= 255 \
+            and (values == np.round(values)).all():
+        return 'uint8'
+    return 'float32'
+
+
+def drop_duplicate_rows(df : pd.DataFrame) -> pd.DataFrame:
+    """
+    重複行を削除する関数
+
+    全列の値をオブジェクトとして比較する代わりに、行ごとの64ビットハッシュ値で重複を判定する。
+    最初に出現した行を残す（DataFrame.drop_duplicatesと同じ）。
+
+    :param df: ログデータ
+    :return: 重複行を削除したログデータ
+    """
+
+    if df.empty:
+        return df
+    row_hashes = pd.util.hash_pandas_object(df, index=False)
+    is_duplicated = row_hashes.duplicated().to_numpy()
+    return df[~is_duplicated] if is_duplicated.any() else df
+
+
 #ここからはテストです
 if __name__ == '__main__':
     setup_logging(level=logging.DEBUG)
@@ -104,4 +408,5 @@ if __name__ == '__main__':
     df_test = pd.DataFrame(test_data)
 
     parsed_data = parse_one(df_test, Path('fake_path.csv'))
-    print(parsed_data)
\ No newline at end of file
+    print(parsed_data)
+    print(parse_timestamps(pd.Series(['2024-02-29 23:59:59', '2025-02-29 00:00:00', '2025-1-1 7:50:00', None])))
\ No newline at end of file
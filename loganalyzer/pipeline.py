@@ -0,0 +1,192 @@
+"""
+ログの読込・クレンジング・集計を、指定された処理方式（キャッシュ・列指向形式・ストリーミング・シャード分割・一括処理）で行う共通処理。
+main.pyとコマンドライン（loganalyzer.cli）はどちらもこのモジュールのanalyze_logs関数で集計する。
+
+処理方式ごとのモジュール（pandasを含む）は、その方式で実行する場合のみ読み込む。
+"""
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING, Union
+from loganalyzer.instrumentation import stage
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from loganalyzer.filters import LogFilter
+
+logger = logging.getLogger(__name__)
+
+def analyze_logs(
+        data_dir : Path,
+        log_filter : Union['LogFilter', None] = None,
+        workers : Union[int, None] = None,
+        stream : bool = False,
+        chunksize : Union[int, None] = None,
+        cache_dir : Union[Path, None] = None,
+        columnar_dir : Union[Path, None] = None,
+        columnar_format : str = 'parquet',
+        shard_workers : Union[int, None] = None,
+        compact : bool = True,
+        rollup_dir : Union[Path, None] = None,
+        template_index : Union[Path, None] = None,
+        detect_anomaly : bool = True,
+        result_store : Union[Path, None] = None) -> 'pd.DataFrame':
+    """
+    指定された処理方式でログを読込・クレンジング・集計し、異常判定・集計結果の保存まで行う関数
+
+    処理方式の優先順はキャッシュ、列指向形式、ストリーミング、シャード分割、一括処理とする。
+    ロールアップ・テンプレート索引はクレンジング後のログ（生データ）から作成するため、一括処理・列指向形式の場合のみ作成する。
+
+    :param data_dir:　ログデータが格納されているディレクトリのパス
+    :param log_filter:　絞り込み条件、指定しない場合は全行を対象とする
+    :param workers:　ログファイル並列読込のワーカー数（一括処理のみ）
+    :param stream:　Trueの場合、ファイル・チャンク単位で集計するストリーミング処理を行う
+    :param chunksize:　ストリーミング処理・キャッシュ利用時のCSVの1チャンクあたりの行数
+    :param cache_dir:　ファイル単位の部分集計キャッシュの保存先
+    :param columnar_dir:　列指向形式の保存先、指定した場合はログを変換した上で保存先から読み込む
+    :param columnar_format:　列指向形式の種類（'parquet' または 'feather'）
+    :param shard_workers:　サーバー名のハッシュ値で分けたシャードを並列に処理するプロセス数
+    :param compact:　Trueの場合、クレンジング後のログを省メモリ形式で保持する（一括処理・列指向形式）
+    :param rollup_dir:　分・時・日・週の集計値の保存先
+    :param template_index:　メッセージのテンプレート索引（SQLite）のファイルパス
+    :param detect_anomaly:　Trueの場合、集計結果に異常判定の列を追加する
+    :param result_store:　集計結果の保存先（SQLite）のファイルパス（絞り込み時は対象のサーバー・日付のみ置き換える）
+    :return:　分析・集計後のデータ
+    """
+
+    if log_filter is not None and not log_filter.is_active():
+        log_filter = None
+
+    parsed_df = None
+    if cache_dir is not None:
+        from loganalyzer.cache import analyze_cached
+        with stage('analyze_cached') as record:
+            analyzed_df = analyze_cached(data_dir, Path(cache_dir), chunksize=chunksize, log_filter=log_filter)
+            record.rows_out = len(analyzed_df)
+    elif columnar_dir is not None:
+        parsed_df = _load_columnar(data_dir, Path(columnar_dir), columnar_format, log_filter, compact,
+                                   with_message=template_index is not None)
+    elif stream:
+        from loganalyzer.streaming import analyze_stream
+        with stage('analyze_stream') as record:
+            analyzed_df = analyze_stream(data_dir, chunksize=chunksize, log_filter=log_filter)
+            record.rows_out = len(analyzed_df)
+    elif shard_workers is not None:
+        from loganalyzer.sharded import analyze_sharded
+        with stage('analyze_sharded') as record:
+            analyzed_df = analyze_sharded(data_dir, workers=shard_workers, log_filter=log_filter)
+            record.rows_out = len(analyzed_df)
+    else:
+        from loganalyzer.loader import load_logs_from_dir
+        from loganalyzer.parser import parse_all
+        with stage('load') as record:
+            df_list, file_list = load_logs_from_dir(data_dir, workers=workers, log_filter=log_filter)
+            record.rows_out = sum(len(df) for df in df_list)
+            record.files = len(file_list)
+        with stage('parse') as record:
+            record.rows_in = sum(len(df) for df in df_list)
+            parsed_df = parse_all(df_list, file_list, log_filter=log_filter, compact=compact)
+            record.rows_out = len(parsed_df)
+
+    if parsed_df is not None:
+        from loganalyzer.analyzer import analyze_df
+        with stage('analyze') as record:
+            record.rows_in = len(parsed_df)
+            analyzed_df = analyze_df(parsed_df)
+            record.rows_out = len(analyzed_df)
+        _build_indexes(parsed_df, rollup_dir, template_index)
+    else:
+        if rollup_dir is not None:
+            logger.warning('Rollups require the raw rows and are only built in batch or columnar mode, skipping')
+        if template_index is not None:
+            logger.warning('The template index requires the raw rows and is only built in batch or columnar mode, skipping')
+
+    if detect_anomaly:
+        from loganalyzer.anomaly import detect_anomalies
+        with stage('anomaly') as record:
+            record.rows_in = len(analyzed_df)
+            analyzed_df = detect_anomalies(analyzed_df)
+            record.rows_out = len(analyzed_df)
+
+    if result_store is not None:
+        from loganalyzer.results import ResultStore
+        with stage('result_store') as record:
+            record.rows_in = len(analyzed_df)
+            store = ResultStore(Path(result_store))
+            # 絞り込み時は対象のサーバー・日付のみ置き換え、それ以外は保存し直す
+            record.rows_out = (store.rebuild if log_filter is None else store.update)(analyzed_df)
+            store.close()
+    return analyzed_df
+
+
+def _load_columnar(
+        data_dir : Path,
+        columnar_dir : Path,
+        columnar_format : str,
+        log_filter : Union['LogFilter', None],
+        compact : bool,
+        with_message : bool) -> 'pd.DataFrame':
+    """
+    ログを列指向形式の保存先に変換した上で、対象のパーティションのみを読み込む関数
+
+    :param data_dir:　ログデータが格納されているディレクトリのパス
+    :param columnar_dir:　列指向形式の保存先
+    :param columnar_format:　列指向形式の種類（'parquet' または 'feather'）
+    :param log_filter:　絞り込み条件、指定しない場合は全行を対象とする
+    :param compact:　Trueの場合、省メモリ形式に変換する
+    :param with_message:　Trueの場合、message列も読み込む（テンプレート索引を作成する場合）
+    :return:　クレンジング済みログデータ
+    """
+
+    from loganalyzer.columnar import convert_to_store, load_store
+    from loganalyzer.parser import ANALYSIS_COLUMNS, compact_logs
+
+    with stage('convert'):
+        convert_to_store(data_dir, columnar_dir, fmt=columnar_format)
+    with stage('load_store') as record:
+        columns = ANALYSIS_COLUMNS + ['message'] if with_message else None
+        if log_filter is None:
+            parsed_df = load_store(columnar_dir, columns=columns)
+        else:
+            parsed_df = load_store(
+                columnar_dir, columns=columns, servers=log_filter.servers,
+                since=log_filter.first_day(), until=log_filter.last_day()
+            )
+            # 時刻を含む期間はパーティション（日付）単位では絞り切れないため行単位で絞り込む
+            parsed_df = log_filter.filter_time(parsed_df)
+        if parsed_df.empty:
+            # 一括処理（parse_all）と同じく、集計対象の行が無い場合は処理を中止する
+            logger.error(f'All files are empty or empty after parsing')
+            raise RuntimeError(f'All files are empty or empty after parsing')
+        if compact:
+            parsed_df = compact_logs(parsed_df)
+        record.rows_out = len(parsed_df)
+    return parsed_df
+
+
+def _build_indexes(parsed_df : 'pd.DataFrame', rollup_dir : Union[Path, None], template_index : Union[Path, None]):
+    """
+    クレンジング済みログからロールアップ・テンプレート索引を作成し直す関数（指定されたもののみ）
+
+    :param parsed_df:　クレンジング済みログデータ
+    :param rollup_dir:　分・時・日・週の集計値の保存先
+    :param template_index:　メッセージのテンプレート索引（SQLite）のファイルパス
+    :return:　なし
+    """
+
+    if rollup_dir is not None:
+        from loganalyzer.rollup import RollupStore
+        with stage('rollup') as record:
+            record.rows_in = len(parsed_df)
+            record.rows_out = sum(RollupStore(Path(rollup_dir)).rebuild(parsed_df).values())
+    if template_index is not None:
+        from loganalyzer.templates import TemplateIndex
+        with stage('templates') as record:
+            record.rows_in = len(parsed_df)
+            record.rows_out = len(TemplateIndex(Path(template_index)).rebuild(parsed_df))
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    from loganalyzer.logging_config import setup_logging
+    setup_logging(level=logging.DEBUG)
+    print(analyze_logs(Path(__file__).parent.parent / 'data' / 'sample_logs'))
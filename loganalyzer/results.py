@@ -0,0 +1,561 @@
+"""
+analyze_df の集計結果（サーバー別・日別）を SQLite に保存し、パイプラインを再実行せずにサーバー別・期間別の問い合わせに答える。
+問い合わせ結果は LRU キャッシュに保持し、集計結果が更新された（別のプロセスの更新を含む）場合は破棄する。
+任意でローカルの HTTP エンドポイント（GET のみ）から同じ問い合わせに JSON で答える。
+"""
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterable, Union
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pandas as pd
+from loganalyzer.analyzer import KEY_COLUMNS, METRIC_COLUMNS
+from loganalyzer.anomaly import ANOMALY_COLUMNS
+from loganalyzer.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# 問い合わせ結果のキャッシュの既定の件数
+CACHE_SIZE = 128
+# 列の型（SQLiteの型と、読み出し時に戻すpandasの型）
+_COLUMN_KINDS = {'int': ('INTEGER', 'int64'), 'float': ('REAL', 'float64'), 'bool': ('INTEGER', 'bool'),
+                 'text': ('TEXT', 'str')}
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    server_name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    PRIMARY KEY (date, server_name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_server ON results (server_name, date);
+CREATE TABLE IF NOT EXISTS result_columns (
+    position INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+class ResultStore:
+    """
+    analyze_dfの集計結果を保存し、サーバー別・期間別の問い合わせに答える
+
+    SQLiteのファイルに、(date, server_name) を主キー、(server_name, date) を索引とする表（results）として保存する。
+    行は主キーの順に格納されるため、全サーバーの期間の問い合わせ（fleet・summary）は連続した範囲の読込、
+    サーバーを指定した問い合わせは索引の範囲検索（対象の行数分の主キーの検索）になる。
+    集計結果の列（レベル別件数・使用率・異常判定など）は保存時の列に合わせて追加する（result_columnsに型を記録する）。
+    レベル別件数の列は、レベルを持つ行が無い日を含むと欠損値を含む小数になるが、列名で判定して常に整数の列とする
+    （欠損値は0件として読み出す）。
+
+    updateで保存するたびにmetaの版数を上げる。問い合わせのたびに版数を読み（主キーの1行の読込のみ）、
+    前回から変わっている場合はキャッシュを破棄するため、別のプロセス（一括処理・追記監視・取込サーバー）が
+    更新した場合も古い結果を返さない。接続は1つをスレッド間で共有し、ロックで排他する。
+    """
+
+    def __init__(self, path: Path, cache_size: int = CACHE_SIZE):
+        """
+        :param path: 保存先のファイルパス（存在しない場合はupdateで作成する）
+        :param cache_size: 問い合わせ結果のキャッシュの件数、0の場合はキャッシュしない
+        """
+
+        self.path = Path(path)
+        self.cache_size = cache_size
+        self._conn: Union[sqlite3.Connection, None] = None
+        self._lock = threading.RLock()
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_version: Union[int, None] = None
+        self._hits = 0
+        self._misses = 0
+
+    def update(self, analyzed_df: pd.DataFrame) -> int:
+        """
+        集計結果を保存する（保存済みの同じサーバー・日付の行は置き換える）
+
+        :param analyzed_df: analyze_df関数（・detect_anomalies関数）で生成された集計結果
+        :return: 保存した行数
+        """
+
+        columns = [col for col in analyzed_df.columns if col not in KEY_COLUMNS]
+        kinds = {col: _column_kind(col, analyzed_df[col]) for col in columns}
+        values = [analyzed_df['server_name'].astype(str).tolist(), [str(date) for date in analyzed_df['date']]]
+        for col in columns:
+            series = analyzed_df[col]
+            # numpyの値はPythonの値に、欠損値はNone（SQLiteのNULL）にする
+            values.append(series.astype(object).where(series.notna(), None).tolist())
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            conn = self._connect(create=True)
+            with conn:
+                known = {name for name, in conn.execute('SELECT name FROM result_columns')}
+                for col in columns:
+                    if col not in known:
+                        conn.execute(f'ALTER TABLE results ADD COLUMN {_quote(col)} {_COLUMN_KINDS[kinds[col]][0]}')
+                        conn.execute('INSERT INTO result_columns (position, name, kind) '
+                                     'VALUES ((SELECT COUNT(*) FROM result_columns), ?, ?)', (col, kinds[col]))
+                names = ', '.join(_quote(col) for col in KEY_COLUMNS + columns)
+                placeholders = ', '.join('?' * (len(columns) + 2))
+                conn.executemany(f'INSERT OR REPLACE INTO results ({names}) VALUES ({placeholders})', zip(*values))
+                conn.execute("INSERT INTO meta (key, value) VALUES ('version', 1) "
+                             "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+        logger.info(f'Result store updated with {len(analyzed_df)} rows: {self.path.resolve()}')
+        return len(analyzed_df)
+
+    def rebuild(self, analyzed_df: pd.DataFrame) -> int:
+        """
+        保存済みの集計結果を破棄し、集計結果を保存し直す
+
+        ファイルは削除せずに表を作り直すため、他のプロセスの接続・版数はそのまま使える。
+
+        :param analyzed_df: analyze_df関数（・detect_anomalies関数）で生成された集計結果
+        :return: 保存した行数
+        """
+
+        if self.path.exists():
+            with self._lock:
+                conn = self._connect(create=True)
+                with conn:
+                    conn.execute('DROP TABLE results')
+                    conn.execute('DROP TABLE result_columns')
+                    conn.executescript(_SCHEMA)
+        return self.update(analyzed_df)
+
+    def version(self) -> int:
+        """
+        :return: 保存済みの集計結果の版数（updateのたびに上がる、保存されていない場合は0）
+        """
+
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return 0
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return 0 if row is None else row[0]
+
+    def servers(self) -> list[str]:
+        """
+        :return: 保存済みのサーバー名のリスト（昇順）
+        """
+
+        return self._cached(('servers',), lambda conn: [
+            name for name, in conn.execute('SELECT DISTINCT server_name FROM results ORDER BY server_name')
+        ], list)
+
+    def query(self, servers: Union[Iterable[str], None] = None, since: Union[str, datetime.date, None] = None,
+              until: Union[str, datetime.date, None] = None,
+              columns: Union[Iterable[str], None] = None) -> pd.DataFrame:
+        """
+        サーバー別・日別の集計結果を返す
+
+        :param servers: 対象サーバー名、指定しない場合は全サーバー
+        :param since: 対象期間の開始日（この日を含む）、指定しない場合は制限なし
+        :param until: 対象期間の終了日（この日を含む）、指定しない場合は制限なし
+        :param columns: 返す列（server_name・dateは常に返す）、指定しない場合は全列
+        :return: analyze_dfと同じ形式（server_name, dateの昇順、dateはdatetime.date）の集計結果
+        """
+
+        servers, since, until = _normalize_range(servers, since, until)
+        columns = None if columns is None else tuple(col for col in columns if col not in KEY_COLUMNS)
+
+        def run(conn: sqlite3.Connection) -> pd.DataFrame:
+            kinds = _stored_kinds(conn)
+            selected = list(kinds) if columns is None else [col for col in columns if col in kinds]
+            where, params = _range_conditions(servers, since, until)
+            names = ', '.join(_quote(col) for col in KEY_COLUMNS + selected)
+            rows = conn.execute(f'SELECT {names} FROM results{where} ORDER BY server_name, date', params).fetchall()
+            return _to_frame(rows, KEY_COLUMNS + selected, kinds)
+
+        return self._cached(('query', servers, since, until, columns), run, lambda: _to_frame([], KEY_COLUMNS, {}))
+
+    def fleet(self, servers: Union[Iterable[str], None] = None, since: Union[str, datetime.date, None] = None,
+              until: Union[str, datetime.date, None] = None) -> pd.DataFrame:
+        """
+        日別の全サーバー（serversを指定した場合はそのサーバー）の集計結果を返す
+
+        件数の列（レベル別件数）はサーバーの合計、*_avgの列はサーバー間の平均、*_maxの列はサーバー間の最大値、
+        anomaly列がある場合は異常と判定されたサーバー数（anomalies）とする。
+
+        :param servers: 対象サーバー名、指定しない場合は全サーバー
+        :param since: 対象期間の開始日（この日を含む）、指定しない場合は制限なし
+        :param until: 対象期間の終了日（この日を含む）、指定しない場合は制限なし
+        :return: date, servers（サーバー数）と上記の列を持ち、dateの昇順に並んだデータ
+        """
+
+        servers, since, until = _normalize_range(servers, since, until)
+
+        def run(conn: sqlite3.Connection) -> pd.DataFrame:
+            expressions, kinds = _summary_expressions(_stored_kinds(conn))
+            where, params = _range_conditions(servers, since, until)
+            rows = conn.execute(
+                f'SELECT date, COUNT(*) AS servers{expressions} FROM results{where} GROUP BY date ORDER BY date',
+                params
+            ).fetchall()
+            return _to_frame(rows, ['date', 'servers'] + list(kinds), kinds)
+
+        return self._cached(('fleet', servers, since, until), run, lambda: _to_frame([], ['date', 'servers'], {}))
+
+    def summary(self, servers: Union[Iterable[str], None] = None, since: Union[str, datetime.date, None] = None,
+                until: Union[str, datetime.date, None] = None) -> pd.DataFrame:
+        """
+        サーバー別の期間全体の集計結果を返す
+
+        件数の列は期間の合計、*_avgの列は日別の値の平均、*_maxの列は期間の最大値、
+        anomaly列がある場合は異常と判定された日数（anomalies）とする。
+
+        :param servers: 対象サーバー名、指定しない場合は全サーバー
+        :param since: 対象期間の開始日（この日を含む）、指定しない場合は制限なし
+        :param until: 対象期間の終了日（この日を含む）、指定しない場合は制限なし
+        :return: server_name, days, first_date, last_dateと上記の列を持ち、server_nameの昇順に並んだデータ
+        """
+
+        servers, since, until = _normalize_range(servers, since, until)
+        head = ['server_name', 'days', 'first_date', 'last_date']
+
+        def run(conn: sqlite3.Connection) -> pd.DataFrame:
+            expressions, kinds = _summary_expressions(_stored_kinds(conn))
+            where, params = _range_conditions(servers, since, until)
+            # 単項の+でserver_nameの索引を使わせず、期間の範囲を主キーで読んでから並べ替える
+            # （索引の順に全行を読み、行ごとに主キーを引くよりも速い）
+            rows = conn.execute(
+                f'SELECT server_name, COUNT(*) AS days, MIN(date), MAX(date){expressions} FROM results{where} '
+                f'GROUP BY +server_name ORDER BY +server_name',
+                params
+            ).fetchall()
+            return _to_frame(rows, head + list(kinds), kinds)
+
+        return self._cached(('summary', servers, since, until), run, lambda: _to_frame([], head, {}))
+
+    def cache_info(self) -> dict:
+        """
+        :return: キャッシュのヒット数・ミス数・保持件数・上限と、キャッシュした時点の版数
+        """
+
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'size': len(self._cache),
+                    'max_size': self.cache_size, 'version': self._cache_version}
+
+    def clear_cache(self):
+        """
+        問い合わせ結果のキャッシュを破棄する
+
+        :return: なし
+        """
+
+        with self._lock:
+            self._cache.clear()
+            self._cache_version = None
+
+    def close(self):
+        """
+        接続を閉じる（以降の問い合わせでは開き直す）
+
+        :return: なし
+        """
+
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self.clear_cache()
+
+    def _cached(self, key: tuple, run, empty):
+        """
+        問い合わせ結果をキャッシュから返す（無い場合は問い合わせてキャッシュする）
+
+        :param key: 問い合わせの種類と条件
+        :param run: 接続を受け取って問い合わせ結果を返す関数
+        :param empty: 保存された集計結果が無い場合の結果を返す関数
+        :return: 問い合わせ結果（DataFrameの場合は呼び出し元で変更してもよい複製）
+        """
+
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return empty()
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            version = 0 if row is None else row[0]
+            if version != self._cache_version:
+                self._cache.clear()
+                self._cache_version = version
+            if key in self._cache:
+                self._hits += 1
+                self._cache.move_to_end(key)
+                result = self._cache[key]
+            else:
+                self._misses += 1
+                result = run(conn)
+                if self.cache_size > 0:
+                    self._cache[key] = result
+                    if len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        return result.copy()
+
+    def _connect(self, create: bool = False) -> Union[sqlite3.Connection, None]:
+        """
+        :param create: Trueの場合、ファイルが無ければ作成する
+        :return: スキーマを作成済みの接続、ファイルが無くcreate=Falseの場合はNone
+        """
+
+        if self._conn is None:
+            if not create and not self.path.exists():
+                return None
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            # 更新中も他のプロセスが問い合わせできるようにする
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+
+def _column_kind(col: str, series: pd.Series) -> str:
+    """
+    レベル別件数の列は、最初に保存した集計結果の型（欠損値を含む場合は小数）によらず'int'とする
+
+    :param col: 列名
+    :param series: 列の値
+    :return: 列の型の種類（'int', 'float', 'bool', 'text'）
+    """
+
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return 'bool'
+    if _is_level_column(col) and pd.api.types.is_numeric_dtype(series.dtype):
+        return 'int'
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return 'int'
+    if pd.api.types.is_float_dtype(series.dtype):
+        return 'float'
+    return 'text'
+
+
+def _is_level_column(col: str) -> bool:
+    """
+    :param col: 列名
+    :return: レベル別件数の列（キー・使用率の列・異常判定の列以外）の場合はTrue
+    """
+
+    return col not in KEY_COLUMNS and col not in METRIC_COLUMNS and col not in ANOMALY_COLUMNS
+
+
+def _quote(name: str) -> str:
+    """
+    :return: SQLの識別子として引用符で囲んだ列名
+    """
+
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _stored_kinds(conn: sqlite3.Connection) -> dict[str, str]:
+    """
+    :return: 保存済みの列名と型の種類（保存した順）
+    """
+
+    return dict(conn.execute('SELECT name, kind FROM result_columns ORDER BY position').fetchall())
+
+
+def _normalize_range(servers: Union[Iterable[str], None], since: Union[str, datetime.date, None],
+                     until: Union[str, datetime.date, None]) -> (Union[tuple, None], Union[str, None], Union[str, None]):
+    """
+    問い合わせの条件をキャッシュのキーに使える形にする
+
+    :return: 重複を除いて並べたサーバー名のタプル、'YYYY-MM-DD'形式の開始日・終了日
+    :raises ValueError: 日付の形式が不正な場合
+    """
+
+    servers = None if servers is None else tuple(sorted(set(servers)))
+    since = None if since is None else str(pd.Timestamp(since).date())
+    until = None if until is None else str(pd.Timestamp(until).date())
+    return servers, since, until
+
+
+def _range_conditions(servers: Union[tuple, None], since: Union[str, None],
+                      until: Union[str, None]) -> (str, list):
+    """
+    サーバー・期間の条件（日付は'YYYY-MM-DD'の文字列として比較する）
+
+    :return: WHERE句（条件が無い場合は空文字）とパラメーター
+    """
+
+    conditions, params = [], []
+    if servers is not None:
+        conditions.append(f'server_name IN ({", ".join("?" * len(servers))})')
+        params.extend(servers)
+    if since is not None:
+        conditions.append('date >= ?')
+        params.append(since)
+    if until is not None:
+        conditions.append('date <= ?')
+        params.append(until)
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+
+def _summary_expressions(kinds: dict[str, str]) -> (str, dict[str, str]):
+    """
+    サーバー間・期間全体の集計式（件数は合計、*_avgは平均、*_maxは最大値、anomalyは異常と判定された件数）
+
+    :param kinds: 保存済みの列名と型の種類
+    :return: SELECT句に追加する集計式と、集計結果の列名と型の種類
+    """
+
+    expressions, result_kinds = [], {}
+    for col, kind in kinds.items():
+        # 型の種類を列名で判定する前に保存した（レベル別件数が'float'の）ファイルも件数として集計する
+        if kind == 'int' or (kind == 'float' and _is_level_column(col)):
+            expressions.append(f'TOTAL({_quote(col)})')
+            result_kinds[col] = 'int'
+        elif kind == 'float' and col.endswith('_avg'):
+            expressions.append(f'AVG({_quote(col)})')
+            result_kinds[col] = 'float'
+        elif kind == 'float' and col.endswith('_max'):
+            expressions.append(f'MAX({_quote(col)})')
+            result_kinds[col] = 'float'
+        elif kind == 'bool' and col == 'anomaly':
+            expressions.append(f'TOTAL({_quote(col)})')
+            result_kinds['anomalies'] = 'int'
+    return ''.join(', ' + expression for expression in expressions), result_kinds
+
+
+def _to_frame(rows: list[tuple], columns: list[str], kinds: dict[str, str]) -> pd.DataFrame:
+    """
+    問い合わせ結果をDataFrameにし、列の型を保存時の型に戻す
+
+    日付の列（date, first_date, last_date）はdatetime.date、整数・真偽値の列は欠損値（後から追加された列）を0 / Falseとする。
+
+    :param rows: 問い合わせ結果の行
+    :param columns: 列名
+    :param kinds: 列名と型の種類
+    :return: 問い合わせ結果
+    """
+
+    data = {}
+    for col, values in zip(columns, zip(*rows) if rows else [()] * len(columns)):
+        if col in ('date', 'first_date', 'last_date'):
+            data[col] = pd.Series([datetime.date.fromisoformat(value) for value in values], dtype=object)
+        elif col == 'server_name':
+            data[col] = pd.Series(values, dtype='str')
+        elif col in ('servers', 'days'):
+            data[col] = np.array(values, dtype='int64')
+        elif kinds[col] in ('int', 'bool'):
+            data[col] = np.array([0 if value is None else value for value in values], dtype=_COLUMN_KINDS[kinds[col]][1])
+        elif kinds[col] == 'float':
+            # Noneは欠損値（NaN）になる
+            data[col] = np.array(values, dtype='float64')
+        else:
+            data[col] = pd.Series(values, dtype='str')
+    return pd.DataFrame(data, columns=columns)
+
+
+class _ResultRequestHandler(BaseHTTPRequestHandler):
+    """
+    集計結果の問い合わせのHTTPリクエストを処理する
+
+    GET /servers, /query, /fleet, /summary（servers=カンマ区切り、since、until、queryのみcolumns=カンマ区切り）と、
+    GET /stats（キャッシュのヒット数・版数）にJSONで答える。
+    """
+
+    server: 'ThreadingHTTPServer'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        store: ResultStore = self.server.store
+        servers = params['servers'].split(',') if params.get('servers') else None
+        try:
+            if url.path == '/servers':
+                self._respond(200, json.dumps(store.servers()))
+            elif url.path == '/stats':
+                self._respond(200, json.dumps(store.cache_info()))
+            elif url.path in ('/query', '/fleet', '/summary'):
+                since, until = params.get('since'), params.get('until')
+                if url.path == '/query':
+                    columns = params['columns'].split(',') if params.get('columns') else None
+                    result = store.query(servers, since, until, columns=columns)
+                elif url.path == '/fleet':
+                    result = store.fleet(servers, since, until)
+                else:
+                    result = store.summary(servers, since, until)
+                for col in ('date', 'first_date', 'last_date'):
+                    if col in result.columns:
+                        result[col] = result[col].astype(str)
+                self._respond(200, result.to_json(orient='records', force_ascii=False))
+            else:
+                self._respond(404, json.dumps({'error': f'not found: {url.path}'}))
+        except ValueError as e:
+            self._respond(400, json.dumps({'error': str(e)}))
+
+    def _respond(self, status: int, body: str):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args):
+        logger.debug(f'{self.address_string()} {format % args}')
+
+
+def make_result_server(store: ResultStore, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """
+    集計結果の問い合わせに答えるHTTPサーバーを作成する関数（serve_foreverで待ち受けを開始する）
+
+    :param store: 集計結果の保存先
+    :param host: 待ち受けるアドレス
+    :param port: 待ち受けるポート番号、0の場合は空いているポートを使用する（server_addressで確認できる）
+    :return: HTTPサーバー
+    """
+
+    server = ThreadingHTTPServer((host, port), _ResultRequestHandler)
+    server.daemon_threads = True
+    server.store = store
+    return server
+
+
+def serve_results(path: Path, host: str = '127.0.0.1', port: int = 8081):
+    """
+    集計結果の問い合わせに答えるHTTPサーバーを起動し、Ctrl+Cで終了するまで待ち受ける関数
+
+    :param path: 集計結果の保存先のファイルパス
+    :param host: 待ち受けるアドレス
+    :param port: 待ち受けるポート番号
+    :return: なし
+    """
+
+    store = ResultStore(path)
+    with make_result_server(store, host, port) as server:
+        logger.info(f'Serving results from {Path(path).resolve()} on http://{host}:{server.server_address[1]}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info('Result server interrupted')
+    store.close()
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    import tempfile
+    from loganalyzer.analyzer import analyze_df
+    from loganalyzer.anomaly import detect_anomalies
+    from loganalyzer.loader import load_logs_from_dir
+    from loganalyzer.parser import parse_all
+
+    setup_logging(level=logging.DEBUG)
+    analyzed = detect_anomalies(analyze_df(parse_all(*load_logs_from_dir(
+        Path(__file__).parent.parent / 'data' / 'sample_logs'))))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = ResultStore(Path(tmp_dir) / 'results.sqlite')
+        results.rebuild(analyzed)
+        print(results.query().equals(analyzed))
+        print(results.query(servers=['srv1'], since='2026-02-03', until='2026-02-05', columns=['ERROR', 'cpu_avg']))
+        print(results.fleet(since='2026-02-01', until='2026-02-07'))
+        print(results.summary())
+        results.fleet(since='2026-02-01', until='2026-02-07')
+        print(results.cache_info())
+        results.close()
@@ -0,0 +1,653 @@
+"""
+サーバー別の時間階層集計（分・時・日・週のロールアップ）。分単位の集計値のみを生データから作成し、
+時・日・週の集計値は1つ下の階層から作成する。各階層を保存し、任意の粒度の集計値を生データを読まずに返す。
+"""
+import datetime
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Union
+import numpy as np
+import pandas as pd
+from loganalyzer import sketch
+from loganalyzer.analyzer import encode_column
+from loganalyzer.filters import LogFilter
+from loganalyzer.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# 集計値の形式を変更した場合は値を上げ、古い保存内容を破棄する
+ROLLUP_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+# 階層名と1バケットの分数
+TIERS = {'minute': 1, 'hour': 60, 'day': 1440, 'week': 10080}
+# 各階層の作成元の階層
+SOURCE_TIERS = {'hour': 'minute', 'day': 'hour', 'week': 'day'}
+# 週の始まりを月曜日に合わせるずらし幅（1970-01-01は木曜日）
+_WEEK_OFFSET = 3 * 1440
+METRICS = ['cpu', 'memory']
+KEY_COLUMNS = ['server_name', 'bucket']
+SKETCH_KEY_COLUMNS = ['server_name', 'bucket', 'metric', 'key']
+# レベル別件数以外の合算用列（件数・合計値は合計、最小値・最大値はそれぞれ最小・最大で合算する）
+STAT_COLUMNS = ['level_count'] + [f'{metric}_{stat}' for metric in METRICS for stat in ('sum', 'count', 'min', 'max')]
+QUANTILES = (0.5, 0.95, 0.99)
+# 階層名以外の粒度の指定（'15min'、'6h'、'2d'など）
+_GRANULARITY_PATTERN = re.compile(r'^(\d+)(min|h|d)$')
+_UNIT_MINUTES = {'min': 1, 'h': 60, 'd': 1440}
+NAT_MINUTE = np.datetime64('NaT', 'm').view('int64')
+
+def bucket_start(minutes: np.ndarray, size: int) -> np.ndarray:
+    """
+    1970-01-01からの分数を、それを含むバケットの開始（分数）に切り捨てる関数
+
+    週（10080分）のバケットは月曜日0時から始まる。
+
+    :param minutes: 1970-01-01からの分数
+    :param size: 1バケットの分数
+    :return: バケットの開始の分数
+    """
+
+    offset = _WEEK_OFFSET if size % TIERS['week'] == 0 else 0
+    return (minutes + offset) // size * size - offset
+
+
+def build_minute_rollup(df: pd.DataFrame) -> (pd.DataFrame, pd.DataFrame):
+    """
+    パース済みのログデータからサーバー別・分別の集計値とスケッチを作成する関数
+
+    (サーバーコード, 分) を1つのグループ番号にまとめ、件数・合計値はnumpy.bincount、
+    最小値・最大値はグループ順に並べ替えた上でnumpy.fmin / fmax.reduceatで1回の走査で集計する。
+    入力のDataFrameは変更しない。
+
+    :param df: パース済みのログデータ（全体またはその一部）
+    :return: 集計値（server_name, bucket, レベル別件数, STAT_COLUMNS）と
+        スケッチ（server_name, bucket, metric, key, count）
+    """
+
+    server_codes, server_names = _sorted_codes(*encode_column(df['server_name']))
+    level_codes, level_names = encode_column(df['level'])
+    timestamp = df['timestamp']
+    if getattr(timestamp.dt, 'tz', None) is not None:
+        timestamp = timestamp.dt.tz_localize(None)
+    minutes = timestamp.to_numpy().astype('datetime64[m]').view('int64')
+    values = {metric: df[f'{metric}_usage'].to_numpy(dtype='float64', na_value=np.nan) for metric in METRICS}
+
+    valid = (server_codes >= 0) & (minutes != NAT_MINUTE)
+    if not valid.all():
+        server_codes, minutes, level_codes = server_codes[valid], minutes[valid], level_codes[valid]
+        values = {metric: array[valid] for metric, array in values.items()}
+    if len(minutes) == 0:
+        return _empty_rollup(), _empty_sketch()
+
+    minute_min = minutes.min()
+    span = int(minutes.max() - minute_min) + 1
+    group_ids, group_keys = pd.factorize(server_codes * span + (minutes - minute_min), sort=True)
+    n_groups = len(group_keys)
+    group_servers = group_keys // span
+    group_minutes = group_keys % span + minute_min
+
+    rollup = pd.DataFrame({
+        'server_name': pd.Categorical.from_codes(group_servers, categories=server_names),
+        'bucket': group_minutes,
+    })
+    n_levels = len(level_names)
+    level_present = level_codes >= 0
+    level_counts = np.bincount(
+        group_ids[level_present] * n_levels + level_codes[level_present], minlength=n_groups * n_levels
+    ).reshape(n_groups, n_levels)
+    for index in sorted(np.flatnonzero(level_counts.sum(axis=0)), key=lambda i: level_names[i]):
+        rollup[level_names[index]] = level_counts[:, index]
+    rollup['level_count'] = level_counts.sum(axis=1)
+
+    order = np.argsort(group_ids, kind='stable')
+    starts = np.searchsorted(group_ids[order], np.arange(n_groups))
+    sketch_groups = []
+    sketch_keys = []
+    for metric_code, metric in enumerate(METRICS):
+        array = values[metric]
+        present = ~np.isnan(array)
+        rollup[f'{metric}_sum'] = np.bincount(group_ids[present], weights=array[present], minlength=n_groups)
+        rollup[f'{metric}_count'] = np.bincount(group_ids[present], minlength=n_groups)
+        # fmin / fmaxは欠損値を無視する（全て欠損のグループはNaN）
+        rollup[f'{metric}_min'] = np.fmin.reduceat(array[order], starts)
+        rollup[f'{metric}_max'] = np.fmax.reduceat(array[order], starts)
+        sketch_groups.append(group_ids[present] * len(METRICS) + metric_code)
+        sketch_keys.append(sketch.encode_keys(array[present]))
+
+    groups, keys, counts = sketch.count_keys(np.concatenate(sketch_groups), np.concatenate(sketch_keys))
+    sketch_df = pd.DataFrame({
+        'server_name': pd.Categorical.from_codes(group_servers[groups // len(METRICS)], categories=server_names),
+        'bucket': group_minutes[groups // len(METRICS)],
+        'metric': pd.Categorical.from_codes(groups % len(METRICS), categories=METRICS),
+        'key': keys,
+        'count': counts,
+    })
+    return rollup, sketch_df
+
+
+def merge_rollups(rollups: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    同じ粒度の集計値を結合し、同じサーバー・バケットの値を合算する関数
+
+    :param rollups: 集計値のリスト
+    :return: サーバー名・バケットの昇順に並んだ集計値
+    """
+
+    rollups = [rollup for rollup in rollups if not rollup.empty]
+    if not rollups:
+        return _empty_rollup()
+    combined = pd.concat(rollups, ignore_index=True)
+    combined['server_name'] = _sorted_category(combined['server_name'])
+    level_columns = sorted(col for col in combined.columns if col not in KEY_COLUMNS and col not in STAT_COLUMNS)
+    aggregations = {col: 'sum' for col in level_columns}
+    aggregations.update({col: col.rsplit('_', 1)[1] if col.endswith(('_min', '_max')) else 'sum'
+                         for col in STAT_COLUMNS})
+    merged = combined.groupby(KEY_COLUMNS, observed=True, sort=True).agg(aggregations).reset_index()
+    count_columns = level_columns + [col for col in STAT_COLUMNS if col.endswith('_count')]
+    merged[count_columns] = merged[count_columns].astype('int64')
+    return merged[KEY_COLUMNS + level_columns + STAT_COLUMNS]
+
+
+def merge_sketches(sketches: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    同じ粒度のスケッチを結合し、同じサーバー・バケット・項目・バケット番号の件数を合算する関数
+
+    :param sketches: スケッチのリスト
+    :return: サーバー名・バケット・項目・バケット番号の昇順に並んだスケッチ
+    """
+
+    sketches = [sketch_df for sketch_df in sketches if not sketch_df.empty]
+    if not sketches:
+        return _empty_sketch()
+    combined = pd.concat(sketches, ignore_index=True)
+    combined['server_name'] = _sorted_category(combined['server_name'])
+    combined['metric'] = combined['metric'].astype(pd.CategoricalDtype(METRICS))
+    return combined.groupby(SKETCH_KEY_COLUMNS, observed=True, sort=True)['count'].sum().reset_index()
+
+
+def coarsen(rollup: pd.DataFrame, sketch_df: pd.DataFrame, size: int) -> (pd.DataFrame, pd.DataFrame):
+    """
+    集計値とスケッチを粗い粒度にまとめ直す関数（生データは使用しない）
+
+    :param rollup: 細かい粒度の集計値
+    :param sketch_df: 細かい粒度のスケッチ
+    :param size: まとめ直した後の1バケットの分数（元の粒度の倍数であること）
+    :return: まとめ直した集計値とスケッチ
+    """
+
+    rollup = rollup.assign(bucket=bucket_start(rollup['bucket'].to_numpy(), size))
+    sketch_df = sketch_df.assign(bucket=bucket_start(sketch_df['bucket'].to_numpy(), size))
+    return merge_rollups([rollup]), merge_sketches([sketch_df])
+
+
+class _LoadedTier:
+    """
+    読み込んだ1つの粒度の集計値・スケッチと、検索用の配列
+    """
+
+    __slots__ = ('rollup', 'sketch', 'servers', 'level_columns', 'columns', 'rollup_codes', 'rollup_buckets',
+                 'sketch_codes', 'sketch_buckets', 'sketch_metrics', 'sketch_keys', 'sketch_counts')
+
+    def __init__(self, rollup: pd.DataFrame, sketch_df: pd.DataFrame):
+        # サーバー名のカテゴリを集計値・スケッチで揃え、コードで二分探索できるようにする
+        self.servers = rollup['server_name'].cat.categories.union(sketch_df['server_name'].cat.categories)
+        rollup = rollup.assign(server_name=rollup['server_name'].cat.set_categories(self.servers))
+        sketch_df = sketch_df.assign(server_name=sketch_df['server_name'].cat.set_categories(self.servers))
+        self.rollup = rollup
+        self.sketch = sketch_df
+        self.rollup_codes = rollup['server_name'].cat.codes.to_numpy(dtype='int64')
+        self.rollup_buckets = rollup['bucket'].to_numpy(dtype='int64')
+        self.sketch_codes = sketch_df['server_name'].cat.codes.to_numpy(dtype='int64')
+        self.sketch_buckets = sketch_df['bucket'].to_numpy(dtype='int64')
+        self.sketch_metrics = sketch_df['metric'].cat.codes.to_numpy()
+        self.sketch_keys = sketch_df['key'].to_numpy()
+        self.sketch_counts = sketch_df['count'].to_numpy()
+        self.level_columns = [col for col in rollup.columns if col not in KEY_COLUMNS and col not in STAT_COLUMNS]
+        self.columns = {col: rollup[col].to_numpy() for col in self.level_columns + STAT_COLUMNS}
+
+
+class RollupStore:
+    """
+    分・時・日・週の集計値を保存し、任意の粒度・期間・サーバーの集計値を返す
+
+    各階層は集計値（レベル別件数、CPU / メモリ使用率の合計・件数・最小値・最大値）と
+    分位点スケッチ（sketchモジュール）を持ち、いずれも合算可能なため、
+    updateで追加したログの集計値を既存の値に合算できる（同じ行を2回追加すると二重に数える）。
+    集計値・スケッチは階層ごとにpickle形式、管理情報はmanifest.jsonとして保存先ディレクトリに保存する。
+    読み込んだ階層はメモリに保持し、管理情報が更新された（別の処理がupdateした）場合に読み直す。
+    """
+
+    def __init__(self, store_dir: Path):
+        """
+        :param store_dir: 集計値の保存先ディレクトリ
+        """
+
+        self.store_dir = Path(store_dir)
+        self._manifest: dict = {}
+        self._manifest_mtime_ns: Union[int, None] = None
+        self._loaded: dict[int, _LoadedTier] = {}
+        self._refresh()
+
+    def tiers(self) -> list[str]:
+        """
+        :return: 保存済みの階層名のリスト
+        """
+
+        self._refresh()
+        return [tier for tier in TIERS if tier in self._manifest.get('tiers', {})]
+
+    def update(self, df: pd.DataFrame) -> dict[str, int]:
+        """
+        ログデータの集計値を全階層に合算して保存する
+
+        分単位の集計値のみをログデータから作成し、時・日・週は1つ下の階層の差分から作成する。
+
+        :param df: パース済みのログデータ（保存済みの集計値に含まれていない行）
+        :return: 階層ごとの保存後の行数
+        """
+
+        deltas = {'minute': build_minute_rollup(df)}
+        for tier, source in SOURCE_TIERS.items():
+            deltas[tier] = coarsen(*deltas[source], TIERS[tier])
+
+        self._refresh()
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        stored_tiers = self._manifest.get('tiers', {})
+        tier_entries = {}
+        for tier, (rollup, sketch_df) in deltas.items():
+            if tier in stored_tiers:
+                loaded = self._read_tier(tier)
+                rollup = merge_rollups([loaded.rollup, rollup])
+                sketch_df = merge_sketches([loaded.sketch, sketch_df])
+            _write_pickle(rollup, self.store_dir / f'{tier}.pkl')
+            _write_pickle(sketch_df, self.store_dir / f'{tier}_sketch.pkl')
+            tier_entries[tier] = {
+                'rows': len(rollup),
+                'sketch_rows': len(sketch_df),
+                'first_bucket': _format_bucket(rollup['bucket'].min()) if not rollup.empty else None,
+                'last_bucket': _format_bucket(rollup['bucket'].max()) if not rollup.empty else None,
+            }
+
+        self._manifest = {
+            'version': ROLLUP_VERSION,
+            'updated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'tiers': tier_entries,
+        }
+        manifest_path = self.store_dir / MANIFEST_NAME
+        tmp_path = manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+        self._manifest_mtime_ns = manifest_path.stat().st_mtime_ns
+        self._loaded.clear()
+
+        logger.info(f'Rollups updated with {len(df)} rows: '
+                    + ', '.join(f'{tier} {entry["rows"]}' for tier, entry in tier_entries.items()))
+        return {tier: entry['rows'] for tier, entry in tier_entries.items()}
+
+    def rebuild(self, df: pd.DataFrame) -> dict[str, int]:
+        """
+        保存済みの集計値を破棄し、ログデータから全階層を作成し直す
+
+        保存先のディレクトリは他のファイルと共用されることがあるため、このクラスが作成したファイル
+        （マニフェストと階層ごとの集計値・スケッチ）のみを削除する。
+
+        :param df: パース済みのログデータ
+        :return: 階層ごとの保存後の行数
+        """
+
+        # 読込側が削除途中の階層を参照しないよう、マニフェストを先に削除する
+        for name in [MANIFEST_NAME] + [f'{tier}{suffix}' for tier in TIERS for suffix in ('.pkl', '_sketch.pkl')]:
+            (self.store_dir / name).unlink(missing_ok=True)
+        self._manifest = {}
+        self._manifest_mtime_ns = None
+        self._loaded.clear()
+        return self.update(df)
+
+    def query(
+            self,
+            granularity: Union[str, int] = 'hour',
+            since: Union[str, datetime.date, None] = None,
+            until: Union[str, datetime.date, None] = None,
+            servers: Union[Iterable[str], None] = None,
+            quantiles: Iterable[float] = QUANTILES) -> pd.DataFrame:
+        """
+        保存済みの集計値から、指定した粒度のサーバー別・バケット別の集計結果を返す
+
+        粒度は階層名（'minute', 'hour', 'day', 'week'）、'15min'・'6h'・'2d'のような指定、または分数で指定する。
+        階層名以外の粒度は、その粒度を割り切れる最も粗い階層をまとめ直して作成する（作成結果はメモリに保持する）。
+        期間はsince・untilと重なるバケットを返す（バケットの一部のみが期間に含まれる場合もバケット全体の値を返す）。
+
+        :param granularity: 集計の粒度
+        :param since: 対象期間の開始（日付または日時）、指定しない場合は制限なし
+        :param until: 対象期間の終了（日付のみの場合はその日の終わりまで）、指定しない場合は制限なし
+        :param servers: 対象サーバー名、指定しない場合は全サーバー
+        :param quantiles: 求める分位点（0以上1以下）
+        :return: server_name, bucket（バケットの開始日時）, レベル別件数, level_count と、
+            CPU / メモリ使用率それぞれの avg, min, max, 分位点（cpu_p50など）を持つ集計結果
+        """
+
+        size = parse_granularity(granularity)
+        loaded = self._load_granularity(size)
+        since_ts, until_ts = LogFilter(since=since, until=until).time_bounds()
+        first = None if since_ts is None else int(bucket_start(_to_minute(since_ts), size))
+        last = None if until_ts is None else int(bucket_start(_to_minute(until_ts - pd.Timedelta(1, 'ns')), size))
+        codes = None if servers is None else loaded.servers.get_indexer(sorted(set(servers)))
+
+        rows = _select_rows(loaded.rollup_codes, loaded.rollup_buckets, codes, first, last)
+        sketch_rows = _select_rows(loaded.sketch_codes, loaded.sketch_buckets, codes, first, last)
+        percentiles = _sketch_quantiles(loaded, rows, sketch_rows, list(quantiles))
+
+        # 列ごとの代入はDataFrameの再構築が重いため、numpy配列の辞書から1回で作成する
+        columns = loaded.columns
+        output = {
+            'server_name': loaded.servers.take(loaded.rollup_codes[rows]),
+            'bucket': loaded.rollup_buckets[rows].astype('datetime64[m]').astype('datetime64[s]'),
+        }
+        for col in loaded.level_columns + ['level_count']:
+            output[col] = columns[col][rows]
+        for metric in METRICS:
+            counts = columns[f'{metric}_count'][rows]
+            minimum = columns[f'{metric}_min'][rows]
+            maximum = columns[f'{metric}_max'][rows]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                output[f'{metric}_avg'] = np.where(counts > 0, columns[f'{metric}_sum'][rows] / counts, np.nan)
+            output[f'{metric}_min'] = minimum
+            output[f'{metric}_max'] = maximum
+            for q in quantiles:
+                # スケッチの代表値は相対誤差を含むため、実際の最小値・最大値の範囲に収める
+                output[f'{metric}_{quantile_name(q)}'] = np.clip(percentiles[metric][q], minimum, maximum)
+        return pd.DataFrame(output)
+
+    def _refresh(self):
+        """
+        管理情報が更新されている場合は読み直し、メモリに保持した階層を破棄する
+
+        :return: なし
+        """
+
+        manifest_path = self.store_dir / MANIFEST_NAME
+        try:
+            mtime_ns = manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if mtime_ns == self._manifest_mtime_ns:
+            return
+        self._manifest_mtime_ns = mtime_ns
+        self._loaded.clear()
+        self._manifest = {}
+        if mtime_ns is None:
+            return
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Rollup manifest is broken, ignoring rollups: {e}')
+            return
+        if manifest.get('version') != ROLLUP_VERSION:
+            logger.info(f'Rollup version changed, ignoring rollups: {self.store_dir.resolve()}')
+            return
+        self._manifest = manifest
+
+    def _read_tier(self, tier: str) -> _LoadedTier:
+        """
+        保存済みの階層を読み込む（メモリに保持済みの場合はそれを返す）
+
+        :param tier: 階層名
+        :return: 読み込んだ階層
+        """
+
+        size = TIERS[tier]
+        if size not in self._loaded:
+            self._loaded[size] = _LoadedTier(
+                pd.read_pickle(self.store_dir / f'{tier}.pkl'), pd.read_pickle(self.store_dir / f'{tier}_sketch.pkl')
+            )
+        return self._loaded[size]
+
+    def _load_granularity(self, size: int) -> _LoadedTier:
+        """
+        指定した粒度の集計値を返す。保存済みの階層に無い粒度は割り切れる最も粗い階層から作成する。
+
+        :param size: 1バケットの分数
+        :return: 指定した粒度の集計値
+        """
+
+        self._refresh()
+        available = self._manifest.get('tiers', {})
+        if not available:
+            raise FileNotFoundError(f'No rollups in {self.store_dir.resolve()}, run update or rebuild first')
+        if size in self._loaded:
+            return self._loaded[size]
+
+        sources = [tier for tier in TIERS if tier in available and size % TIERS[tier] == 0
+                   and (TIERS[tier] < TIERS['week'] or size % TIERS['week'] == 0)]
+        if not sources:
+            raise ValueError(f'Granularity of {size} minutes cannot be derived from stored tiers: {list(available)}')
+        source = sources[-1]
+        loaded = self._read_tier(source)
+        if TIERS[source] != size:
+            logger.debug(f'Deriving {size}-minute rollups from {source} tier')
+            loaded = _LoadedTier(*coarsen(loaded.rollup, loaded.sketch, size))
+            self._loaded[size] = loaded
+        return loaded
+
+
+def parse_granularity(granularity: Union[str, int]) -> int:
+    """
+    粒度の指定を1バケットの分数に変換する関数
+
+    :param granularity: 階層名（'minute', 'hour', 'day', 'week'）、'15min'・'6h'・'2d'のような指定、または分数
+    :return: 1バケットの分数
+    """
+
+    if isinstance(granularity, (int, np.integer)):
+        size = int(granularity)
+    elif granularity in TIERS:
+        size = TIERS[granularity]
+    else:
+        match = _GRANULARITY_PATTERN.match(str(granularity).strip().lower())
+        if match is None:
+            raise ValueError(f'Unsupported granularity: {granularity} (expected one of {list(TIERS)} or e.g. "15min", "6h", "2d")')
+        size = int(match.group(1)) * _UNIT_MINUTES[match.group(2)]
+    if size <= 0:
+        raise ValueError(f'Granularity must be positive: {granularity}')
+    return size
+
+
+def quantile_name(q: float) -> str:
+    """
+    :param q: 分位（0以上1以下）
+    :return: 列名用の分位点の名前（0.5 → 'p50'、0.999 → 'p99_9'）
+    """
+
+    return 'p' + f'{q * 100:g}'.replace('.', '_')
+
+
+def build_rollups(data_dir: Path, store_dir: Path, workers: Union[int, None] = None,
+                  log_filter: Union[LogFilter, None] = None) -> RollupStore:
+    """
+    ログディレクトリの全ファイルを読み込み、集計値を作成し直して保存する関数
+
+    :param data_dir: ログデータが格納されているディレクトリのパス
+    :param store_dir: 集計値の保存先ディレクトリのパス
+    :param workers: ログファイル並列読込のワーカー数、指定しない場合は逐次読込
+    :param log_filter: 絞り込み条件、指定しない場合は全行を対象とする
+    :return: 集計値を保存したRollupStore
+    """
+
+    from loganalyzer.loader import load_logs_from_dir
+    from loganalyzer.parser import parse_all
+
+    df_list, file_list = load_logs_from_dir(Path(data_dir), workers=workers, log_filter=log_filter)
+    store = RollupStore(store_dir)
+    store.rebuild(parse_all(df_list, file_list, log_filter=log_filter))
+    return store
+
+
+def _sorted_codes(codes: np.ndarray, names: pd.Index) -> (np.ndarray, pd.Index):
+    """
+    コードを名前の昇順に振り直す（カテゴリ型のカテゴリが名前順でない場合）
+
+    :param codes: コード配列（欠損は-1）
+    :param names: コードに対応する値
+    :return: 振り直したコード配列と、昇順の値
+    """
+
+    if names.is_monotonic_increasing:
+        return codes, names
+    order = names.argsort()
+    ranks = np.empty(len(order), dtype='int64')
+    ranks[order] = np.arange(len(order))
+    return np.where(codes >= 0, ranks[np.maximum(codes, 0)], -1), names[order]
+
+
+def _sorted_category(series: pd.Series) -> pd.Series:
+    """
+    :param series: server_name列
+    :return: カテゴリが名前の昇順に並んだカテゴリ型の列（groupbyの結果が名前順になる）
+    """
+
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.astype('category')
+    categories = series.cat.categories
+    if categories.is_monotonic_increasing:
+        return series
+    return series.cat.reorder_categories(categories.sort_values())
+
+
+def _select_rows(codes: np.ndarray, buckets: np.ndarray, server_codes: Union[np.ndarray, None],
+                 first: Union[int, None], last: Union[int, None]) -> np.ndarray:
+    """
+    サーバーコード・バケットの昇順に並んだ行から、対象サーバー・期間の行番号を二分探索で求める
+
+    :param codes: 行ごとのサーバーコード
+    :param buckets: 行ごとのバケット
+    :param server_codes: 対象サーバーのコード（-1は存在しないサーバー）、Noneの場合は全サーバー
+    :param first: 対象とする最初のバケット、Noneの場合は制限なし
+    :param last: 対象とする最後のバケット、Noneの場合は制限なし
+    :return: 行番号
+    """
+
+    if server_codes is None:
+        if first is None and last is None:
+            return np.arange(len(codes))
+        server_codes = np.unique(codes)
+    server_codes = server_codes[server_codes >= 0]
+    starts = np.searchsorted(codes, server_codes, side='left')
+    ends = np.searchsorted(codes, server_codes, side='right')
+    pieces = []
+    for start, end in zip(starts, ends):
+        server_buckets = buckets[start:end]
+        lower = start + (np.searchsorted(server_buckets, first, side='left') if first is not None else 0)
+        upper = start + (np.searchsorted(server_buckets, last, side='right') if last is not None else end - start)
+        pieces.append(np.arange(lower, upper))
+    return np.concatenate(pieces) if pieces else np.empty(0, dtype='int64')
+
+
+def _sketch_quantiles(loaded: _LoadedTier, rows: np.ndarray, sketch_rows: np.ndarray,
+                      qs: list[float]) -> dict[str, dict[float, np.ndarray]]:
+    """
+    選択した行（サーバー・バケット）ごとの分位点をスケッチから求める
+
+    :param loaded: 対象の粒度の集計値
+    :param rows: 選択した集計値の行番号
+    :param sketch_rows: 選択したスケッチの行番号（rowsと同じサーバー・期間で選択したもの）
+    :param qs: 求める分位
+    :return: 項目・分位ごとの、選択した行と同じ順の分位点（値が無い行はNaN）
+    """
+
+    result = {metric: {q: np.full(len(rows), np.nan) for q in qs} for metric in METRICS}
+    if len(sketch_rows) == 0 or not qs:
+        return result
+    codes = loaded.sketch_codes[sketch_rows]
+    buckets = loaded.sketch_buckets[sketch_rows]
+    metrics = loaded.sketch_metrics[sketch_rows]
+    changed = np.r_[True, (codes[1:] != codes[:-1]) | (buckets[1:] != buckets[:-1]) | (metrics[1:] != metrics[:-1])]
+    group_ids = np.cumsum(changed) - 1
+    _, values = sketch.quantiles(
+        group_ids, loaded.sketch_keys[sketch_rows], loaded.sketch_counts[sketch_rows], qs
+    )
+
+    # スケッチのグループ（サーバー・バケット・項目）を集計値の行に対応付ける
+    firsts = np.flatnonzero(changed)
+    row_codes = loaded.rollup_codes[rows]
+    row_buckets = loaded.rollup_buckets[rows]
+    base = min(row_buckets.min(initial=0), buckets.min())
+    scale = max(row_buckets.max(initial=0), buckets.max()) - base + 1
+    positions = np.searchsorted(row_codes * scale + (row_buckets - base),
+                                codes[firsts] * scale + (buckets[firsts] - base))
+    for metric_code, metric in enumerate(METRICS):
+        target = metrics[firsts] == metric_code
+        for q in qs:
+            result[metric][q][positions[target]] = values[q][target]
+    return result
+
+
+def _to_minute(timestamp: pd.Timestamp) -> int:
+    """
+    :param timestamp: 日時（タイムゾーン付きの場合は現地時刻とする）
+    :return: 1970-01-01からの分数（切り捨て）
+    """
+
+    return int(np.datetime64(timestamp.tz_localize(None) if timestamp.tz is not None else timestamp, 'm')
+               .view('int64'))
+
+
+def _format_bucket(minute: int) -> str:
+    """
+    :param minute: 1970-01-01からの分数
+    :return: ISO形式の日時
+    """
+
+    return str(np.datetime64(int(minute), 'm'))
+
+
+def _write_pickle(df: pd.DataFrame, path: Path):
+    """
+    書き込み途中の破損を避けるため一時ファイルに保存してから置き換える
+
+    :param df: 保存するデータ
+    :param path: 保存先
+    :return: なし
+    """
+
+    tmp_path = path.with_suffix('.tmp')
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _empty_rollup() -> pd.DataFrame:
+    empty = pd.DataFrame({
+        'server_name': pd.Categorical([]),
+        'bucket': np.empty(0, dtype='int64'),
+    })
+    for col in STAT_COLUMNS:
+        empty[col] = np.empty(0, dtype='int64' if col.endswith('_count') else 'float64')
+    return empty
+
+
+def _empty_sketch() -> pd.DataFrame:
+    return pd.DataFrame({
+        'server_name': pd.Categorical([]),
+        'bucket': np.empty(0, dtype='int64'),
+        'metric': pd.Categorical([], categories=METRICS),
+        'key': np.empty(0, dtype='int16'),
+        'count': np.empty(0, dtype='int64'),
+    })
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    import tempfile
+    from loganalyzer.loader import load_logs_from_dir
+    from loganalyzer.parser import parse_all
+    setup_logging(level=logging.DEBUG)
+    sample_dir = Path(__file__).parent.parent / 'data' / 'sample_logs'
+    df_list, file_list = load_logs_from_dir(sample_dir)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = RollupStore(Path(tmp_dir))
+        print(store.rebuild(parse_all(df_list, file_list)))
+        print(store.query('day'))
+        print(store.query('6h', servers=['srv1'], since='2026-02-02', until='2026-02-02'))
@@ -0,0 +1,175 @@
+"""
+サーバー名のハッシュ値でシャードに分けた複数プロセスでの解析。ファイルの読込・クレンジングと、シャードごとの集計をプロセスプールで並列に行い、
+load_logs_from_dir → parse_all → analyze_df と同じ結果を返す。
+
+ワーカー間のデータの受け渡しは一時ディレクトリのファイルで行い、プロセス間でやり取りするのはファイルパスと部分集計（サーバー×日数の行）のみとする。
+"""
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Union
+import numpy as np
+import pandas as pd
+from loganalyzer.analyzer import aggregate_partial, encode_column, finalize_partial, merge_partials
+from loganalyzer.filters import LogFilter
+from loganalyzer.instrumentation import add_file
+from loganalyzer.loader import collect_log_files, read_log_file
+from loganalyzer.logging_config import setup_logging
+from loganalyzer.parser import ANALYSIS_COLUMNS, concat_logs, parse_one
+
+logger = logging.getLogger(__name__)
+
+def analyze_sharded(data_dir: Path, workers: Union[int, None] = None, log_filter: Union[LogFilter, None] = None,
+                    n_shards: Union[int, None] = None) -> pd.DataFrame:
+    """
+    ログディレクトリをサーバー単位のシャードに分けて並列に解析する関数
+
+    1. ファイルごとに、読込・クレンジング（parse_one）を行い、行をサーバー名のハッシュ値でシャードに振り分けて一時ファイルに書き出す
+    2. シャードごとに、一時ファイルをファイル順に結合して部分集計（aggregate_partial）を作成する
+    3. 部分集計を結合し（シャード間でサーバーが重複しないため、各サーバー・日付の集計値はシャード内で確定している）、
+       analyze_dfと同じ形式に確定する
+
+    同じサーバーの行はシャード内でも元のファイル順・行順のまま集計されるため、合計値の丸め誤差を含めて
+    analyze_df(parse_all(*load_logs_from_dir(data_dir)))と同じ結果になる（ワーカー数・シャード数によらない）。
+    読込・クレンジングに失敗したファイルは、load_logs_from_dir・parse_allと同様にログに記録してスキップする。
+
+    :param data_dir: ログデータが格納されているディレクトリのパス
+    :param workers: プロセス数、指定しない場合はCPU数
+    :param log_filter: 絞り込み条件、指定しない場合は全行を対象とする
+    :param n_shards: シャード数、指定しない場合はプロセス数
+    :return: 分析・集計後のデータ
+    """
+
+    data_dir = Path(data_dir)
+    workers = workers if workers is not None and workers > 0 else os.cpu_count() or 1
+    n_shards = n_shards if n_shards is not None and n_shards > 0 else workers
+    data_dir_resolved = data_dir.resolve()
+    target_files = collect_log_files(data_dir, log_filter)
+    logger.info(f'Sharded analysis of {len(target_files)} files with {workers} workers, {n_shards} shards')
+
+    with tempfile.TemporaryDirectory(prefix='loganalyzer-shards-') as tmp_dir, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        shard_root = Path(tmp_dir)
+        futures = [pool.submit(partition_file, file, index, shard_root, n_shards, log_filter)
+                   for index, file in enumerate(target_files)]
+        loaded = parsed = 0
+        for file, future in zip(target_files, futures):
+            result = future.result()
+            file_resolved = file.resolve()
+            if result['read_error'] is not None:
+                logger.error(f'Failed to read {file_resolved}: {result["read_error"]}')
+                add_file('load', file, error=result['read_error'])
+                continue
+            loaded += 1
+            add_file('load', file, rows_out=result['rows_in'])
+            if result['parse_error'] is not None:
+                logger.error(f'Failed to parse file: {file_resolved}: {result["parse_error"]}')
+                add_file('parse', file, rows_in=result['rows_in'], error=result['parse_error'])
+                continue
+            add_file('parse', file, rows_in=result['rows_in'], rows_out=result['rows_out'])
+            if result['rows_out'] == 0:
+                if log_filter is not None and log_filter.is_active():
+                    logger.info(f'No rows matched the filter: {file_resolved}')
+                else:
+                    logger.error(f'No data found from file after parsing: {file_resolved}')
+                continue
+            parsed += 1
+
+        if loaded == 0:
+            logger.error(f'No csv or json file in directory: {data_dir_resolved}')
+            raise FileNotFoundError(f'No csv or json file in directory: {data_dir_resolved}')
+        if parsed == 0:
+            logger.error(f'All files are empty or empty after parsing')
+            raise RuntimeError(f'All files are empty or empty after parsing')
+
+        shard_dirs = sorted(path for path in shard_root.iterdir() if path.is_dir())
+        partials = list(pool.map(aggregate_shard, shard_dirs))
+
+    logger.info(f'Merging {len(partials)} shard partials')
+    return finalize_partial(merge_partials(partials))
+
+
+def shard_numbers(server_names: pd.Index, n_shards: int) -> np.ndarray:
+    """
+    サーバー名ごとのシャード番号を求める関数
+
+    pandasのハッシュ関数（実行・プロセスによらず同じ値になる）の値をシャード数で割った余りとする。
+
+    :param server_names: サーバー名
+    :param n_shards: シャード数
+    :return: サーバー名と同じ順のシャード番号
+    """
+
+    hashes = pd.util.hash_array(np.asarray(server_names, dtype=object))
+    return (hashes % np.uint64(n_shards)).astype('int64')
+
+
+def partition_file(file: Path, index: int, shard_root: Path, n_shards: int,
+                   log_filter: Union[LogFilter, None] = None) -> dict:
+    """
+    1つのログファイルを読み込んでクレンジングし、行をシャードごとの一時ファイルに書き出す関数（プロセスプールから呼び出す）
+
+    シャードsの行は shard_root/{s:04d}/{index:06d}.pkl に書き出す（ファイル名の順がファイルの処理順になる）。
+    書き出すのは集計に必要な列（ANALYSIS_COLUMNS）のみとする。
+    失敗はワーカー側ではなく呼び出し側でログに記録するよう、例外ではなく結果として返す。
+
+    :param file: ログファイルのパス
+    :param index: ファイルの処理順
+    :param shard_root: 一時ファイルの保存先
+    :param n_shards: シャード数
+    :param log_filter: 絞り込み条件
+    :return: rows_in, rows_out（クレンジング後の行数）, read_error, parse_error（失敗時のメッセージ、成功時はNone）
+    """
+
+    result = {'rows_in': 0, 'rows_out': 0, 'read_error': None, 'parse_error': None}
+    try:
+        df = read_log_file(file)
+    except Exception as e:
+        result['read_error'] = str(e)
+        return result
+    result['rows_in'] = len(df)
+    try:
+        parsed_df = parse_one(df, file.resolve(), log_filter)
+    except (ValueError, TypeError, KeyError) as e:
+        result['parse_error'] = f'{type(e).__name__}: {e}'
+        return result
+    result['rows_out'] = len(parsed_df)
+    if parsed_df.empty:
+        return result
+
+    parsed_df = parsed_df[ANALYSIS_COLUMNS]
+    server_codes, server_names = encode_column(parsed_df['server_name'])
+    row_shards = shard_numbers(server_names, n_shards)[server_codes]
+    for shard in np.unique(row_shards):
+        shard_dir = shard_root / f'{shard:04d}'
+        shard_dir.mkdir(exist_ok=True)
+        parsed_df.iloc[np.flatnonzero(row_shards == shard)].to_pickle(shard_dir / f'{index:06d}.pkl')
+    return result
+
+
+def aggregate_shard(shard_dir: Path) -> pd.DataFrame:
+    """
+    1つのシャードの一時ファイルをファイル順に結合し、部分集計を作成する関数（プロセスプールから呼び出す）
+
+    :param shard_dir: シャードの一時ファイルのディレクトリ
+    :return: シャード内のサーバーの部分集計
+    """
+
+    pieces = [pd.read_pickle(piece) for piece in sorted(shard_dir.glob('*.pkl'))]
+    return aggregate_partial(concat_logs(pieces))
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    from loganalyzer.analyzer import analyze_df
+    from loganalyzer.loader import load_logs_from_dir
+    from loganalyzer.parser import parse_all
+
+    setup_logging(level=logging.INFO)
+    sample_dir = Path(__file__).parent.parent / 'data' / 'sample_logs'
+    sharded = analyze_sharded(sample_dir, workers=2, n_shards=3)
+    expected = analyze_df(parse_all(*load_logs_from_dir(sample_dir)))
+    print(sharded)
+    print(sharded.equals(expected))
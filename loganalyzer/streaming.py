@@ -0,0 +1,202 @@
+"""
+ログファイルをチャンク単位で読込・クレンジング・集計するストリーミング処理。生データを保持せずに分析結果を作成する。
+"""
+import logging
+from pathlib import Path
+from typing import Union
+import numpy as np
+import pandas as pd
+from loganalyzer.analyzer import DailyAggregator
+from loganalyzer.filters import LogFilter
+from loganalyzer.instrumentation import measure_file
+from loganalyzer.loader import collect_log_files, read_log_chunks
+from loganalyzer.logging_config import setup_logging
+from loganalyzer.parser import LOG_DTYPES, USAGE_COLUMNS, parse_one
+
+logger = logging.getLogger(__name__)
+
+class RowHashSet:
+    """
+    既出行のハッシュ値（1行8バイト）の集合。チャンク・追記分ごとに既出行を除外するために使用する。
+
+    ハッシュ値は昇順ソート済みの配列（ラン）のリストとして保持し、追加のたびに全体をソートし直すことはしない。
+    新しいランは直前のランの長さ以上になった場合のみ併合するため（長さが2倍ずつのランになる）、
+    各ハッシュ値の併合回数はlog(行数)回程度、1回の判定の処理量は追加する行数×ラン数（log(行数)程度）に比例する。
+
+    windowを指定した場合は、これまでの最新のtimestampからwindowより前の行のみからなるランを破棄する
+    （保持するハッシュ値は直近の期間の行数程度に抑えられるが、それより古い行と同じ行は除外されない）。
+    """
+
+    def __init__(self, window: Union[pd.Timedelta, None] = None):
+        """
+        :param window: 既出行として保持する期間（timestampの範囲）、指定しない場合はすべての行を保持する
+        """
+
+        self.window = window
+        self._runs: list[np.ndarray] = []
+        # ランごとの最新のtimestamp（windowを指定した場合のみ使用する）
+        self._run_latest: list[pd.Timestamp] = []
+        self._latest: Union[pd.Timestamp, None] = None
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self._runs)
+
+    def drop_seen(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        既出の行を除外し、残った行のハッシュ値を集合に追加する
+
+        チャンク内の重複はparse_oneで除去済みのため、ここでは過去のチャンクとの重複のみを判定する。
+        使用率の列の型はチャンクごとに異なる（欠損値を含むチャンクのみfloat64になる）ため、
+        LOG_DTYPESの型に揃えてからハッシュを求める（型が違うと同じ行でもハッシュが異なる）。
+
+        :param df: クレンジング済みのチャンク
+        :return: 既出行を除いたチャンク
+        """
+
+        if df.empty:
+            return df
+        usage_dtypes = {col: LOG_DTYPES[col] for col in USAGE_COLUMNS if col in df.columns}
+        row_hashes = pd.util.hash_pandas_object(df.astype(usage_dtypes), index=False).to_numpy()
+        is_new = np.ones(len(row_hashes), dtype=bool)
+        for run in self._runs:
+            positions = np.searchsorted(run, row_hashes)
+            is_new &= run[np.minimum(positions, len(run) - 1)] != row_hashes
+        if not is_new.all():
+            df = df[is_new]
+            row_hashes = row_hashes[is_new]
+        if len(row_hashes):
+            latest = pd.Timestamp(df['timestamp'].max()) if self.window is not None else None
+            self._add_run(np.sort(row_hashes), latest)
+        return df
+
+    def _add_run(self, run: np.ndarray, latest: Union[pd.Timestamp, None]):
+        """
+        ソート済みのハッシュ値をランとして追加し、直前のランより長くなった場合は併合する
+
+        :param run: 昇順ソート済みの（既存のランと重複しない）ハッシュ値
+        :param latest: runの行の最新のtimestamp（windowを指定しない場合はNone）
+        :return: なし
+        """
+
+        self._runs.append(run)
+        self._run_latest.append(latest)
+        while len(self._runs) >= 2 and len(self._runs[-2]) <= len(self._runs[-1]):
+            last, last_latest = self._runs.pop(), self._run_latest.pop()
+            self._runs[-1] = np.sort(np.concatenate([self._runs[-1], last]))
+            if last_latest is not None:
+                self._run_latest[-1] = max(self._run_latest[-1], last_latest)
+
+        if self.window is None:
+            return
+        self._latest = latest if self._latest is None else max(self._latest, latest)
+        cutoff = self._latest - self.window
+        if any(run_latest < cutoff for run_latest in self._run_latest):
+            kept = [i for i, run_latest in enumerate(self._run_latest) if run_latest >= cutoff]
+            self._runs = [self._runs[i] for i in kept]
+            self._run_latest = [self._run_latest[i] for i in kept]
+
+
+def analyze_stream(
+        data_dir : Path,
+        chunksize : Union[int, None] = None,
+        log_filter : Union[LogFilter, None] = None) -> pd.DataFrame:
+    """
+    指定ディレクトリのログファイルを逐次処理し、分析結果を作成する関数
+
+    ファイル（CSVはchunksize行ごとのチャンク）単位で読込・parse_oneによるクレンジングを行い、
+    サーバー別・日別の部分集計に反映した後、生データは破棄する。
+    そのためピーク時のメモリ使用量はデータ総量ではなくチャンクサイズに比例する。
+
+    重複データの除去は一括処理と同じくファイル単位で行う。
+    チャンクをまたぐ重複は、ファイル処理中のみ保持する行ハッシュ（RowHashSet、1行8バイト）で判定する。
+    ファイルの読込・解析に失敗した場合は、そのファイルの集計値を破棄してスキップする。
+
+    :param data_dir:　ログデータが格納されているディレクトリのパス
+    :param chunksize:　CSVの1チャンクあたりの行数、指定しない場合はファイル単位で処理する
+    :param log_filter:　絞り込み条件、指定しない場合は全行を対象とする
+    :return:　analyze_df関数と同じ形式の分析・集計結果
+    """
+
+    data_dir_resolved = data_dir.resolve()
+    logger.info(f'Streaming analysis started: {data_dir_resolved}')
+
+    target_files = collect_log_files(data_dir, log_filter)
+    aggregator = DailyAggregator()
+    loaded_count = 0
+    for file in target_files:
+        # 途中で失敗したファイルの集計値を全体に混ぜないよう、ファイル単位で集計してから合算する
+        file_aggregator = aggregate_file(file, chunksize, log_filter)
+        if file_aggregator is None:
+            continue
+
+        loaded_count += 1
+        if file_aggregator.is_empty():
+            if log_filter is not None and log_filter.is_active():
+                logger.info(f'No rows matched the filter: {file.resolve()}')
+            else:
+                logger.error(f'No data found from file after parsing: {file.resolve()}')
+            continue
+        aggregator.merge(file_aggregator.partial())
+
+    if loaded_count == 0:
+        logger.error(f'No csv or json file in directory: {data_dir_resolved}')
+        raise FileNotFoundError(f'No csv or json file in directory: {data_dir_resolved}')
+    if aggregator.is_empty():
+        logger.error(f'All files are empty or empty after parsing')
+        raise RuntimeError(f'All files are empty or empty after parsing')
+
+    logger.info(f'Streaming analysis completed: {loaded_count} files')
+    return aggregator.result()
+
+
+def aggregate_file(
+        file : Path,
+        chunksize : Union[int, None],
+        log_filter : Union[LogFilter, None] = None) -> Union[DailyAggregator, None]:
+    """
+    1つのログファイルをチャンク単位で読込・クレンジングし、ファイル単位の集計を作成する関数
+
+    :param file:　対象ログファイルのパス
+    :param chunksize:　CSVの1チャンクあたりの行数
+    :param log_filter:　絞り込み条件、指定しない場合は全行を対象とする
+    :return:　ファイル単位の集計、読込・解析に失敗した場合はNone
+    """
+
+    file_resolved = file.resolve()
+    file_aggregator = DailyAggregator()
+    seen_rows = RowHashSet()
+    rows_in = rows_out = 0
+    logger.info(f'Streaming file: {file_resolved}')
+
+    with measure_file('aggregate', file) as record:
+        chunk_iter = read_log_chunks(file, chunksize)
+        while True:
+            try:
+                chunk = next(chunk_iter)
+            except StopIteration:
+                break
+            except Exception as e:
+                logger.error(f'Failed to read {file_resolved}: {e}')
+                record.error = f'read failed: {e}'
+                return None
+
+            try:
+                parsed_chunk = parse_one(chunk, file, log_filter)
+            except (ValueError, TypeError, KeyError) as e:
+                logger.exception(f'Failed to parse file: {file_resolved}')
+                record.error = f'parse failed: {e}'
+                return None
+            parsed_chunk = seen_rows.drop_seen(parsed_chunk)
+            file_aggregator.update(parsed_chunk)
+            rows_in += len(chunk)
+            rows_out += len(parsed_chunk)
+
+        record.rows_in = rows_in
+        record.rows_out = rows_out
+    return file_aggregator
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    setup_logging(level=logging.DEBUG)
+    print(analyze_stream(Path(__file__).parent.parent / 'data' / 'sample_logs', chunksize=100))
@@ -0,0 +1,469 @@
+"""
+メッセージのテンプレート抽出（Drain 方式）と、テンプレートごとのサーバー別・日別件数の索引（SQLite）。
+「CPU spike detected on core 3」と「CPU spike detected on core 7」のように変数部分だけが異なるメッセージを
+「CPU spike detected on core <*>」という1つのテンプレートにまとめ、どのサーバーがいつ出力したかを生ログを読まずに検索できるようにする。
+"""
+import datetime
+import logging
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, Union
+import numpy as np
+import pandas as pd
+from loganalyzer.analyzer import day_numbers, encode_column
+from loganalyzer.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# 変数部分を表すトークン
+WILDCARD = '<*>'
+# 数字を含むトークン（数値・IPアドレス・16進数・ID・時刻など）は変数部分とみなす
+_VARIABLE_PATTERN = r'\S*\d\S*'
+# 解析木の深さ（トークン数の階層と葉を含む。先頭のDRAIN_DEPTH-2個のトークンで葉を選ぶ）
+DRAIN_DEPTH = 4
+# 既存のテンプレートに属するとみなす一致率（位置ごとに一致するトークンの割合）
+SIMILARITY_THRESHOLD = 0.4
+# 解析木の1つの節の子の最大数（超える場合は変数部分の子にまとめる）
+MAX_CHILDREN = 100
+# 索引のスキーマ（テンプレート→サーバー・日付の転置索引と、サーバー・日付→テンプレートの索引）
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    template_id INTEGER PRIMARY KEY,
+    template TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS template_counts (
+    template_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    server_name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (template_id, date, server_name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS template_counts_server ON template_counts (server_name, date);
+"""
+
+class TemplateMiner:
+    """
+    Drain方式のテンプレート抽出器
+
+    メッセージをトークン数と先頭のトークンで解析木の葉に振り分け、葉の中で最も一致率の高いテンプレートに割り当てる。
+    一致率がSIMILARITY_THRESHOLD未満の場合は新しいテンプレートとする。
+    割り当てたテンプレートと異なる位置のトークンは変数部分（WILDCARD）に置き換える。
+    テンプレート番号は追加順の連番で、テンプレートの変数部分が増えても変わらない。
+    同じメッセージ（変数部分の置換後）は2回目以降は解析木を辿らずに前回の結果を返す。
+    """
+
+    def __init__(self, depth: int = DRAIN_DEPTH, similarity: float = SIMILARITY_THRESHOLD,
+                 max_children: int = MAX_CHILDREN):
+        """
+        :param depth: 解析木の深さ（3以上）
+        :param similarity: 既存のテンプレートに属するとみなす一致率
+        :param max_children: 解析木の1つの節の子の最大数
+        """
+
+        if depth < 3:
+            raise ValueError(f'depth must be at least 3: {depth}')
+        self.depth = depth
+        self.similarity = similarity
+        self.max_children = max_children
+        self._templates: list[list[str]] = []
+        self._tree: dict = {}
+        self._cache: dict[str, int] = {}
+
+    @classmethod
+    def from_templates(cls, templates: Iterable[str], **kwargs) -> 'TemplateMiner':
+        """
+        保存済みのテンプレート（テンプレート番号順）から抽出器を復元する
+
+        :param templates: テンプレート番号順のテンプレート
+        :return: 復元した抽出器（以降のテンプレート番号は保存済みの続きになる）
+        """
+
+        miner = cls(**kwargs)
+        for template in templates:
+            tokens = template.split()
+            miner._leaf(tokens, create=True).append(len(miner._templates))
+            miner._templates.append(tokens)
+        return miner
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def template(self, template_id: int) -> str:
+        """
+        :param template_id: テンプレート番号
+        :return: テンプレート（変数部分はWILDCARD）
+        """
+
+        return ' '.join(self._templates[template_id])
+
+    def templates(self) -> list[str]:
+        """
+        :return: テンプレート番号順のテンプレートのリスト
+        """
+
+        return [' '.join(tokens) for tokens in self._templates]
+
+    def add(self, message: str) -> int:
+        """
+        変数部分を置換済みのメッセージをテンプレートに割り当てる
+
+        :param message: メッセージ（mask_messages関数で変数部分を置換したもの）
+        :return: テンプレート番号
+        """
+
+        template_id = self._cache.get(message)
+        if template_id is not None:
+            return template_id
+
+        tokens = message.split()
+        leaf = self._leaf(tokens, create=False)
+        template_id = self._match(leaf, tokens) if leaf is not None else None
+        if template_id is None:
+            template_id = len(self._templates)
+            self._templates.append(tokens)
+            self._leaf(tokens, create=True).append(template_id)
+        else:
+            template = self._templates[template_id]
+            for position, token in enumerate(tokens):
+                if template[position] != token:
+                    template[position] = WILDCARD
+        self._cache[message] = template_id
+        return template_id
+
+    def _leaf(self, tokens: list[str], create: bool) -> Union[list[int], None]:
+        """
+        解析木を辿り、トークン数と先頭のトークンに対応する葉（テンプレート番号のリスト）を返す
+
+        :param tokens: トークン
+        :param create: Trueの場合は無い節・葉を作成する（Falseの場合は一致する子が無ければ変数部分の子を辿る）
+        :return: 葉、create=Falseで該当する葉が無い場合はNone
+        """
+
+        parent, key = self._tree, len(tokens)
+        for token in tokens[:self.depth - 2]:
+            node = parent.get(key)
+            if node is None:
+                if not create:
+                    return None
+                node = parent[key] = {}
+            if token in node:
+                key = token
+            elif create:
+                key = token if token != WILDCARD and len(node) < self.max_children else WILDCARD
+            elif WILDCARD in node:
+                key = WILDCARD
+            else:
+                return None
+            parent = node
+
+        leaf = parent.get(key)
+        if leaf is None and create:
+            leaf = parent[key] = []
+        return leaf
+
+    def _match(self, leaf: list[int], tokens: list[str]) -> Union[int, None]:
+        """
+        葉の中で最も一致率の高いテンプレートを返す（一致率が同じ場合は変数部分の多い方）
+
+        テンプレートの変数部分の位置は一致とみなす。
+
+        :param leaf: テンプレート番号のリスト
+        :param tokens: トークン
+        :return: テンプレート番号、一致率がsimilarity未満の場合はNone
+        """
+
+        best_id, best_key = None, (-1.0, -1)
+        for template_id in leaf:
+            template = self._templates[template_id]
+            same = sum(1 for expected, token in zip(template, tokens) if expected == token or expected == WILDCARD)
+            key = (same / len(tokens) if tokens else 1.0, template.count(WILDCARD))
+            if key > best_key:
+                best_id, best_key = template_id, key
+        if best_key[0] < self.similarity:
+            return None
+        return best_id
+
+
+def mask_messages(messages: pd.Series) -> pd.Series:
+    """
+    メッセージの変数部分（数字を含むトークン）をWILDCARDに一括置換する関数
+
+    pyarrow形式の文字列列の場合は、行ごとのPython処理ではなくpyarrowの正規表現置換で処理される。
+
+    :param messages: message列
+    :return: 変数部分を置換したmessage列（前後の空白は除く）
+    """
+
+    return messages.astype('str').str.replace(_VARIABLE_PATTERN, WILDCARD, regex=True).str.strip()
+
+
+def extract_templates(messages: pd.Series, miner: TemplateMiner) -> np.ndarray:
+    """
+    メッセージごとのテンプレート番号を求める関数
+
+    同じメッセージは1回だけ処理するよう、重複を除いたメッセージの変数部分を一括置換し、
+    置換後も重複を除いたメッセージのみを抽出器に渡す。抽出器の処理回数は行数ではなく異なるメッセージの数になる。
+
+    :param messages: message列
+    :param miner: テンプレート抽出器（抽出したテンプレートが追加される）
+    :return: 行ごとのテンプレート番号（欠損値の行は-1）
+    """
+
+    codes, uniques = pd.factorize(messages)
+    if len(uniques) == 0:
+        return np.full(len(messages), -1, dtype='int64')
+    masked_codes, masked_uniques = pd.factorize(mask_messages(pd.Series(uniques)))
+    template_ids = np.fromiter(map(miner.add, masked_uniques), dtype='int64', count=len(masked_uniques))
+    ids = template_ids[masked_codes][codes]
+    return np.where(codes >= 0, ids, -1)
+
+
+def count_templates(df: pd.DataFrame, template_ids: np.ndarray) -> pd.DataFrame:
+    """
+    サーバー別・日別・テンプレート別の件数を集計する関数
+
+    :param df: パース済みのログデータ
+    :param template_ids: extract_templates関数で求めた行ごとのテンプレート番号
+    :return: server_name, date, template_id, countを持ち、server_name, date, template_idの昇順に並んだデータ
+    """
+
+    server_codes, server_names = encode_column(df['server_name'])
+    days = day_numbers(df['timestamp'])
+    valid = (server_codes >= 0) & (template_ids >= 0) & (days != np.datetime64('NaT', 'D').view('int64'))
+    if not valid.any():
+        return pd.DataFrame({
+            'server_name': pd.Series(dtype='str'), 'date': pd.Series(dtype=object),
+            'template_id': pd.Series(dtype='int64'), 'count': pd.Series(dtype='int64'),
+        })
+
+    server_codes, days, template_ids = server_codes[valid], days[valid], template_ids[valid]
+    first_day = days.min()
+    n_days = int(days.max() - first_day) + 1
+    n_templates = int(template_ids.max()) + 1
+    keys = (server_codes * n_days + (days - first_day)) * n_templates + template_ids
+    inverse, unique_keys = pd.factorize(keys)
+    counts = np.bincount(inverse)
+    order = np.argsort(unique_keys)
+    unique_keys, counts = unique_keys[order], counts[order]
+
+    group, template = np.divmod(unique_keys, n_templates)
+    server, day = np.divmod(group, n_days)
+    return pd.DataFrame({
+        'server_name': np.asarray(server_names, dtype=object)[server],
+        # datetime64[D]をobject型に変換するとdatetime.dateになる（analyze_dfのdate列と同じ型）
+        'date': (day + first_day).astype('datetime64[D]').astype(object),
+        'template_id': template,
+        'count': counts.astype('int64'),
+    })
+
+
+class TemplateIndex:
+    """
+    テンプレートと、テンプレートごとのサーバー別・日別件数の索引
+
+    SQLiteのファイルに、テンプレートの一覧（templates）と、
+    (テンプレート番号, 日付, サーバー名) を主キーとする件数（template_counts）を保存する。
+    主キーがテンプレートからサーバー・日付への転置索引になり、
+    「先週テンプレートXを出力したサーバー」は生ログを読まずに索引の範囲検索で求められる。
+    updateで追加したログの件数は既存の件数に合算する（同じ行を2回追加すると二重に数える）。
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: 索引のファイルパス（存在しない場合はupdateで作成する）
+        """
+
+        self.path = Path(path)
+
+    def miner(self) -> TemplateMiner:
+        """
+        :return: 保存済みのテンプレートから復元した抽出器（索引が無い場合は空の抽出器）
+        """
+
+        if not self.path.exists():
+            return TemplateMiner()
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT template FROM templates ORDER BY template_id').fetchall()
+        return TemplateMiner.from_templates(template for template, in rows)
+
+    def update(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        ログデータのメッセージからテンプレートを抽出し、サーバー別・日別の件数を索引に合算する
+
+        :param df: パース済みのログデータ（message列を含む、保存済みの件数に含まれていない行）
+        :return: 追加したログデータのサーバー別・日別・テンプレート別の件数（count_templates関数の結果）
+        """
+
+        miner = self.miner()
+        known = len(miner)
+        template_ids = extract_templates(df['message'], miner)
+        counts = count_templates(df, template_ids)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            # 既存のテンプレートも変数部分が増えている場合があるため全件書き直す
+            conn.executemany(
+                'INSERT INTO templates (template_id, template) VALUES (?, ?) '
+                'ON CONFLICT (template_id) DO UPDATE SET template = excluded.template',
+                enumerate(miner.templates())
+            )
+            conn.executemany(
+                'INSERT INTO template_counts (template_id, date, server_name, count) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (template_id, date, server_name) DO UPDATE SET count = count + excluded.count',
+                zip(counts['template_id'].tolist(), map(str, counts['date']),
+                    counts['server_name'].tolist(), counts['count'].tolist())
+            )
+
+        logger.info(f'Template index updated with {len(df)} rows: '
+                    f'{len(miner)} templates ({len(miner) - known} new), {len(counts)} server-day counts')
+        return counts
+
+    def rebuild(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        保存済みの索引を破棄し、ログデータから作成し直す
+
+        :param df: パース済みのログデータ（message列を含む）
+        :return: サーバー別・日別・テンプレート別の件数（count_templates関数の結果）
+        """
+
+        self.path.unlink(missing_ok=True)
+        return self.update(df)
+
+    def templates(self, pattern: Union[str, None] = None) -> pd.DataFrame:
+        """
+        テンプレートの一覧を返す
+
+        :param pattern: 指定した場合、この文字列を含むテンプレートのみ（大文字・小文字を区別しない）
+        :return: template_id, template, countを持ち、件数の多い順に並んだデータ
+        """
+
+        sql = ('SELECT t.template_id, t.template, COALESCE(SUM(c.count), 0) AS count FROM templates t '
+               'LEFT JOIN template_counts c ON c.template_id = t.template_id')
+        params: list = []
+        if pattern is not None:
+            sql += " WHERE t.template LIKE ? ESCAPE '\\'"
+            params.append('%' + pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        sql += ' GROUP BY t.template_id ORDER BY count DESC, t.template_id'
+        return self._query(sql, params, ['template_id', 'template', 'count'])
+
+    def servers(self, template: Union[int, str], since: Union[str, datetime.date, None] = None,
+                until: Union[str, datetime.date, None] = None) -> pd.DataFrame:
+        """
+        テンプレートを出力したサーバーを返す（転置索引の範囲検索のみで、生ログは読まない）
+
+        :param template: テンプレート番号、またはテンプレート（文字列の場合は完全一致）
+        :param since: 対象期間の開始日（この日を含む）、指定しない場合は制限なし
+        :param until: 対象期間の終了日（この日を含む）、指定しない場合は制限なし
+        :return: server_name, days, count, first_date, last_dateを持ち、件数の多い順に並んだデータ
+        """
+
+        sql = ('SELECT server_name, COUNT(*) AS days, SUM(count) AS count, MIN(date) AS first_date, '
+               'MAX(date) AS last_date FROM template_counts WHERE template_id = ?')
+        template_id = template if isinstance(template, (int, np.integer)) else self._template_id(template)
+        if template_id is None:
+            return pd.DataFrame(columns=['server_name', 'days', 'count', 'first_date', 'last_date'])
+        params: list = [int(template_id)]
+        sql, params = _date_conditions(sql, params, since, until)
+        sql += ' GROUP BY server_name ORDER BY count DESC, server_name'
+        result = self._query(sql, params, ['server_name', 'days', 'count', 'first_date', 'last_date'])
+        for column in ('first_date', 'last_date'):
+            result[column] = pd.to_datetime(result[column]).dt.date
+        return result
+
+    def counts(self, servers: Union[Iterable[str], None] = None, since: Union[str, datetime.date, None] = None,
+               until: Union[str, datetime.date, None] = None) -> pd.DataFrame:
+        """
+        サーバー別・日別のテンプレートごとの件数を返す
+
+        :param servers: 対象サーバー名、指定しない場合は全サーバー
+        :param since: 対象期間の開始日（この日を含む）、指定しない場合は制限なし
+        :param until: 対象期間の終了日（この日を含む）、指定しない場合は制限なし
+        :return: server_name, date, template_id, template, countを持ち、server_name, date, 件数の多い順に並んだデータ
+        """
+
+        sql = ('SELECT c.server_name, c.date, c.template_id, t.template, c.count FROM template_counts c '
+               'JOIN templates t ON t.template_id = c.template_id WHERE 1 = 1')
+        params: list = []
+        if servers is not None:
+            servers = list(servers)
+            sql += f' AND c.server_name IN ({", ".join("?" * len(servers))})'
+            params.extend(servers)
+        sql, params = _date_conditions(sql, params, since, until, column='c.date')
+        sql += ' ORDER BY c.server_name, c.date, c.count DESC, c.template_id'
+        result = self._query(sql, params, ['server_name', 'date', 'template_id', 'template', 'count'])
+        result['date'] = pd.to_datetime(result['date']).dt.date
+        return result
+
+    def _template_id(self, template: str) -> Union[int, None]:
+        """
+        :param template: テンプレート
+        :return: テンプレート番号、索引に無い場合はNone
+        """
+
+        if not self.path.exists():
+            return None
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT template_id FROM templates WHERE template = ?', (template,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _query(self, sql: str, params: list, columns: list[str]) -> pd.DataFrame:
+        """
+        :return: 問い合わせ結果（索引が無い場合は空のデータ）
+        """
+
+        if not self.path.exists():
+            return pd.DataFrame(columns=columns)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        :return: スキーマを作成済みの接続
+        """
+
+        conn = sqlite3.connect(self.path)
+        conn.executescript(_SCHEMA)
+        return conn
+
+
+def _date_conditions(sql: str, params: list, since: Union[str, datetime.date, None],
+                     until: Union[str, datetime.date, None], column: str = 'date') -> (str, list):
+    """
+    期間の条件を問い合わせに追加する（日付は'YYYY-MM-DD'の文字列として比較する）
+
+    :return: 条件を追加した問い合わせとパラメーター
+    """
+
+    if since is not None:
+        sql += f' AND {column} >= ?'
+        params.append(str(pd.Timestamp(since).date()))
+    if until is not None:
+        sql += f' AND {column} <= ?'
+        params.append(str(pd.Timestamp(until).date()))
+    return sql, params
+
+
+#ここからはテストです
+if __name__ == '__main__':
+    import tempfile
+    setup_logging(level=logging.DEBUG)
+
+    data = pd.DataFrame({
+        'server_name': ['s1', 's1', 's2', 's2', 's1'],
+        'timestamp': pd.to_datetime([
+            '2026-02-01 10:00:00', '2026-02-01 11:00:00', '2026-02-01 12:00:00',
+            '2026-02-02 09:00:00', '2026-02-02 10:00:00',
+        ]),
+        'message': [
+            'CPU spike detected on core 3', 'CPU spike detected on core 7', 'Connection timeout to 10.0.0.5:5432',
+            'Connection timeout to 10.0.0.9:5432', 'Service started',
+        ],
+    })
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = TemplateIndex(Path(tmp_dir) / 'templates.sqlite')
+        print(index.rebuild(data))
+        print(index.templates())
+        print(index.servers('Connection timeout to <*>', since='2026-02-01', until='2026-02-07'))
+        print(index.counts(servers=['s1']))
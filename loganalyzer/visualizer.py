@@ -1,31 +1,66 @@
 """
 集計結果をもとに CPU/メモリ使用率の折れ線グラフとエラー件数の棒グラフを描画し、data/output に PNG で保存する。
 """
+import hashlib
+import json
 import logging
+import os
+import re
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Union
+import numpy as np
 import pandas as pd
-from matplotlib import pyplot as plt
-from matplotlib.figure import Figure
-from matplotlib.axes import Axes
 from loganalyzer.logging_config import setup_logging
 
+# matplotlibは読込に時間がかかるため、描画する場合のみ読み込む（描画済みグラフのみの場合は読み込まない）
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+    from matplotlib.figure import Figure
+
 logger = logging.getLogger(__name__)
 
-def visualize_result(df: pd.DataFrame):
+# 既定の出力先
+DEFAULT_OUTPUT_DIR = Path(__file__).parent.parent / 'data' / 'output'
+# 描画済みグラフの管理情報（出力先ディレクトリに保存する）
+CHART_CACHE_NAME = '.chart_cache.json'
+# 描画内容を変更した場合は値を上げ、描画済みグラフを再描画する
+CHART_VERSION = 2
+# 1系列あたりの最大描画点数（超える場合は区間ごとの最小値・最大値に間引く）
+MAX_POINTS = 1000
+# 全体グラフでサーバーごとの折れ線を描画する最大サーバー数（超える場合は平均と最小～最大の範囲を描画する）
+SUMMARY_SERVER_LIMIT = 10
+# ファイル名に使用しない文字
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^\w.-]')
+
+def visualize_result(df: pd.DataFrame, output_dir: Union[Path, None] = None, workers: Union[int, None] = None,
+                     per_server: bool = False, use_cache: bool = True, max_points: int = MAX_POINTS) -> list[Path]:
     """
     解析結果のDataFrameをもとにグラフを生成し、画像ファイルとして保存する関数
 
     出力用ディレクトリを作成する（存在しない場合）
     CPU使用率・メモリ使用率の推移グラフを生成する
     エラー件数の棒グラフを生成する
+    per_server=Trueの場合はサーバーごとのグラフも生成する
     date列の最小値・最大値から期間を取得し、分析期間・生成時タイムスタンプ付きのファイル名でPNG形式で保存する
+
+    pyplotを使用せずFigureを直接生成するため、描画後の図はどこからも参照されずに解放される。
+    workersに2以上を指定した場合はプロセスプールで並列に描画する。
+    use_cache=Trueの場合、グラフごとに描画対象データのハッシュ値を記録し、
+    前回から変化がなく画像が残っているグラフは再描画せず前回の画像を使用する。
+
     :param df: analyze_df関数で生成された解析済みデータ
-    :return: なし
+    :param output_dir: 出力先のディレクトリのパス、指定しない場合はdata/output
+    :param workers: 並列描画のプロセス数、指定しない場合（または1以下）は逐次描画
+    :param per_server: Trueの場合、サーバーごとのグラフも生成する
+    :param use_cache: Trueの場合、変化のないグラフの再描画を省略する
+    :param max_points: 1系列あたりの最大描画点数
+    :return: グラフ画像のファイルパスのリスト
     """
 
     logger.info('Visualizing result')
-    output_dir = Path(__file__).parent.parent / 'data' / 'output'
+    output_dir = DEFAULT_OUTPUT_DIR if output_dir is None else Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
     try:
@@ -37,11 +72,26 @@ def visualize_result(df: pd.DataFrame):
 
     now = str(int(time.time()))
     try:
-        fig1, ax1 = make_usage_plot(df)
-        fig1.savefig(output_dir / f'usage_{start_date}-{end_date}_{now}.png')
+        charts = chart_jobs(df, per_server)
+        cache = _load_chart_cache(output_dir) if use_cache else {}
+        paths: list[Path] = []
+        pending: list[tuple[str, str, pd.DataFrame, Path]] = []
+        stems = _unique_filenames(key for key, _, _ in charts)
+        for (key, kind, chart_df), stem in zip(charts, stems):
+            digest = chart_digest(kind, chart_df, max_points)
+            cached = cache.get(key)
+            if cached is not None and cached['digest'] == digest and (output_dir / cached['file']).exists():
+                logger.info(f'Chart {key} is unchanged, skipped rendering')
+                paths.append(output_dir / cached['file'])
+                continue
+            path = output_dir / f'{stem}_{start_date}-{end_date}_{now}.png'
+            pending.append((key, kind, chart_df, path))
+            cache[key] = {'digest': digest, 'file': path.name}
+            paths.append(path)
 
-        fig2, ax2 = make_errors_bar_plot(df)
-        fig2.savefig(output_dir / f'errors_{start_date}-{end_date}_{now}.png')
+        _render_all(pending, max_points, workers)
+        if use_cache:
+            _save_chart_cache(output_dir, cache)
 
     except (KeyError, ValueError, TypeError) as e:
         logger.exception(f'Data error: {e}')
@@ -54,28 +104,111 @@ def visualize_result(df: pd.DataFrame):
         raise
 
     else:
-        logger.info(f'Visualization completed')
+        logger.info(f'Visualization completed ({len(pending)} rendered, {len(paths) - len(pending)} cached)')
+    return paths
+
+
+def chart_jobs(df: pd.DataFrame, per_server: bool = False) -> list[tuple[str, str, pd.DataFrame]]:
+    """
+    描画するグラフと、それぞれの描画に必要な列だけを切り出したデータを列挙する関数
+
+    :param df: analyze_df関数で生成された解析済みデータ
+    :param per_server: Trueの場合、サーバーごとのグラフも含める
+    :return: （グラフのキー, グラフの種類, 描画対象データ）のリスト
+    """
+
+    if 'ERROR' not in df.columns:
+        # 期間内にERRORが1件もない場合は集計結果に列がないため0件として描画する
+        df = df.assign(ERROR=0)
+    # 異常判定（detect_anomalies関数）の列がある場合は、異常と判定された日を印として描画する
+    anomaly_columns = ['anomaly'] if 'anomaly' in df.columns else []
+    usage_df = df[['server_name', 'date', 'cpu_avg', 'memory_avg'] + anomaly_columns]
+    errors_df = df[['date', 'ERROR']]
+    charts = [('usage', 'usage', usage_df), ('errors', 'errors', errors_df)]
+    if per_server:
+        server_df = df[['server_name', 'date', 'cpu_avg', 'memory_avg', 'ERROR'] + anomaly_columns]
+        for server_name, df_by_server in server_df.groupby('server_name', sort=True):
+            charts.append((f'server_{server_name}', 'server', df_by_server))
+    return charts
 
 
-def make_usage_plot(df: pd.DataFrame) -> (Figure, Axes):
+def chart_digest(kind: str, df: pd.DataFrame, max_points: int) -> str:
+    """
+    グラフの描画内容を表すハッシュ値を計算する関数
+
+    グラフの種類・描画設定・描画対象データの列名と値からハッシュ値を計算する。
+
+    :param kind: グラフの種類
+    :param df: 描画対象データ
+    :param max_points: 1系列あたりの最大描画点数
+    :return: 16進文字列のハッシュ値
+    """
+
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f'{CHART_VERSION}:{kind}:{max_points}:{list(map(str, df.columns))}'.encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def render_chart(kind: str, df: pd.DataFrame, path: Path, max_points: int = MAX_POINTS):
+    """
+    グラフを描画してPNG形式で保存する関数（プロセスプールから呼び出す）
+
+    :param kind: グラフの種類（'usage'、'errors'、'server'）
+    :param df: 描画対象データ
+    :param path: 保存先のファイルパス
+    :param max_points: 1系列あたりの最大描画点数
+    :return: なし
+    """
+
+    if kind == 'usage':
+        fig, _ = make_usage_plot(df, max_points)
+    elif kind == 'errors':
+        fig, _ = make_errors_bar_plot(df, max_points)
+    elif kind == 'server':
+        fig, _ = make_server_plot(df, max_points)
+    else:
+        raise ValueError(f'Unknown chart kind: {kind}')
+    fig.savefig(path)
+
+
+def make_usage_plot(df: pd.DataFrame, max_points: int = MAX_POINTS) -> ('Figure', 'Axes'):
     """
     CPU使用率およびメモリ使用率の推移グラフを作成する関数
 
 
     date列を横軸として折れ線グラフを作成する
     cpu_avg、memory_avg列を使用して使用率を可視化する
+    サーバー数がSUMMARY_SERVER_LIMITを超える場合は、サーバー間の平均を折れ線、最小～最大を範囲として描画する
+    anomaly列がある場合は、いずれかのサーバーが異常と判定された日に縦線を描画する
     ラベル、タイトル、レイアウトを設定する
 
     :param df: analyze_df関数で生成された解析済みデータ
+    :param max_points: 1系列あたりの最大描画点数
     :return:作成されたFigureオブジェクトとAxesオブジェクト
     """
 
 
+    from matplotlib.figure import Figure
+
     logger.info('Generating usage plot')
-    fig, ax = plt.subplots(figsize=(12, 6))
-    for server_name, server_df in df.groupby('server_name'):
-        ax.plot(server_df['date'], server_df['cpu_avg'], label=f'{server_name} CPU Usage')
-        ax.plot(server_df['date'], server_df['memory_avg'], label=f'{server_name} Memory Usage')
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    if df['server_name'].nunique() <= SUMMARY_SERVER_LIMIT:
+        for server_name, server_df in df.groupby('server_name'):
+            dates = _to_datetime64(server_df['date'])
+            ax.plot(*downsample(dates, server_df['cpu_avg'], max_points), label=f'{server_name} CPU Usage')
+            ax.plot(*downsample(dates, server_df['memory_avg'], max_points), label=f'{server_name} Memory Usage')
+    else:
+        daily = df.groupby('date', sort=True)[['cpu_avg', 'memory_avg']].agg(['mean', 'min', 'max'])
+        dates = _to_datetime64(daily.index.to_series())
+        for column, label in (('cpu_avg', 'CPU Usage'), ('memory_avg', 'Memory Usage')):
+            line, = ax.plot(*downsample(dates, daily[(column, 'mean')], max_points), label=f'{label} (mean)')
+            band_dates, band_min = downsample(dates, daily[(column, 'min')], max_points, how='min')
+            _, band_max = downsample(dates, daily[(column, 'max')], max_points, how='max')
+            ax.fill_between(band_dates, band_min, band_max, color=line.get_color(), alpha=0.2,
+                            label=f'{label} (min-max)')
+    _mark_anomalies(ax, df)
 
     ax.set_xlabel('Date')
     ax.tick_params(axis='x', labelrotation=45)
@@ -88,22 +221,28 @@ def make_usage_plot(df: pd.DataFrame) -> (Figure, Axes):
     return fig, ax
 
 
-def make_errors_bar_plot(df: pd.DataFrame) -> (Figure, Axes):
+def make_errors_bar_plot(df: pd.DataFrame, max_points: int = MAX_POINTS) -> ('Figure', 'Axes'):
     """
     日別エラー件数の棒グラフを作成する関数
 
     date列を横軸として棒グラフを作成する
-    ERROR列を使用して日別エラー件数を表示する
+    ERROR列を日別に合計してエラー件数を表示する
     ラベル、タイトル、レイアウトを設定する
 
     :param df: analyze_df関数で生成された解析済みデータ
+    :param max_points: 最大描画本数（超える場合は区間ごとの最大値を表示する）
     :return: 作成されたFigureオブジェクトとAxesオブジェクト
     """
 
 
+    from matplotlib.figure import Figure
+
     logger.info('Generating errors bar plot')
-    fig, ax = plt.subplots(figsize=(10, 5))
-    ax.bar(df['date'], df['ERROR'], label='Daily Error Count')
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    daily_errors = df.groupby('date', sort=True)['ERROR'].sum()
+    ax.bar(*downsample(_to_datetime64(daily_errors.index.to_series()), daily_errors, max_points, how='max'),
+           label='Daily Error Count')
 
     ax.set_xlabel('Date')
     ax.tick_params(axis='x', labelrotation=45)
@@ -115,8 +254,196 @@ def make_errors_bar_plot(df: pd.DataFrame) -> (Figure, Axes):
     return fig, ax
 
 
+def make_server_plot(df: pd.DataFrame, max_points: int = MAX_POINTS) -> ('Figure', 'Axes'):
+    """
+    1サーバー分の使用率の推移グラフとエラー件数の棒グラフを上下に並べて作成する関数
+
+    anomaly列がある場合は、異常と判定された日に縦線を描画する
+
+    :param df: analyze_df関数で生成された解析済みデータのうち1サーバー分
+    :param max_points: 1系列あたりの最大描画点数
+    :return: 作成されたFigureオブジェクトと使用率グラフのAxesオブジェクト
+    """
+
+    server_name = df['server_name'].iloc[0]
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 8))
+    usage_ax, errors_ax = fig.subplots(2, 1, sharex=True)
+    dates = _to_datetime64(df['date'])
+    usage_ax.plot(*downsample(dates, df['cpu_avg'], max_points), label='CPU Usage')
+    usage_ax.plot(*downsample(dates, df['memory_avg'], max_points), label='Memory Usage')
+    _mark_anomalies(usage_ax, df)
+    usage_ax.set_ylabel('Usage(%)')
+    usage_ax.set_title(f'{server_name} Average Daily Usage')
+    usage_ax.legend()
+
+    errors_ax.bar(*downsample(dates, df['ERROR'], max_points, how='max'), label='Daily Error Count')
+    errors_ax.set_xlabel('Date')
+    errors_ax.tick_params(axis='x', labelrotation=45)
+    errors_ax.set_ylabel('Count')
+    errors_ax.legend()
+    fig.tight_layout()
+    return fig, usage_ax
+
+
+def downsample(x, y, max_points: int, how: str = 'minmax') -> (np.ndarray, np.ndarray):
+    """
+    系列を最大描画点数以下に間引く関数
+
+    系列を等間隔の区間に分け、how='minmax'の場合は区間ごとの最小値と最大値の2点、
+    how='min' / 'max'の場合は区間ごとの最小値または最大値の1点を残す。
+    ピークを残すため、単純な間引きと異なり異常値がグラフから消えない。
+    欠損値は区間内の集計から除外する。
+
+    :param x: 横軸の値（昇順）
+    :param y: 縦軸の値
+    :param max_points: 最大点数
+    :param how: 区間ごとに残す値（'minmax'、'min'、'max'）
+    :return: 間引き後の横軸と縦軸の値
+    """
+
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= max_points:
+        return x, y
+
+    n_buckets = max(max_points // 2, 1) if how == 'minmax' else max_points
+    starts = (np.arange(n_buckets) * n) // n_buckets
+    ends = np.append(starts[1:], n) - 1
+    with np.errstate(invalid='ignore'):
+        mins = np.fmin.reduceat(y, starts)
+        maxs = np.fmax.reduceat(y, starts)
+    if how == 'min':
+        return x[starts], mins
+    if how == 'max':
+        return x[starts], maxs
+    return np.column_stack([x[starts], x[ends]]).ravel(), np.column_stack([mins, maxs]).ravel()
+
+
+def _mark_anomalies(ax: 'Axes', df: pd.DataFrame):
+    """
+    異常と判定された日に縦線を描画する（anomaly列が無い場合は何もしない）
+
+    :param ax: 描画先のAxesオブジェクト
+    :param df: anomaly列を持つ解析済みデータ
+    :return: なし
+    """
+
+    if 'anomaly' not in df.columns:
+        return
+    anomalous = df['anomaly'].fillna(False).to_numpy(dtype=bool)
+    if not anomalous.any():
+        return
+    dates = np.unique(_to_datetime64(df.loc[anomalous, 'date']))
+    ax.vlines(dates, 0, 1, transform=ax.get_xaxis_transform(), colors='red', alpha=0.3, label='Anomaly')
+
+
+def _to_datetime64(dates: pd.Series) -> np.ndarray:
+    """
+    :param dates: datetime.dateまたは日時型の列
+    :return: datetime64の配列
+    """
+
+    return pd.to_datetime(dates).to_numpy()
+
+
+def _safe_filename(key: str) -> str:
+    """
+    :param key: グラフのキー
+    :return: ファイル名に使用できない文字を「_」に置換した文字列
+    """
+
+    return _UNSAFE_FILENAME_CHARS.sub('_', key)
+
+
+def _unique_filenames(keys: Iterable[str]) -> list[str]:
+    """
+    グラフのキーから重複しないファイル名（拡張子・期間を除く部分）を作成する関数
+
+    置換により重複した場合（例：「a/b」と「a_b」）は末尾に連番を付ける。
+    大文字・小文字を区別しないファイルシステムを考慮し、大文字・小文字の違いのみの場合も重複とみなす。
+
+    :param keys: グラフのキー
+    :return: キーと同じ順のファイル名のリスト
+    """
+
+    stems: list[str] = []
+    used: set[str] = set()
+    for key in keys:
+        stem = _safe_filename(key)
+        candidate, n = stem, 1
+        while candidate.lower() in used:
+            candidate = f'{stem}_{n}'
+            n += 1
+        used.add(candidate.lower())
+        stems.append(candidate)
+    return stems
+
+
+def _render_all(pending: list[tuple[str, str, pd.DataFrame, Path]], max_points: int, workers: Union[int, None]):
+    """
+    グラフをまとめて描画する関数
+
+    workersに2以上を指定した場合はプロセスプールで並列に描画する。
+    描画失敗は呼び出し側で例外として受け取る（子プロセスのログ設定に依存しないため）。
+
+    :param pending: （グラフのキー, グラフの種類, 描画対象データ, 保存先）のリスト
+    :param max_points: 1系列あたりの最大描画点数
+    :param workers: 並列描画のプロセス数
+    :return: なし
+    """
+
+    if workers is not None and workers > 1 and len(pending) > 1:
+        logger.info(f'Rendering {len(pending)} charts with {workers} workers')
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(render_chart, kind, chart_df, path, max_points)
+                       for _, kind, chart_df, path in pending]
+            for (key, _, _, path), future in zip(pending, futures):
+                future.result()
+                logger.info(f'Chart {key} saved to {path}')
+    else:
+        for key, kind, chart_df, path in pending:
+            render_chart(kind, chart_df, path, max_points)
+            logger.info(f'Chart {key} saved to {path}')
+
+
+def _load_chart_cache(output_dir: Path) -> dict[str, dict]:
+    """
+    :param output_dir: 出力先のディレクトリのパス
+    :return: グラフのキーごとの描画済み情報（ハッシュ値、ファイル名）、読めない場合は空
+    """
+
+    try:
+        with open(output_dir / CHART_CACHE_NAME, encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('version') != CHART_VERSION:
+        return {}
+    return cache.get('charts', {})
+
+
+def _save_chart_cache(output_dir: Path, charts: dict[str, dict]):
+    """
+    描画済み情報を保存する。書き込み途中の破損を避けるため一時ファイルから置き換える。
+
+    :param output_dir: 出力先のディレクトリのパス
+    :param charts: グラフのキーごとの描画済み情報
+    :return: なし
+    """
+
+    cache_path = output_dir / CHART_CACHE_NAME
+    tmp_path = cache_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CHART_VERSION, 'charts': charts}, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+
+
 #ここからはテストです
 if __name__ == '__main__':
+    from loganalyzer.analyzer import analyze_df
     setup_logging(level=logging.DEBUG)
 
     data = {
@@ -133,4 +460,4 @@ if __name__ == '__main__':
     }
     data = pd.DataFrame(data)
 
-    visualize_result(data)
\ No newline at end of file
+    visualize_result(analyze_df(data), per_server=True)
@@ -4,21 +4,30 @@
 import logging
 from pathlib import  Path
 from typing import Union
-from loganalyzer.loader import load_logs_from_dir
+# pandas・openpyxl・matplotlibを読み込むモジュールは、その処理を行う場合のみmain関数内で読み込む
 from loganalyzer.logging_config import setup_logging
-from loganalyzer.parser import parse_all
-from loganalyzer.analyzer import analyze_df
-from loganalyzer.exporter import export_result
-from loganalyzer.visualizer import visualize_result
+from loganalyzer.instrumentation import Instrumentation, activate, stage
 
-def main(data_dir : Path, log_dir : Union[Path, None] = None, level = logging.INFO):
+def main(data_dir : Path, log_dir : Union[Path, None] = None, level = logging.INFO,
+         workers : Union[int, None] = None, stream : bool = False, chunksize : Union[int, None] = None,
+         cache_dir : Union[Path, None] = None, columnar_dir : Union[Path, None] = None,
+         columnar_format : str = 'parquet', since : Union[str, None] = None, until : Union[str, None] = None,
+         servers : Union[list[str], None] = None, export_mode : str = 'files',
+         export_workers : Union[int, None] = None, chart_workers : Union[int, None] = None,
+         per_server_charts : bool = False, output_dir : Union[Path, None] = None, report : bool = False,
+         profile_stage : Union[str, None] = None, profiler : str = 'cprofile', follow_logs : bool = False,
+         follow_interval : float = 2.0, flush_interval : float = 30.0, ingest_port : Union[int, None] = None,
+         ingest_protocol : str = 'http', rollup_dir : Union[Path, None] = None, detect_anomaly : bool = True,
+         template_index : Union[Path, None] = None, compact : bool = True,
+         shard_workers : Union[int, None] = None, result_store : Union[Path, None] = None,
+         prune_by_file_name : bool = False):
     """
     運用ログを解析し、レポートおよびグラフを自動的に生成するツール
 
     処理フロー:
         1. 指定ディレクトリからログファイルを読み込む
         2. データのクレンジングと解析を実施
-        3. サーバー別・日別に集計を行う
+        3. サーバー別・日別に集計を行い、異常傾向を判定する
         4. Excel形式で集計結果を出力
         5. CPU＆メモリ使用率とエラー件数のグラフを生成・保存
         6. 処理中のエラーをにログに記録
@@ -26,6 +35,35 @@ def main(data_dir : Path, log_dir : Union[Path, None] = None, level = logging.IN
     :param data_dir:　データ保存先のディレクトリのパス
     :param log_dir:　このプログラムのログ保存先のディレクトリのパス、指定しない場合はデフォルトパスを使用
     :param level: このプログラムのログのレベル、指定しない場合はデフォルトでlogging.INFOを使用
+    :param workers: ログファイル並列読込のワーカー数、指定しない場合は逐次読込
+    :param stream: Trueの場合、生データを保持せずファイル・チャンク単位で集計するストリーミング処理を行う
+    :param chunksize: ストリーミング処理時のCSVの1チャンクあたりの行数、指定しない場合はファイル単位
+    :param cache_dir: ファイル単位の部分集計キャッシュの保存先、指定した場合は新規・変更ファイルのみを解析する
+    :param columnar_dir: 列指向形式（Parquet / Feather）の保存先、指定した場合はログを変換した上で保存先から読み込む
+    :param columnar_format: 列指向形式の種類（'parquet' または 'feather'）
+    :param since: 対象期間の開始（'YYYY-MM-DD' または 'YYYY-MM-DD HH:MM:SS'）、指定しない場合は制限なし
+    :param until: 対象期間の終了（日付のみの場合はその日の終わりまで）、指定しない場合は制限なし
+    :param servers: 対象サーバー名のリスト、指定しない場合は全サーバー
+    :param export_mode: Excel出力モード（'files': サーバーごとに1ファイル、'workbook': 1ファイルにサーバーごとのシート）
+    :param export_workers: export_mode='files'の場合の並列書込のプロセス数、指定しない場合は逐次書込
+    :param chart_workers: グラフの並列描画のプロセス数、指定しない場合は逐次描画
+    :param per_server_charts: Trueの場合、全体のグラフに加えてサーバーごとのグラフを生成する
+    :param output_dir: Excel・グラフ・実行レポートの出力先、指定しない場合はdata/output
+    :param report: Trueの場合、処理段階・ファイルごとの処理時間・メモリ使用量・行数を計測し、実行レポート（JSON）を出力先に保存する
+    :param profile_stage: プロファイルを取得する処理段階（'load'、'parse'、'analyze'、'export'、'visualize'など）、指定した場合は実行レポートも保存する
+    :param profiler: プロファイラー（'cprofile' または 'pyinstrument'）
+    :param follow_logs: Trueの場合、ディレクトリを監視し続け、新規ファイル・追記された行を随時集計する（Ctrl+Cで終了）
+    :param follow_interval: 追記監視の間隔（秒）
+    :param flush_interval: 追記監視・取込サーバーの実行中にExcel・グラフを出力し直す間隔（秒）
+    :param ingest_port: 指定した場合、このポートでログレコードを受信する取込サーバーを起動する（Ctrl+Cで終了）
+    :param ingest_protocol: 取込サーバーのプロトコル（'http' または 'tcp'）
+    :param rollup_dir: 分・時・日・週の集計値の保存先、指定した場合はクレンジング後のログから作成し直す（一括処理・列指向形式のみ）
+    :param detect_anomaly: Trueの場合、集計結果に異常判定の列を追加する（追記監視・取込サーバー以外）
+    :param template_index: メッセージのテンプレート索引（SQLite）のファイルパス、指定した場合はクレンジング後のログから作成し直す（一括処理・列指向形式のみ）
+    :param compact: Trueの場合、クレンジング後のログを省メモリ形式（カテゴリ型・uint8 / float32・秒単位の日時）で保持する（一括処理・列指向形式）
+    :param shard_workers: 指定した場合、サーバー名のハッシュ値でシャードに分け、このプロセス数で読込・クレンジング・集計を並列に行う（一括処理のみ）
+    :param result_store: 集計結果の保存先（SQLite）のファイルパス、指定した場合は集計結果を保存する（絞り込み時は対象のサーバー・日付のみ置き換え、追記監視・取込サーバーでは出力のたびに保存）
+    :param prune_by_file_name: Trueの場合、期間の絞り込み時にファイル名中の日付が1つだけのファイルをその日付で除外する（ファイル名の日付以外の日の行を含むファイルがない場合のみ指定する）
     :return: なし
     """
 
@@ -36,20 +74,75 @@ def main(data_dir : Path, log_dir : Union[Path, None] = None, level = logging.IN
     setup_logging(log_dir = log_dir, level = level)
     logger = logging.getLogger(__name__)
 
+    from loganalyzer.filters import LogFilter
+    log_filter = LogFilter(since=since, until=until, servers=servers, prune_by_file_name=prune_by_file_name)
+    if log_filter.is_active():
+        logger.info(f'Filter: {log_filter}')
+    else:
+        log_filter = None
+
+    if output_dir is None:
+        from loganalyzer.exporter import DEFAULT_OUTPUT_DIR
+        output_dir = DEFAULT_OUTPUT_DIR
+    output_dir = Path(output_dir)
+    if (rollup_dir is not None or template_index is not None) and (follow_logs or ingest_port is not None):
+        logger.warning('Rollups and the template index require the raw rows and are only built in batch or columnar mode, skipping')
+    instrumentation = None
+    if report or profile_stage is not None:
+        instrumentation = Instrumentation(output_dir, profile_stage=profile_stage, profiler=profiler)
+        activate(instrumentation)
+
     logger.info('Process started')
     try:
-        df_list, file_list = load_logs_from_dir(data_dir)
-        parsed_df = parse_all(df_list, file_list)
-        analyzed_df = analyze_df(parsed_df)
+        if follow_logs:
+            # 追記監視モードでは監視中に定期的にExcel・グラフを出力するため、以降の一括出力は行わない
+            from loganalyzer.follow import follow
+            with stage('follow') as record:
+                analyzed_df = follow(
+                    data_dir, interval=follow_interval, flush_interval=flush_interval, log_filter=log_filter,
+                    output_dir=output_dir, export_mode=export_mode, chart_workers=chart_workers,
+                    result_store=result_store
+                )
+                record.rows_out = None if analyzed_df is None else len(analyzed_df)
+        elif ingest_port is not None:
+            # 取込サーバーは受信中に定期的にExcel・グラフを出力するため、以降の一括出力は行わない
+            from loganalyzer.ingest import run_server
+            with stage('ingest') as record:
+                analyzed_df = run_server(
+                    port=ingest_port, protocol=ingest_protocol, flush_interval=flush_interval,
+                    log_filter=log_filter, output_dir=output_dir, export_mode=export_mode,
+                    result_store=result_store
+                )
+                record.rows_out = None if analyzed_df is None else len(analyzed_df)
+        else:
+            # 処理方式（キャッシュ・列指向形式・ストリーミング・シャード分割・一括処理）の選択はコマンドラインと共通
+            from loganalyzer.pipeline import analyze_logs
+            analyzed_df = analyze_logs(
+                data_dir, log_filter, workers=workers, stream=stream, chunksize=chunksize, cache_dir=cache_dir,
+                columnar_dir=columnar_dir, columnar_format=columnar_format, shard_workers=shard_workers,
+                compact=compact, rollup_dir=rollup_dir, template_index=template_index,
+                detect_anomaly=detect_anomaly, result_store=result_store
+            )
 
-        export_result(analyzed_df)
-        visualize_result(analyzed_df)
+            from loganalyzer.exporter import export_result
+            from loganalyzer.visualizer import visualize_result
+            with stage('export') as record:
+                record.rows_in = len(analyzed_df)
+                record.files = len(export_result(analyzed_df, output_dir, mode=export_mode, workers=export_workers))
+            with stage('visualize') as record:
+                record.rows_in = len(analyzed_df)
+                record.files = len(visualize_result(analyzed_df, output_dir, workers=chart_workers,
+                                                    per_server=per_server_charts))
 
     except FileNotFoundError:
         raise
     except Exception as e:
         logger.exception(f'Process failed: {e}')
         raise
+    finally:
+        if instrumentation is not None:
+            activate(None)
+            instrumentation.write_report()
 
     logger.info('Process complete')
 